@@ -1,198 +1,309 @@
+import time
+_IMPORT_START = time.perf_counter()
 import dash
-from dash import html, dcc, Input, Output, State, callback, ALL, MATCH, callback_context, no_update, clientside_callback, dash_table
+from dash import html, dcc, Input, Output, State, callback, ALL, MATCH, Patch, callback_context, no_update, clientside_callback
 import dash_bootstrap_components as dbc
 import json
+import io
 from genie_room import genie_query
-import pandas as pd
 import os
 from dotenv import load_dotenv
-import sqlparse
-from flask import request
+from flask import Flask, request, g, Response
 import logging
-from genie_room import GenieClient
+from genie_room import GenieClient, is_throttled, workspace_url, refresh_query_result
+from metrics import span, start_trace, finish_trace, clear_trace, render_prometheus, STAGE_LATENCY, STAGE_PAYLOAD, THROTTLED
 import os
 import uuid
-
-from databricks.sdk import WorkspaceClient
-from databricks.sdk.service.serving import ChatMessage, ChatMessageRole
-from databricks.sdk.config import Config
+import functools
+import threading
+import import_report
+from sql_format import format_sql_query
+import result_cache
+import cache_backend
+import history_store
+import cancellation
+from cancellation import QueryCancelledError
+from deadline import Deadline, DeadlineExceededError, REQUEST_DEADLINE_SECONDS
+import fanout
+import scheduler
+import log_config
+import compression
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging: records are queued and written by a background thread
+log_config.configure_logging()
 logger = logging.getLogger(__name__)
 
+# Pinned results are re-executed on this schedule
+REFRESH_INTERVAL_SECONDS = float(os.environ.get("GENIE_REFRESH_INTERVAL_SECONDS", "300"))
+
+# WSGI entry point used by gunicorn (see gunicorn.conf.py); compression is set up
+# before Dash registers its routes so every response goes through it
+server = Flask(__name__)
+compression.install(server)
+
 # Create Dash app
 app = dash.Dash(
     __name__,
+    server=server,
     external_stylesheets=[dbc.themes.BOOTSTRAP]
 )
 
+DASH_CALLBACK_PATH = "/_dash-update-component"
+# The page and the layout requests Dash makes when it loads
+DASH_LAYOUT_PATHS = ("/", "/_dash-layout", "/_dash-dependencies")
+
+_serializer_lock = threading.Lock()
+_serializer_ready = False
+
+@app.server.before_request
+def warm_json_serializer():
+    # plotly's orjson engine looks up numpy types whenever it meets a component and
+    # crashes if concurrent requests do that before numpy is imported, so import it
+    # once, before the first response is serialized
+    global _serializer_ready
+    if _serializer_ready:
+        return
+    with _serializer_lock:
+        if not _serializer_ready:
+            import numpy
+            from plotly.io.json import to_json_plotly
+            to_json_plotly(html.Div())
+            _serializer_ready = True
+
+@app.server.before_request
+def start_request_trace():
+    log_config.bind(request_id=request.headers.get("X-Request-Id") or uuid.uuid4().hex[:16])
+    if request.path == DASH_CALLBACK_PATH:
+        g.genie_trace = start_trace(request.path)
+        log_config.bind(trace_id=g.genie_trace.trace_id)
+        # Sizes are broken down by callback function
+        body = request.get_json(silent=True) or {}
+        callback_func = app.callback_map.get(body.get("output"), {}).get("callback")
+        compression.measure(getattr(callback_func, "__name__", DASH_CALLBACK_PATH))
+    elif request.path in DASH_LAYOUT_PATHS:
+        compression.measure(request.path)
+
+@app.server.after_request
+def record_dash_response(response):
+    trace = g.pop("genie_trace", None)
+    if trace is None:
+        return response
+    elapsed = time.perf_counter() - trace.start
+    STAGE_LATENCY.observe(elapsed, stage="dash_request")
+    # Whatever is not spent inside the traced callback body is Dash dispatch and JSON serialization
+    callback_seconds = trace.top_level_seconds()
+    if callback_seconds:
+        STAGE_LATENCY.observe(max(elapsed - callback_seconds, 0.0), stage="dash_serialize")
+    size = response.calculate_content_length()
+    if size is not None:
+        STAGE_PAYLOAD.observe(size, stage="dash_response")
+    body = request.get_json(silent=True) or {}
+    finish_trace(trace, output=body.get("output"), status=response.status_code, response_bytes=size)
+    return response
+
+@app.server.teardown_request
+def clear_request_trace(_):
+    clear_trace()
+    # Request threads are reused; ids must not leak into the next request
+    log_config.clear()
+
+@app.server.route("/api/cancel", methods=["POST"])
+def cancel_endpoint():
+    """Cancel the question running in a tab; the page calls this with sendBeacon when it is closed."""
+    # sendBeacon posts the JSON body as text/plain
+    body = request.get_json(force=True, silent=True) or {}
+    cancellation.cancel(body.get("tab_id"), current_user_id(), body.get("reason", "tab_closed"))
+    return Response(status=204)
+
+@app.server.route("/metrics")
+def metrics_endpoint():
+    """Expose stage latencies, payload sizes and counters in Prometheus format."""
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+def traced_callback(func):
+    """Time a Dash callback body as a top-level span of the request trace."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(f"callback.{func.__name__}"):
+            return func(*args, **kwargs)
+    return wrapper
+
+def current_user_id():
+    """Identify the signed-in user from the headers Databricks Apps forwards."""
+    return request.headers.get("X-Forwarded-Email") or request.headers.get("X-Forwarded-User") or "anonymous"
+
+def chat_list_item(session_id, title, active=False):
+    return html.Div(
+        title,
+        className="chat-item active" if active else "chat-item",
+        id={"type": "chat-item", "index": session_id}
+    )
+
 # Add default welcome text that can be customized
 DEFAULT_WELCOME_TITLE = "Welcome to Your Data Assistant"
 DEFAULT_WELCOME_DESCRIPTION = "Explore and analyze your data with AI-powered insights. Ask questions, discover trends, and make data-driven decisions."
 
-# Define the layout
-app.layout = html.Div([
-    html.Div([
-        dcc.Store(id="selected-space-id", data=None, storage_type="local"),
-        dcc.Store(id="spaces-list", data=[]),
-        # Space selection overlay
+# The layout is built on the first page load rather than at import time
+@functools.lru_cache(maxsize=None)
+def serve_layout():
+    """Build the app layout once and reuse it for every page load"""
+    return html.Div([
         html.Div([
+            dcc.Store(id="selected-space-id", data=None, storage_type="local"),
+            dcc.Store(id="spaces-list", data=[]),
+            # Why listing the spaces failed, or None
+            dcc.Store(id="spaces-error", data=None),
+            # Space selection overlay
             html.Div([
                 html.Div([
-                    html.Span(className="space-select-spinner"),
-                    "Loading Genie Spaces..."
-                ], id="space-select-title", className="space-select-title"),
-                dcc.Dropdown(id="space-dropdown", options=[], placeholder="Choose a Genie Space", className="space-select-dropdown", optionHeight=60, searchable=True),
-                html.Button("Select", id="select-space-button", className="space-select-button"),
-                html.Div(id="space-select-error", className="space-select-error")
-            ], className="space-select-card")
-        ], id="space-select-container", className="space-select-container"),
-        # Top navigation bar
-        html.Div([
-            # Left component containing both nav-left and sidebar
+                    html.Div([
+                        html.Span(className="space-select-spinner"),
+                        "Loading Genie Spaces..."
+                    ], id="space-select-title", className="space-select-title"),
+                    dcc.Dropdown(id="space-dropdown", options=[], placeholder="Choose a Genie Space", className="space-select-dropdown", optionHeight=60, searchable=True),
+                    html.Button("Select", id="select-space-button", className="space-select-button"),
+                    html.Div(id="space-select-error", className="space-select-error"),
+                    html.Button("Retry", id="spaces-retry-button", className="space-select-button",
+                                style={"display": "none"})
+                ], className="space-select-card")
+            ], id="space-select-container", className="space-select-container"),
+            # Top navigation bar
             html.Div([
-                # Nav left
+                # Left component containing both nav-left and sidebar
                 html.Div([
-                    html.Button([
-                        html.Img(src="assets/menu_icon.svg", className="menu-icon")
-                    ], id="sidebar-toggle", className="nav-button"),
-                    html.Button([
-                        html.Img(src="assets/plus_icon.svg", className="new-chat-icon")
-                    ], id="new-chat-button", className="nav-button",disabled=False),
-                    html.Button([
-                        html.Img(src="assets/plus_icon.svg", className="new-chat-icon"),
-                        html.Div("New chat", className="new-chat-text")
-                    ], id="sidebar-new-chat-button", className="new-chat-button",disabled=False)
-                ], id="nav-left", className="nav-left"),
+                    # Nav left
+                    html.Div([
+                        html.Button([
+                            html.Img(src="assets/menu_icon.svg", className="menu-icon")
+                        ], id="sidebar-toggle", className="nav-button"),
+                        html.Button([
+                            html.Img(src="assets/plus_icon.svg", className="new-chat-icon")
+                        ], id="new-chat-button", className="nav-button",disabled=False),
+                        html.Button([
+                            html.Img(src="assets/plus_icon.svg", className="new-chat-icon"),
+                            html.Div("New chat", className="new-chat-text")
+                        ], id="sidebar-new-chat-button", className="new-chat-button",disabled=False)
+                    ], id="nav-left", className="nav-left"),
                 
-                # Sidebar
-                html.Div([
+                    # Sidebar
                     html.Div([
-                        html.Div("Your conversations with Genie", className="sidebar-header-text"),
-                    ], className="sidebar-header"),
-                    html.Div([], className="chat-list", id="chat-list")
-                ], id="sidebar", className="sidebar")
-            ], id="left-component", className="left-component"),
+                        html.Div([
+                            html.Div("Your conversations with Genie", className="sidebar-header-text"),
+                        ], className="sidebar-header"),
+                        html.Div([], className="chat-list", id="chat-list"),
+                        html.Button("Load more", id="chat-list-more", className="chat-list-more",
+                                    style={"display": "none"})
+                    ], id="sidebar", className="sidebar")
+                ], id="left-component", className="left-component"),
             
-            html.Div([
-                html.Div("Genie Space", id="logo-container", className="logo-container")
-            ], className="nav-center"),
-            html.Div([
-                html.Div("Y", className="user-avatar"),
-                html.A(
-                    html.Button(
-                        "Logout",
-                        id="logout-button",
-                        className="logout-button"
-                    ),
-                    href=f"https://{os.getenv('DATABRICKS_HOST')}/login.html",
-                    className="logout-link"
-                )
-            ], className="nav-right")
-        ], className="top-nav"),
+                html.Div([
+                    html.Div("Genie Space", id="logo-container", className="logo-container")
+                ], className="nav-center"),
+                html.Div([
+                    html.Div("Y", className="user-avatar"),
+                    html.A(
+                        html.Button(
+                            "Logout",
+                            id="logout-button",
+                            className="logout-button"
+                        ),
+                        href=f"https://{os.getenv('DATABRICKS_HOST')}/login.html",
+                        className="logout-link"
+                    )
+                ], className="nav-right")
+            ], className="top-nav"),
         
-        # Main content area
-        html.Div([
+            # Main content area
             html.Div([
-                # Chat content
                 html.Div([
-                    # Welcome container
+                    # Chat content
                     html.Div([
-                        html.Div([html.Div([
-                        html.Div(className="genie-logo")
-                    ], className="genie-logo-container")],
-                    className="genie-logo-container-header"),
-                   
-                        # Add settings button with tooltip
+                        # Welcome container
                         html.Div([
-                            html.Div(id="welcome-title", className="welcome-message", children=DEFAULT_WELCOME_TITLE),
-                        ], className="welcome-title-container"),
+                            html.Div([html.Div([
+                            html.Div(className="genie-logo")
+                        ], className="genie-logo-container")],
+                        className="genie-logo-container-header"),
+                   
+                            # Add settings button with tooltip
+                            html.Div([
+                                html.Div(id="welcome-title", className="welcome-message", children=DEFAULT_WELCOME_TITLE),
+                            ], className="welcome-title-container"),
                         
-                        html.Div(id="welcome-description", 
-                                className="welcome-message-description",
-                                children=DEFAULT_WELCOME_DESCRIPTION),
+                            html.Div(id="welcome-description", 
+                                    className="welcome-message-description",
+                                    children=DEFAULT_WELCOME_DESCRIPTION),
                         
-                        # Suggestion buttons with IDs
-                        html.Div([
-                            html.Button([
-                                html.Div(className="suggestion-icon"),
-                                html.Div("What tables are there and how are they connected? Give me a short summary.", 
-                                       className="suggestion-text", id="suggestion-1-text")
-                            ], id="suggestion-1", className="suggestion-button"),
-                            html.Button([
-                                html.Div(className="suggestion-icon"),
-                                html.Div("Describe the relationships between the tables.",
-                                       className="suggestion-text", id="suggestion-2-text")
-                            ], id="suggestion-2", className="suggestion-button"),
-                            html.Button([
-                                html.Div(className="suggestion-icon"),
-                                html.Div("Explain the dataset.",
-                                       className="suggestion-text", id="suggestion-3-text")
-                            ], id="suggestion-3", className="suggestion-button"),
-                            html.Button([
-                                html.Div(className="suggestion-icon"),
-                                html.Div("What columns or fields are available in this dataset?",
-                                       className="suggestion-text", id="suggestion-4-text")
-                            ], id="suggestion-4", className="suggestion-button")
-                        ], className="suggestion-buttons")
-                    ], id="welcome-container", className="welcome-container visible"),
+                            # Suggestion buttons with IDs
+                            html.Div([
+                                html.Button([
+                                    html.Div(className="suggestion-icon"),
+                                    html.Div("What tables are there and how are they connected? Give me a short summary.", 
+                                           className="suggestion-text", id="suggestion-1-text")
+                                ], id="suggestion-1", className="suggestion-button"),
+                                html.Button([
+                                    html.Div(className="suggestion-icon"),
+                                    html.Div("Describe the relationships between the tables.",
+                                           className="suggestion-text", id="suggestion-2-text")
+                                ], id="suggestion-2", className="suggestion-button"),
+                                html.Button([
+                                    html.Div(className="suggestion-icon"),
+                                    html.Div("Explain the dataset.",
+                                           className="suggestion-text", id="suggestion-3-text")
+                                ], id="suggestion-3", className="suggestion-button"),
+                                html.Button([
+                                    html.Div(className="suggestion-icon"),
+                                    html.Div("What columns or fields are available in this dataset?",
+                                           className="suggestion-text", id="suggestion-4-text")
+                                ], id="suggestion-4", className="suggestion-button")
+                            ], className="suggestion-buttons")
+                        ], id="welcome-container", className="welcome-container visible"),
                     
-                    # Chat messages
-                    html.Div([], id="chat-messages", className="chat-messages"),
-                ], id="chat-content", className="chat-content"),
+                        # Chat messages
+                        html.Div([], id="chat-messages", className="chat-messages"),
+                    ], id="chat-content", className="chat-content"),
                 
-                # Input area
-                html.Div([
+                    # Input area
                     html.Div([
-                        dcc.Input(
-                            id="chat-input-fixed",
-                            placeholder="Ask your question...",
-                            className="chat-input",
-                            type="text",
-                            disabled=False
-                        ),
                         html.Div([
-                            html.Button(
-                                id="send-button-fixed", 
-                                className="input-button send-button",
+                            dcc.Input(
+                                id="chat-input-fixed",
+                                placeholder="Ask your question...",
+                                className="chat-input",
+                                type="text",
                                 disabled=False
-                            )
-                        ], className="input-buttons-right"),
-                        html.Div("You can only submit one query at a time", 
-                                id="query-tooltip", 
-                                className="query-tooltip")
-                    ], id="fixed-input-container", className="fixed-input-container"),
-                    html.Div("Always review the accuracy of responses.", className="disclaimer-fixed")
-                ], id="fixed-input-wrapper", className="fixed-input-wrapper"),
-            ], id="chat-container", className="chat-container"),
-        ], id="main-content", className="main-content", style={"display": "none"}),
+                            ),
+                            html.Div([
+                                html.Button(
+                                    id="send-button-fixed", 
+                                    className="input-button send-button",
+                                    disabled=False
+                                )
+                            ], className="input-buttons-right"),
+                            html.Div("You can only submit one query at a time", 
+                                    id="query-tooltip", 
+                                    className="query-tooltip")
+                        ], id="fixed-input-container", className="fixed-input-container"),
+                        # Extra spaces to ask the same question in, answered side by side
+                        dcc.Dropdown(id="compare-spaces", options=[], value=[], multi=True,
+                                     placeholder="Compare with other spaces...", className="compare-spaces-dropdown"),
+                        html.Div("Always review the accuracy of responses.", className="disclaimer-fixed")
+                    ], id="fixed-input-wrapper", className="fixed-input-wrapper"),
+                ], id="chat-container", className="chat-container"),
+            ], id="main-content", className="main-content", style={"display": "none"}),
         
-        html.Div(id='dummy-output'),
-        dcc.Store(id="chat-trigger", data={"trigger": False, "message": ""}),
-        dcc.Store(id="chat-history-store", data=[]),
-        dcc.Store(id="query-running-store", data=False),
-        dcc.Store(id="session-store", data={"current_session": None}),
-        html.Div(id='dummy-insight-scroll')
-    ], id="app-inner-layout"),
-], id="root-container")
-
-# Store chat history
-chat_history = []
-
-def format_sql_query(sql_query):
-    """Format SQL query using sqlparse library"""
-    formatted_sql = sqlparse.format(
-        sql_query,
-        keyword_case='upper',  # Makes keywords uppercase
-        identifier_case=None,  # Preserves identifier case
-        reindent=True,         # Adds proper indentation
-        indent_width=2,        # Indentation width
-        strip_comments=False,  # Preserves comments
-        comma_first=False      # Commas at the end of line, not beginning
-    )
-    return formatted_sql
+            html.Div(id='dummy-output'),
+            dcc.Store(id="chat-trigger", data={"trigger": False, "message": ""}),
+            dcc.Store(id="chat-list-cursor", data=None),
+            dcc.Store(id="query-running-store", data=False),
+            dcc.Store(id="session-store", data={"current_session": None}),
+            dcc.Store(id="tab-id", data=None),
+            html.Div(id='dummy-insight-scroll')
+        ], id="app-inner-layout"),
+    ], id="root-container")
+
+app.layout = serve_layout
 
 def call_llm_for_insights(df, prompt=None):
     """
@@ -210,14 +321,20 @@ def call_llm_for_insights(df, prompt=None):
             " anomalies 3. Business implications."
             "Be thorough, professional, and concise.\n\n"
         )
-    csv_data = df.to_csv(index=False)
+    from databricks.sdk import WorkspaceClient
+    from databricks.sdk.service.serving import ChatMessage, ChatMessageRole
+    from databricks.sdk.config import Config
+
+    with span("to_csv") as s:
+        csv_data = df.to_csv(index=False)
+        s.set_size(len(csv_data))
     full_prompt = f"{prompt}Table data:\n{csv_data}"
     # Call OpenAI (replace with your own LLM provider as needed)
     try:
         headers = request.headers
         user_token = headers.get('X-Forwarded-Access-Token')
         config = Config(
-            host=f"https://{os.environ.get('DATABRICKS_HOST')}",
+            host=workspace_url(os.environ.get('DATABRICKS_HOST')),
             token=user_token,
             auth_type="pat",  # Explicitly set authentication type to PAT
             retry_timeout_seconds=300,  # 5 minutes total retry timeout
@@ -226,12 +343,15 @@ def call_llm_for_insights(df, prompt=None):
             retry_backoff_factor=2      # Exponential backoff factor
         )
         client = WorkspaceClient(config=config)
-        response = client.serving_endpoints.query(
-            os.getenv("SERVING_ENDPOINT_NAME"),
-            messages=[ChatMessage(content=full_prompt, role=ChatMessageRole.USER)],
-        )
+        with span("serving_query"):
+            response = client.serving_endpoints.query(
+                os.getenv("SERVING_ENDPOINT_NAME"),
+                messages=[ChatMessage(content=full_prompt, role=ChatMessageRole.USER)],
+            )
         return response.choices[0].message.content
     except Exception as e:
+        if is_throttled(e):
+            THROTTLED.inc(source="serving")
         return f"Error generating insights: {str(e)}"
     
 
@@ -243,7 +363,6 @@ def call_llm_for_insights(df, prompt=None):
      Output("chat-trigger", "data", allow_duplicate=True),
      Output("query-running-store", "data", allow_duplicate=True),
      Output("chat-list", "children", allow_duplicate=True),
-     Output("chat-history-store", "data", allow_duplicate=True),
      Output("session-store", "data", allow_duplicate=True)],
     [Input("suggestion-1", "n_clicks"),
      Input("suggestion-2", "n_clicks"),
@@ -259,16 +378,16 @@ def call_llm_for_insights(df, prompt=None):
      State("chat-messages", "children"),
      State("welcome-container", "className"),
      State("chat-list", "children"),
-     State("chat-history-store", "data"),
-     State("session-store", "data")],
+     State("session-store", "data"),
+     State("selected-space-id", "data")],
     prevent_initial_call=True
 )
 def handle_all_inputs(s1_clicks, s2_clicks, s3_clicks, s4_clicks, send_clicks, submit_clicks,
                      s1_text, s2_text, s3_text, s4_text, input_value, current_messages,
-                     welcome_class, current_chat_list, chat_history, session_data):
+                     welcome_class, current_chat_list, session_data, selected_space_id):
     ctx = callback_context
     if not ctx.triggered:
-        return [no_update] * 8
+        return [no_update] * 7
 
     trigger_id = ctx.triggered[0]["prop_id"].split(".")[0]
     
@@ -287,7 +406,7 @@ def handle_all_inputs(s1_clicks, s2_clicks, s3_clicks, s4_clicks, send_clicks, s
         user_input = input_value
     
     if not user_input:
-        return [no_update] * 8
+        return [no_update] * 7
     
     # Create user message with user info
     user_message = html.Div([
@@ -311,204 +430,368 @@ def handle_all_inputs(s1_clicks, s2_clicks, s3_clicks, s4_clicks, send_clicks, s
     
     updated_messages.append(thinking_indicator)
     
-    # Handle session management
-    if session_data["current_session"] is None:
-        session_data = {"current_session": len(chat_history) if chat_history else 0}
+    # Handle session management: the first question starts a new server-side session
+    user_id = current_user_id()
+    session_id = (session_data or {}).get("current_session")
+    if session_id is None:
+        session_id = history_store.create_session(user_id, selected_space_id, user_input)
+        session_data = {"current_session": session_id}
+    history_store.append_message(session_id, user_id, user_message)
     
-    current_session = session_data["current_session"]
-    
-    # Update chat history
-    if chat_history is None:
-        chat_history = []
-    
-    if current_session < len(chat_history):
-        chat_history[current_session]["messages"] = updated_messages
-        chat_history[current_session]["queries"].append(user_input)
-    else:
-        chat_history.insert(0, {
-            "session_id": current_session,
-            "queries": [user_input],
-            "messages": updated_messages
-        })
-    
-    # Update chat list
-    updated_chat_list = []
-    for i, session in enumerate(chat_history):
-        first_query = session["queries"][0]
-        is_active = (i == current_session)
-        updated_chat_list.append(
-            html.Div(
-                first_query,
-                className=f"chat-item{'active' if is_active else ''}",
-                id={"type": "chat-item", "index": i}
-            )
-        )
+    # Move the active session to the top of the chat list
+    title = user_input
+    other_items = []
+    for item in current_chat_list or []:
+        item_id = item["props"]["id"]["index"]
+        if item_id == session_id:
+            title = item["props"]["children"]
+        else:
+            other_items.append(chat_list_item(item_id, item["props"]["children"]))
+    updated_chat_list = [chat_list_item(session_id, title, active=True)] + other_items
     
     return (updated_messages, "", "welcome-container hidden",
             {"trigger": True, "message": user_input}, True,
-            updated_chat_list, chat_history, session_data)
+            updated_chat_list, session_data)
+
+def render_query_result(df, query_text, table_uuid, meta, description=None):
+    """
+    Render one query result: the data table, its SQL, the refresh controls and
+    the insights button. ``meta`` identifies the Genie attachment so the SQL can
+    be re-executed, and carries the original question latency.
+    """
+    from dash import dash_table
+
+    # Create the table with adjusted styles
+    data_table = dash_table.DataTable(
+        id={"type": "result-table", "index": table_uuid},
+        data=df.to_dict('records'),
+        columns=[{"name": i, "id": i} for i in df.columns],
+
+        # Export configuration
+        export_format="csv",
+        export_headers="display",
+
+        # Other table properties
+        page_size=10,
+        style_table={
+            'display': 'inline-block',
+            'overflowX': 'auto',
+            'width': '95%',
+            'marginRight': '20px'
+        },
+        style_cell={
+            'textAlign': 'left',
+            'fontSize': '12px',
+            'padding': '4px 10px',
+            'fontFamily': '-apple-system, BlinkMacSystemFont,Segoe UI, Roboto, Helvetica Neue, Arial, sans-serif',
+            'backgroundColor': 'transparent',
+            'maxWidth': 'fit-content',
+            'minWidth': '100px'
+        },
+        style_header={
+            'backgroundColor': '#f8f9fa',
+            'fontWeight': '600',
+            'borderBottom': '1px solid #eaecef'
+        },
+        style_data={
+            'whiteSpace': 'normal',
+            'height': 'auto'
+        },
+        fill_width=False,
+        page_current=0,
+        page_action='native'
+    )
+
+    # Raw SQL is rendered hidden; it is formatted when "Show code" is first opened
+    query_section = None
+    if query_text is not None:
+        query_index = table_uuid
+        query_section = html.Div([
+            html.Div([
+                html.Button([
+                    html.Span("Show code", id={"type": "toggle-text", "index": query_index})
+                ], 
+                id={"type": "toggle-query", "index": query_index}, 
+                className="toggle-query-button",
+                n_clicks=0)
+            ], className="toggle-query-container"),
+            html.Div([
+                html.Pre([
+                    html.Code(query_text, id={"type": "sql-code", "index": query_index}, className="sql-code")
+                ], className="sql-pre")
+            ], 
+            id={"type": "query-code", "index": query_index}, 
+            className="query-code-container hidden")
+        ], id={"type": "query-section", "index": query_index}, className="query-section")
+
+    button_style = {"border": "none", "background": "#f0f0f0", "padding": "8px 16px", "borderRadius": "4px", "cursor": "pointer"}
+    insight_button = html.Button(
+        "Generate Insights",
+        id={"type": "insight-button", "index": table_uuid},
+        className="insight-button",
+        style=button_style
+    )
+    # Refresh re-runs the stored SQL; pinned results also refresh on a schedule
+    refresh_controls = html.Div([
+        html.Button(
+            "Refresh",
+            id={"type": "refresh-button", "index": table_uuid},
+            className="refresh-button",
+            style={**button_style, "marginRight": "12px"}
+        ),
+        dcc.Checklist(
+            id={"type": "refresh-pin", "index": table_uuid},
+            options=[{"label": " Auto-refresh", "value": "pinned"}],
+            value=[],
+            inline=True,
+            className="refresh-pin",
+            style={"fontSize": "12px", "marginRight": "12px"}
+        ),
+        html.Span(
+            f"Answered in {meta['question_seconds']:.1f}s",
+            id={"type": "refresh-status", "index": table_uuid},
+            className="refresh-status",
+            style={"fontSize": "12px", "color": "#6a737d"}
+        ),
+        dcc.Interval(
+            id={"type": "refresh-interval", "index": table_uuid},
+            interval=int(REFRESH_INTERVAL_SECONDS * 1000),
+            disabled=True
+        ),
+        dcc.Store(id={"type": "result-meta", "index": table_uuid}, data=meta)
+    ], className="refresh-controls", style={"display": "flex", "alignItems": "center", "marginBottom": "12px"})
+    insight_output = dcc.Loading(
+        id={"type": "insight-loading", "index": table_uuid},
+        type="circle",
+        color="#000000",
+        children=html.Div(id={"type": "insight-output", "index": table_uuid})
+    )
+
+    # Create content with table and optional SQL section
+    return html.Div([
+        html.Div(description, className="message-text") if description else None,
+        html.Div([data_table], style={
+            'marginBottom': '20px',
+            'paddingRight': '5px'
+        }),
+        query_section if query_section else None,
+        refresh_controls,
+        insight_button,
+        insight_output,
+    ])
+
+def bot_message(content):
+    """Wrap rendered content in a Genie chat message."""
+    return html.Div([
+        html.Div([
+            html.Div(className="model-avatar"),
+            html.Span("Genie", className="model-name")
+        ], className="model-info"),
+        html.Div([
+            content,
+        ], className="message-content")
+    ], className="bot-message message")
+
+def render_parts(parts, space_id, session_id, question_seconds):
+    """
+    Render the parts of one Genie answer. Query results are kept in the result
+    cache and the session's history so refresh and insights can find them.
+    """
+    import pandas as pd
+
+    query_parts = [part for part in parts if part["type"] == "query"]
+    blocks = []
+    for part in parts:
+        if part["type"] == "text":
+            blocks.append(dcc.Markdown(part["content"], className="message-text"))
+            continue
+        df = pd.DataFrame(part["data"])
+        
+        # Keep the DataFrame server-side for later retrieval by refresh and the insight button
+        with span("to_json") as s:
+            df_json = df.to_json(orient='split')
+            s.set_size(len(df_json))
+        table_uuid = str(uuid.uuid4())
+        result_cache.put(table_uuid, df, current_user_id(), session_id)
+        if session_id:
+            history_store.save_result(table_uuid, session_id, df_json)
+        
+        # Descriptions tell the tables apart when Genie answered with several queries
+        description = part.get("description") if len(query_parts) > 1 else None
+        meta = {
+            "space_id": space_id,
+            "conversation_id": part["conversation_id"],
+            "message_id": part["message_id"],
+            "attachment_id": part["attachment_id"],
+            "question_seconds": question_seconds,
+        }
+        blocks.append(render_query_result(df, part["query"], table_uuid, meta, description))
+    return blocks[0] if len(blocks) == 1 else html.Div(blocks)
+
+# Polls of a multi-space answer; the last one gives up on spaces that never answered
+FANOUT_MAX_POLLS = int(REQUEST_DEADLINE_SECONDS) + 60
+
+def fanout_placeholder(job_id, space_ids, titles, session_id):
+    """Container that multi-space answers are appended to as each space finishes."""
+    return html.Div([
+        html.Div(f"Asking {len(space_ids)} spaces...", id={"type": "fanout-status", "index": job_id},
+                 className="fanout-status"),
+        html.Div([], id={"type": "fanout-results", "index": job_id}, className="fanout-results"),
+        dcc.Store(id={"type": "fanout-meta", "index": job_id},
+                  data={"titles": titles, "session_id": session_id, "started": time.time()}),
+        # Stops on its own if the job is lost, e.g. its worker restarted
+        dcc.Interval(id={"type": "fanout-interval", "index": job_id}, interval=1000,
+                     max_intervals=FANOUT_MAX_POLLS),
+    ], className="fanout-response")
+
+def render_space_answer(entry, meta):
+    """Render one space's part of a multi-space answer."""
+    title = meta["titles"].get(entry["space_id"], entry["space_id"])
+    if entry["parts"] is not None:
+        content = render_parts(entry["parts"], entry["space_id"], meta.get("session_id"), entry["seconds"])
+    elif entry["error"] == "deadline":
+        content = html.Div("Genie did not answer in time in this space.", className="message-text")
+    elif entry["error"] == "cancelled":
+        content = html.Div("Cancelled.", className="message-text")
+    else:
+        content = html.Div(f"Sorry, an error occurred: {entry['error']}", className="message-text")
+    return html.Div([
+        html.Div([
+            html.Span(title, className="fanout-space-title"),
+            html.Span(f"{entry['seconds']:.1f}s", className="fanout-space-time"),
+        ], className="fanout-space-header"),
+        content,
+    ], className="fanout-space")
 
 # Second callback: Make API call and show response
 @app.callback(
     [Output("chat-messages", "children", allow_duplicate=True),
-     Output("chat-history-store", "data", allow_duplicate=True),
      Output("chat-trigger", "data", allow_duplicate=True),
      Output("query-running-store", "data", allow_duplicate=True)],
     [Input("chat-trigger", "data")],
     [State("chat-messages", "children"),
-     State("chat-history-store", "data"),
-     State("selected-space-id", "data")],
+     State("session-store", "data"),
+     State("selected-space-id", "data"),
+     State("tab-id", "data"),
+     State("compare-spaces", "value"),
+     State("spaces-list", "data")],
     prevent_initial_call=True
 )
-def get_model_response(trigger_data, current_messages, chat_history, selected_space_id):
+@traced_callback
+def get_model_response(trigger_data, current_messages, session_data, selected_space_id, tab_id,
+                       compare_space_ids, spaces):
     if not trigger_data or not trigger_data.get("trigger"):
-        return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        return dash.no_update, dash.no_update, dash.no_update
     
     user_input = trigger_data.get("message", "")
     if not user_input:
-        return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        return dash.no_update, dash.no_update, dash.no_update
     
+    session_id = (session_data or {}).get("current_session")
+    log_config.bind(session_id=session_id, space_id=selected_space_id)
+    # New chat, switching session, logout or closing the tab cancel the question through this token
+    tab_id = tab_id or str(uuid.uuid4())
+    cancel_token = cancellation.register(tab_id, current_user_id())
+    keep_token = False
+
     try:
         headers = request.headers
         # user_token = os.environ.get("DATABRICKS_TOKEN")
         user_token = headers.get('X-Forwarded-Access-Token')
-        response, query_text = genie_query(user_input, user_token, selected_space_id)
-        
-        if isinstance(response, str):
-            content = dcc.Markdown(response, className="message-text")
-        else:
-            # Data table response
-            df = pd.DataFrame(response)
-            
-            # Store the DataFrame in chat_history for later retrieval by insight button
-            if chat_history and len(chat_history) > 0:
-                table_uuid = str(uuid.uuid4())
-                chat_history[0].setdefault('dataframes', {})[table_uuid] = df.to_json(orient='split')
-            else:
-                chat_history = [{"dataframes": {table_uuid: df.to_json(orient='split')}}]
-            
-            # Create the table with adjusted styles
-            data_table = dash_table.DataTable(
-                id=f"table-{len(chat_history)}",
-                data=df.to_dict('records'),
-                columns=[{"name": i, "id": i} for i in df.columns],
-                
-                # Export configuration
-                export_format="csv",
-                export_headers="display",
-                
-                # Other table properties
-                page_size=10,
-                style_table={
-                    'display': 'inline-block',
-                    'overflowX': 'auto',
-                    'width': '95%',
-                    'marginRight': '20px'
-                },
-                style_cell={
-                    'textAlign': 'left',
-                    'fontSize': '12px',
-                    'padding': '4px 10px',
-                    'fontFamily': '-apple-system, BlinkMacSystemFont,Segoe UI, Roboto, Helvetica Neue, Arial, sans-serif',
-                    'backgroundColor': 'transparent',
-                    'maxWidth': 'fit-content',
-                    'minWidth': '100px'
-                },
-                style_header={
-                    'backgroundColor': '#f8f9fa',
-                    'fontWeight': '600',
-                    'borderBottom': '1px solid #eaecef'
-                },
-                style_data={
-                    'whiteSpace': 'normal',
-                    'height': 'auto'
-                },
-                fill_width=False,
-                page_current=0,
-                page_action='native'
-            )
+        if compare_space_ids:
+            # Multi-space mode: answers stream in through stream_fanout_results;
+            # the tab's cancel token is released once the last space finishes, and the
+            # input stays disabled until then so a new question cannot supersede it
+            space_ids = [selected_space_id] + [sid for sid in compare_space_ids if sid != selected_space_id]
+            job_id = fanout.start(user_input, user_token, space_ids, current_user_id(), cancel_token,
+                                  on_done=lambda: cancellation.release(tab_id, cancel_token))
+            keep_token = True
+            titles = {space["space_id"]: space.get("title") or space["space_id"] for space in spaces or []}
+            bot_response = bot_message(fanout_placeholder(job_id, space_ids[:fanout.MAX_SPACES], titles, session_id))
+            return current_messages[:-1] + [bot_response], {"trigger": False, "message": ""}, dash.no_update
 
-            # Format SQL query if available
-            query_section = None
-            if query_text is not None:
-                formatted_sql = format_sql_query(query_text)
-                query_index = f"{len(chat_history)}-{len(current_messages)}"
-                
-                query_section = html.Div([
-                    html.Div([
-                        html.Button([
-                            html.Span("Show code", id={"type": "toggle-text", "index": query_index})
-                        ], 
-                        id={"type": "toggle-query", "index": query_index}, 
-                        className="toggle-query-button",
-                        n_clicks=0)
-                    ], className="toggle-query-container"),
-                    html.Div([
-                        html.Pre([
-                            html.Code(formatted_sql, className="sql-code")
-                        ], className="sql-pre")
-                    ], 
-                    id={"type": "query-code", "index": query_index}, 
-                    className="query-code-container hidden")
-                ], id={"type": "query-section", "index": query_index}, className="query-section")
-            
-            insight_button = html.Button(
-                "Generate Insights",
-                id={"type": "insight-button", "index": table_uuid},
-                className="insight-button",
-                style={"border": "none", "background": "#f0f0f0", "padding": "8px 16px", "borderRadius": "4px", "cursor": "pointer"}
-            )
-            insight_output = dcc.Loading(
-                id={"type": "insight-loading", "index": table_uuid},
-                type="circle",
-                color="#000000",
-                children=html.Div(id={"type": "insight-output", "index": table_uuid})
-            )
-
-            # Create content with table and optional SQL section
-            content = html.Div([
-                html.Div([data_table], style={
-                    'marginBottom': '20px',
-                    'paddingRight': '5px'
-                }),
-                query_section if query_section else None,
-                insight_button,
-                insight_output,
-            ])
+        question_start = time.perf_counter()
+        # Waiting for a slot counts against the question's deadline
+        deadline = Deadline()
+        with scheduler.slot(scheduler.INTERACTIVE, cancel_token, deadline):
+            parts = genie_query(user_input, user_token, selected_space_id, cancel_token, deadline)
+        question_seconds = time.perf_counter() - question_start
+        bot_response = bot_message(render_parts(parts, selected_space_id, session_id, question_seconds))
         
-        # Create bot response
-        bot_response = html.Div([
-            html.Div([
-                html.Div(className="model-avatar"),
-                html.Span("Genie", className="model-name")
-            ], className="model-info"),
-            html.Div([
-                content,
-            ], className="message-content")
-        ], className="bot-message message")
-        
-        # Update chat history with both user message and bot response
-        if chat_history and len(chat_history) > 0:
-            chat_history[0]["messages"] = current_messages[:-1] + [bot_response]  
-        return current_messages[:-1] + [bot_response], chat_history, {"trigger": False, "message": ""}, False
+        cancel_token.raise_if_cancelled()
+        # Update chat history with the bot response
+        if session_id:
+            history_store.append_message(session_id, current_user_id(), bot_response)
+        return current_messages[:-1] + [bot_response], {"trigger": False, "message": ""}, False
         
+    except QueryCancelledError:
+        # Whoever cancelled has already reset the tab; the answer is no longer wanted
+        return dash.no_update, dash.no_update, dash.no_update
     except Exception as e:
-        error_msg = f"Sorry, I encountered an error: {str(e)}. Please try again later."
-        error_response = html.Div([
-            html.Div([
-                html.Div(className="model-avatar"),
-                html.Span("Genie", className="model-name")
-            ], className="model-info"),
-            html.Div([
-                html.Div(error_msg, className="message-text")
-            ], className="message-content")
-        ], className="bot-message message")
+        if isinstance(e, DeadlineExceededError):
+            # Genie may still answer later; a narrower question usually finishes in time
+            error_msg = ("Sorry, Genie did not answer in time. Please try a narrower question, "
+                         "or try again in a few moments.")
+        else:
+            error_msg = f"Sorry, I encountered an error: {str(e)}. Please try again later."
+        error_response = bot_message(html.Div(error_msg, className="message-text"))
         
-        # Update chat history with both user message and error response
-        if chat_history and len(chat_history) > 0:
-            chat_history[0]["messages"] = current_messages[:-1] + [error_response]
+        # Update chat history with the error response
+        if session_id:
+            history_store.append_message(session_id, current_user_id(), error_response)
         
-        return current_messages[:-1] + [error_response], chat_history, {"trigger": False, "message": ""}, False
+        return current_messages[:-1] + [error_response], {"trigger": False, "message": ""}, False
+    finally:
+        if not keep_token:
+            cancellation.release(tab_id, cancel_token)
+
+# Append multi-space answers as each space finishes
+@app.callback(
+    [Output({"type": "fanout-results", "index": MATCH}, "children"),
+     Output({"type": "fanout-status", "index": MATCH}, "children"),
+     Output({"type": "fanout-interval", "index": MATCH}, "disabled")],
+    Input({"type": "fanout-interval", "index": MATCH}, "n_intervals"),
+    [State({"type": "fanout-interval", "index": MATCH}, "id"),
+     State({"type": "fanout-meta", "index": MATCH}, "data")],
+    prevent_initial_call=True
+)
+@traced_callback
+def stream_fanout_results(n_intervals, interval_id, meta):
+    user_id = current_user_id()
+    taken = fanout.take_finished(interval_id["index"], user_id)
+    if taken is None or (not taken["new"] and not taken["done"]):
+        if n_intervals >= FANOUT_MAX_POLLS:
+            # The job was lost, e.g. its worker restarted; stop so the input is enabled again
+            return no_update, "Some spaces did not answer.", True
+        # Nothing new, or the job runs in another worker process; the next tick may reach it
+        return no_update, no_update, no_update
+    # Append to the children in the browser instead of sending them all back
+    appended = Patch()
+    for entry in taken["new"]:
+        entry["block"] = render_space_answer(entry, meta)
+        appended.append(entry["block"])
+    if not taken["done"]:
+        return appended, f"{len(taken['finished'])} of {taken['total']} spaces answered...", False
+
+    status = f"{taken['total']} spaces answered in {time.time() - meta['started']:.1f}s"
+    session_id = meta.get("session_id")
+    if session_id:
+        history_store.append_message(session_id, user_id, bot_message(html.Div(
+            [html.Div(status, className="fanout-status"),
+             html.Div([entry["block"] for entry in taken["finished"]], className="fanout-results")],
+            className="fanout-response")))
+    return appended, status, True
+
+# Enable the input again once every multi-space answer in the chat has finished
+@app.callback(
+    Output("query-running-store", "data", allow_duplicate=True),
+    Input({"type": "fanout-interval", "index": ALL}, "disabled"),
+    prevent_initial_call=True
+)
+def finish_fanout(disabled):
+    if disabled and all(disabled):
+        return False
+    return no_update
 
 # Toggle sidebar and speech button
 @app.callback(
@@ -540,44 +823,99 @@ def toggle_sidebar(n_clicks, current_sidebar_class, current_left_component_class
     [Output("chat-messages", "children", allow_duplicate=True),
      Output("welcome-container", "className", allow_duplicate=True),
      Output("chat-list", "children", allow_duplicate=True),
-     Output("session-store", "data", allow_duplicate=True)],
+     Output("session-store", "data", allow_duplicate=True),
+     Output("query-running-store", "data", allow_duplicate=True)],
     [Input({"type": "chat-item", "index": ALL}, "n_clicks")],
-    [State("chat-history-store", "data"),
-     State("chat-list", "children"),
-     State("session-store", "data")],
+    [State("chat-list", "children"),
+     State("tab-id", "data")],
     prevent_initial_call=True
 )
-def show_chat_history(n_clicks, chat_history, current_chat_list, session_data):
+@traced_callback
+def show_chat_history(n_clicks, current_chat_list, tab_id):
     ctx = dash.callback_context
-    if not ctx.triggered:
-        return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+    # Items added to the list also fire this callback, without a click
+    if not ctx.triggered or not ctx.triggered[0]["value"]:
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
     
-    # Get the clicked item index
-    triggered_id = ctx.triggered[0]["prop_id"].split(".")[0]
-    clicked_index = json.loads(triggered_id)["index"]
-    
-    if not chat_history or clicked_index >= len(chat_history):
-        return dash.no_update, dash.no_update, dash.no_update, dash.no_update
-    
-    # Update session data to the clicked session
-    new_session_data = {"current_session": clicked_index}
+    # Get the clicked session and load only its messages
+    triggered_id = ctx.triggered[0]["prop_id"].rsplit(".", 1)[0]
+    session_id = json.loads(triggered_id)["index"]
+    user_id = current_user_id()
+    messages = history_store.get_messages(session_id, user_id)
+    if messages is None:
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+    # A question still running in the session being left is abandoned
+    was_running = cancellation.cancel(tab_id, user_id, "session_switch")
     
     # Update active state in chat list
-    updated_chat_list = []
-    for i, item in enumerate(current_chat_list):
-        new_class = "chat-item active" if i == clicked_index else "chat-item"
-        updated_chat_list.append(
-            html.Div(
-                item["props"]["children"],
-                className=new_class,
-                id={"type": "chat-item", "index": i}
-            )
-        )
+    updated_chat_list = [
+        chat_list_item(item["props"]["id"]["index"], item["props"]["children"],
+                       active=item["props"]["id"]["index"] == session_id)
+        for item in current_chat_list
+    ]
     
-    return (chat_history[clicked_index]["messages"], 
+    return (messages, 
             "welcome-container hidden", 
             updated_chat_list,
-            new_session_data)
+            {"current_session": session_id},
+            False if was_running else dash.no_update)
+
+# Load the user's sessions for the selected space, most recent first, one page at a time
+@app.callback(
+    [Output("chat-list", "children", allow_duplicate=True),
+     Output("chat-list-cursor", "data"),
+     Output("chat-list-more", "style"),
+     Output("session-store", "data", allow_duplicate=True)],
+    [Input("selected-space-id", "data"),
+     Input("chat-list-more", "n_clicks")],
+    [State("chat-list", "children"),
+     State("chat-list-cursor", "data"),
+     State("session-store", "data")],
+    prevent_initial_call="initial_duplicate"
+)
+@traced_callback
+def load_chat_list(selected_space_id, more_clicks, current_chat_list, cursor, session_data):
+    hidden = {"display": "none"}
+    if not selected_space_id:
+        return [], None, hidden, {"current_session": None}
+    load_more = callback_context.triggered_id == "chat-list-more"
+    if load_more and not cursor:
+        return dash.no_update, dash.no_update, hidden, dash.no_update
+    
+    sessions, next_cursor = history_store.list_sessions(
+        current_user_id(), selected_space_id, before=tuple(cursor) if load_more else None)
+    if load_more:
+        # Sessions used since the first page was loaded may already be listed
+        active = (session_data or {}).get("current_session")
+        items = list(current_chat_list or [])
+        shown = {item["props"]["id"]["index"] for item in items}
+        items += [chat_list_item(s["session_id"], s["title"], s["session_id"] == active)
+                  for s in sessions if s["session_id"] not in shown]
+        new_session_data = dash.no_update
+    else:
+        # A different space starts without an active session
+        items = [chat_list_item(s["session_id"], s["title"]) for s in sessions]
+        new_session_data = {"current_session": None}
+    return items, next_cursor, {"display": "block"} if next_cursor else hidden, new_session_data
+
+# Give each tab an id for cancelling its running question, and cancel it when the tab is closed
+app.clientside_callback(
+    """
+    function(tabId) {
+        if (tabId) {
+            return window.dash_clientside.no_update;
+        }
+        tabId = (window.crypto && crypto.randomUUID) ? crypto.randomUUID()
+            : Date.now().toString(36) + Math.random().toString(36).slice(2);
+        window.addEventListener('pagehide', function() {
+            navigator.sendBeacon('api/cancel', JSON.stringify({tab_id: tabId, reason: 'tab_closed'}));
+        });
+        return tabId;
+    }
+    """,
+    Output('tab-id', 'data'),
+    Input('tab-id', 'data')
+)
 
 # Modify the clientside callback to target the chat-container
 app.clientside_callback(
@@ -603,24 +941,28 @@ app.clientside_callback(
      Output("chat-messages", "children", allow_duplicate=True),
      Output("chat-trigger", "data", allow_duplicate=True),
      Output("query-running-store", "data", allow_duplicate=True),
-     Output("chat-history-store", "data", allow_duplicate=True),
      Output("session-store", "data", allow_duplicate=True)],
     [Input("new-chat-button", "n_clicks"),
      Input("sidebar-new-chat-button", "n_clicks")],
     [State("chat-messages", "children"),
      State("chat-trigger", "data"),
-     State("chat-history-store", "data"),
      State("chat-list", "children"),
      State("query-running-store", "data"),
-     State("session-store", "data")],
+     State("session-store", "data"),
+     State("tab-id", "data")],
     prevent_initial_call=True
 )
-def reset_to_welcome(n_clicks1, n_clicks2, chat_messages, chat_trigger, chat_history_store, 
-                    chat_list, query_running, session_data):
+def reset_to_welcome(n_clicks1, n_clicks2, chat_messages, chat_trigger, 
+                    chat_list, query_running, session_data, tab_id):
+    # Stop the question still running, if any
+    cancellation.cancel(tab_id, current_user_id(), "new_chat")
+    # The session being left no longer needs its results in memory
+    if session_data and session_data.get("current_session"):
+        result_cache.release_session(session_data["current_session"])
     # Reset session when starting a new chat
     new_session_data = {"current_session": None}
     return ("welcome-container visible", [], {"trigger": False, "message": ""}, 
-            False, chat_history_store, new_session_data)
+            False, new_session_data)
 
 @app.callback(
     [Output("welcome-container", "className", allow_duplicate=True)],
@@ -637,71 +979,172 @@ def reset_query_running(chat_messages):
 # Add callback to disable input while query is running
 @app.callback(
     [Output("chat-input-fixed", "disabled"),
-     Output("send-button-fixed", "disabled"),
-     Output("new-chat-button", "disabled"),
-     Output("sidebar-new-chat-button", "disabled")],
+     Output("send-button-fixed", "disabled")],
     [Input("query-running-store", "data")],
     prevent_initial_call=True
 )
 def toggle_input_disabled(query_running):
-    # Disable input and buttons when query is running
-    return query_running, query_running, query_running, query_running
+    # Disable input when query is running; "New chat" stays enabled so a running question can be abandoned
+    return query_running, query_running
 
 # Add callback for toggling SQL query visibility
 @app.callback(
     [Output({"type": "query-code", "index": MATCH}, "className"),
-     Output({"type": "toggle-text", "index": MATCH}, "children")],
+     Output({"type": "toggle-text", "index": MATCH}, "children"),
+     Output({"type": "sql-code", "index": MATCH}, "children")],
     [Input({"type": "toggle-query", "index": MATCH}, "n_clicks")],
+    [State({"type": "sql-code", "index": MATCH}, "children")],
     prevent_initial_call=True
 )
-def toggle_query_visibility(n_clicks):
+def toggle_query_visibility(n_clicks, sql_code):
     if n_clicks % 2 == 1:
-        return "query-code-container visible", "Hide code"
-    return "query-code-container hidden", "Show code"
+        # Format on every open, so a panel that fell back to raw SQL picks up the background format once cached
+        formatted_sql = format_sql_query(sql_code) if isinstance(sql_code, str) else no_update
+        return "query-code-container visible", "Hide code", formatted_sql
+    return "query-code-container hidden", "Show code", no_update
+
+def insights_key(user_id: str, table_id: str) -> str:
+    # Insights are cached in the configured backend, so any worker can serve them again
+    return f"insights:{user_id}:{table_id}"
 
 # Add callback for insight button
 @app.callback(
     Output({"type": "insight-output", "index": dash.dependencies.MATCH}, "children"),
     Input({"type": "insight-button", "index": dash.dependencies.MATCH}, "n_clicks"),
     State({"type": "insight-button", "index": dash.dependencies.MATCH}, "id"),
-    State("chat-history-store", "data"),
     prevent_initial_call=True
 )
-def generate_insights(n_clicks, btn_id, chat_history):
+@traced_callback
+def generate_insights(n_clicks, btn_id):
     if not n_clicks:
         return None
+    import pandas as pd
+
     table_id = btn_id["index"]
-    df = None
-    if chat_history and len(chat_history) > 0:
-        df_json = chat_history[0].get('dataframes', {}).get(table_id)
-        if df_json:
-            df = pd.read_json(df_json, orient='split')
-    if df is None:
-        return html.Div("No data available for insights.", style={"color": "red"})
-    insights = call_llm_for_insights(df)
+    user_id = current_user_id()
+    cache = cache_backend.get_cache()
+    cached = cache.get(insights_key(user_id, table_id))
+    if cached is not None:
+        insights = cached.decode("utf-8")
+    else:
+        # The result cache holds the latest refreshed rows; the history store keeps results it has dropped
+        df = result_cache.get(table_id, user_id)
+        if df is None:
+            df_json = history_store.get_result(table_id, user_id)
+            if df_json:
+                df = pd.read_json(io.StringIO(df_json), orient='split')
+        if df is None:
+            return html.Div("No data available for insights.", style={"color": "red"})
+        try:
+            with scheduler.slot(scheduler.INSIGHTS):
+                insights = call_llm_for_insights(df)
+        except scheduler.SchedulerBusyError:
+            return html.Div("The app is busy answering questions. Please try again in a moment.",
+                            style={"color": "red"})
+        if not insights.startswith("Error generating insights"):
+            cache.set(insights_key(user_id, table_id), insights.encode("utf-8"))
     return html.Div(
         dcc.Markdown(insights),
         style={"marginTop": "32px", "background": "#f4f4f4", "padding": "16px", "borderRadius": "4px"},
         className="insight-output"
     )
 
-# Callback to fetch spaces on load
+# Pinning a result turns its refresh schedule on
+@app.callback(
+    Output({"type": "refresh-interval", "index": MATCH}, "disabled"),
+    Input({"type": "refresh-pin", "index": MATCH}, "value"),
+    prevent_initial_call=True
+)
+def toggle_refresh_schedule(pinned):
+    return "pinned" not in (pinned or [])
+
+# Re-execute a result's stored SQL on demand or on schedule
 @app.callback(
-    Output("spaces-list", "data"),
-    Input("space-select-container", "id"),
+    [Output({"type": "result-table", "index": MATCH}, "data"),
+     Output({"type": "result-table", "index": MATCH}, "columns"),
+     Output({"type": "refresh-status", "index": MATCH}, "children")],
+    [Input({"type": "refresh-button", "index": MATCH}, "n_clicks"),
+     Input({"type": "refresh-interval", "index": MATCH}, "n_intervals")],
+    [State({"type": "result-meta", "index": MATCH}, "data"),
+     State({"type": "result-meta", "index": MATCH}, "id")],
+    prevent_initial_call=True
+)
+@traced_callback
+def refresh_result(n_clicks, n_intervals, meta, meta_id):
+    if not meta:
+        return no_update, no_update, no_update
+    log_config.bind(space_id=meta.get("space_id"))
+    answered = f"Answered in {meta['question_seconds']:.1f}s"
+    token = request.headers.get('X-Forwarded-Access-Token')
+    # Scheduled refreshes are background work and give way to questions; a click waits like insights
+    scheduled = (callback_context.triggered_id or {}).get("type") == "refresh-interval"
+    start = time.perf_counter()
+    deadline = Deadline()
+    try:
+        with scheduler.slot(scheduler.BACKGROUND if scheduled else scheduler.INSIGHTS,
+                            deadline=deadline) as cancel_token:
+            df = refresh_query_result(meta["conversation_id"], meta["message_id"], meta["attachment_id"],
+                                      token, meta["space_id"], cancel_token, deadline)
+    except (scheduler.SchedulerBusyError, QueryCancelledError):
+        # Deferred or preempted; a scheduled refresh tries again at its next interval
+        return no_update, no_update, f"{answered} · refresh postponed, the app is busy"
+    except DeadlineExceededError:
+        return no_update, no_update, f"{answered} · refresh timed out after {deadline.seconds:g}s"
+    except Exception as e:
+        logger.error("Error refreshing result %s: %s", meta_id['index'], e)
+        return no_update, no_update, f"{answered} · refresh failed: {str(e)}"
+    refresh_seconds = time.perf_counter() - start
+    status = f"{answered} · refreshed in {refresh_seconds:.1f}s at {time.strftime('%H:%M:%S')}"
+    if df is None:
+        return [], no_update, f"{status} (no rows)"
+
+    user_id = current_user_id()
+    result_cache.put(meta_id["index"], df, user_id)
+    # The history store backs insights once the result cache drops the rows; keep it current too
+    with span("to_json") as s:
+        df_json = df.to_json(orient='split')
+        s.set_size(len(df_json))
+    history_store.update_result(meta_id["index"], user_id, df_json)
+    # Insights describe the old rows
+    cache_backend.get_cache().delete(insights_key(user_id, meta_id["index"]))
+    return df.to_dict('records'), [{"name": i, "id": i} for i in df.columns], status
+
+# Callback to fetch spaces on load, and again when the user retries after an error
+@app.callback(
+    [Output("spaces-list", "data"),
+     Output("spaces-error", "data")],
+    [Input("space-select-container", "id"),
+     Input("spaces-retry-button", "n_clicks")],
     prevent_initial_call=False
 )
-def fetch_spaces(_):
+@traced_callback
+def fetch_spaces(_, retries):
     try:
         headers = request.headers
         # token = os.environ.get("DATABRICKS_TOKEN")
         token = headers.get('X-Forwarded-Access-Token')
         host = os.environ.get("DATABRICKS_HOST")
         client = GenieClient(host=host, space_id="", token=token)
-        spaces = client.list_spaces()
-        return spaces
+        with scheduler.slot(scheduler.LISTING):
+            spaces = client.list_spaces()
+        return spaces, None
+    except scheduler.SchedulerBusyError:
+        return [], "The app is busy answering questions. Please try again in a moment."
     except Exception as e:
-        return []
+        logger.error("Error listing Genie spaces: %s", e)
+        return [], f"Genie spaces could not be loaded: {str(e)}"
+
+# Show why the spaces could not be listed, with a button to try again
+@app.callback(
+    [Output("space-select-error", "children", allow_duplicate=True),
+     Output("spaces-retry-button", "style")],
+    Input("spaces-error", "data"),
+    prevent_initial_call=True
+)
+def show_spaces_error(error):
+    if not error:
+        return "", {"display": "none"}
+    return error, {"display": "block"}
 
 # Populate dropdown options
 @app.callback(
@@ -722,6 +1165,19 @@ def update_space_dropdown(spaces):
         options.append({"label": label, "value": space_id})
     return options
 
+# Spaces that can be compared with the selected one
+@app.callback(
+    [Output("compare-spaces", "options"),
+     Output("compare-spaces", "value")],
+    [Input("spaces-list", "data"),
+     Input("selected-space-id", "data")],
+    prevent_initial_call=False
+)
+def update_compare_spaces(spaces, selected_space_id):
+    options = [{"label": s.get("title") or s.get("space_id", ""), "value": s.get("space_id", "")}
+               for s in spaces or [] if s.get("space_id") != selected_space_id]
+    return options, []
+
 # Handle space selection
 @app.callback(
     [Output("selected-space-id", "data", allow_duplicate=True),
@@ -780,14 +1236,20 @@ app.clientside_callback(
 )
 
 @app.callback(
-    Output("selected-space-id", "data", allow_duplicate=True),
+    [Output("selected-space-id", "data", allow_duplicate=True),
+     Output("query-running-store", "data", allow_duplicate=True)],
     Input("logout-button", "n_clicks"),
+    State("tab-id", "data"),
     prevent_initial_call=True
 )
-def logout_and_clear_space(n_clicks):
+def logout_and_clear_space(n_clicks, tab_id):
     if n_clicks:
-        return None
-    return dash.no_update
+        user_id = current_user_id()
+        cancellation.cancel(tab_id, user_id, "logout")
+        result_cache.drop_user(user_id)
+        cache_backend.get_cache().delete_prefix(insights_key(user_id, ""))
+        return None, False
+    return dash.no_update, dash.no_update
 
 # Add a callback to control the root-container style to prevent scrolling when overlay is visible
 @app.callback(
@@ -804,10 +1266,13 @@ def set_root_style(selected_space_id):
 # Add a callback to update the title based on spaces-list
 @app.callback(
     Output("space-select-title", "children"),
-    Input("spaces-list", "data"),
+    [Input("spaces-list", "data"),
+     Input("spaces-error", "data")],
     prevent_initial_call=False
 )
-def update_space_select_title(spaces):
+def update_space_select_title(spaces, error):
+    if error:
+        return "Genie Spaces unavailable"
     if not spaces:
         return [html.Span(className="space-select-spinner"), "Loading Genie Spaces..."]
     return "Select a Genie Space"
@@ -824,5 +1289,29 @@ def update_query_tooltip_class(query_running):
     else:
         return "query-tooltip"
 
+def prewarm():
+    """Import the dependencies deferred above so the first question does not pay for them"""
+    try:
+        with scheduler.slot(scheduler.BACKGROUND):
+            _prewarm_imports()
+    except scheduler.SchedulerBusyError:
+        # The busy worker will import them on first use instead
+        logger.info("Skipped import prewarming: no background slot was free")
+
+def _prewarm_imports():
+    with span("prewarm_imports"):
+        with app.server.test_request_context():
+            warm_json_serializer()
+        import pandas
+        import sqlparse
+        import databricks.sdk
+        from dash import dash_table
+
+STAGE_LATENCY.observe(time.perf_counter() - _IMPORT_START, stage="app_import")
+logger.info("app module imported in %.0f ms", (time.perf_counter() - _IMPORT_START) * 1000)
+if import_report.ENABLED:
+    threading.Thread(target=import_report.log_report, args=("app",), name="import-report", daemon=True).start()
+
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    # Development server; production runs `gunicorn app:server -c gunicorn.conf.py`
+    app.run_server(debug=os.environ.get("DASH_DEBUG", "true").lower() == "true")
@@ -0,0 +1,186 @@
+"""
+Large-result mode: fetch a query result as Arrow instead of inline JSON.
+
+Genie's query-result endpoint only returns rows as a JSON ``data_array`` (a
+list of lists of strings), which is slow and memory hungry for big results.
+This module re-executes the attachment's SQL on the space's warehouse through
+the Statement Execution API with ``ARROW_STREAM`` + ``EXTERNAL_LINKS``,
+downloads the chunks in parallel and decodes them straight into a DataFrame.
+At most ``GENIE_ARROW_MAX_ROWS`` rows are fetched: the rows are sent to the
+browser and kept in the chat history, so an uncapped re-execution of a
+result Genie truncated could be arbitrarily large.
+
+pyarrow is optional; without it ``ARROW_AVAILABLE`` is False and callers stay
+on the JSON path.
+"""
+from __future__ import annotations
+import contextvars
+import importlib.util
+import json
+import logging
+import os
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, List, Optional
+
+from metrics import span, Counter
+from cancellation import CancellationToken, QueryCancelledError
+from deadline import Deadline
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow
+
+logger = logging.getLogger(__name__)
+
+# Checked without importing: pyarrow is only loaded once a large result is fetched
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+DOWNLOAD_WORKERS = int(os.environ.get("GENIE_ARROW_DOWNLOAD_WORKERS", "4"))
+DOWNLOAD_TIMEOUT_SECONDS = float(os.environ.get("GENIE_ARROW_DOWNLOAD_TIMEOUT_SECONDS", "60"))
+MAX_ROWS = int(os.environ.get("GENIE_ARROW_MAX_ROWS", "100000"))
+
+ARROW_FALLBACKS = Counter("genie_arrow_fallbacks", "Query results fetched as JSON although Arrow mode applied.", ["reason"])
+
+# How often waiting for chunk downloads checks the cancellation token
+_WAIT_CHECK_SECONDS = 0.25
+
+_session = None
+
+
+def _http_session():
+    # Presigned chunk URLs must not carry workspace credentials, so this is a plain session
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+
+def _download_chunk(link, cancel_token: CancellationToken, deadline: Deadline) -> pyarrow.Table:
+    import pyarrow.ipc
+
+    cancel_token.raise_if_cancelled()
+    deadline.check("download_arrow_chunk")
+    with span("download_arrow_chunk", chunk=link.chunk_index) as s:
+        response = _http_session().get(link.external_link, headers=link.http_headers or None,
+                                       timeout=deadline.timeout(DOWNLOAD_TIMEOUT_SECONDS))
+        response.raise_for_status()
+        s.set_size(len(response.content))
+    return pyarrow.ipc.open_stream(pyarrow.py_buffer(response.content)).read_all()
+
+
+def _raise_first_failure(futures) -> None:
+    for future in futures:
+        if future.done() and not future.cancelled() and future.exception() is not None:
+            future.result()
+
+
+def _is_nested(data_type) -> bool:
+    import pyarrow
+    return (pyarrow.types.is_list(data_type) or pyarrow.types.is_large_list(data_type)
+            or pyarrow.types.is_fixed_size_list(data_type) or pyarrow.types.is_struct(data_type)
+            or pyarrow.types.is_map(data_type))
+
+
+def _to_json_strings(column) -> pyarrow.Array:
+    """Render a nested column as JSON strings, the form the JSON result path shows arrays, structs and maps in."""
+    import pyarrow
+    values = []
+    for chunk in column.chunks:
+        values.extend(None if value is None else json.dumps(value, default=str, separators=(",", ":"))
+                      for value in chunk.to_pylist(maps_as_pydicts="lossy"))
+    return pyarrow.array(values, type=pyarrow.string())
+
+
+def _to_dataframe(tables: List[pyarrow.Table]) -> Optional[pd.DataFrame]:
+    import pyarrow
+
+    with span("decode_arrow") as s:
+        # row_limit caps the statement already; this also holds if a warehouse returns more
+        table = pyarrow.concat_tables(tables).slice(0, MAX_ROWS)
+        for i, column in enumerate(table.schema):
+            # Decimals would become Python objects; floats are what the table and insights need
+            if pyarrow.types.is_decimal(column.type):
+                table = table.set_column(i, column.name, table.column(i).cast(pyarrow.float64()))
+            # Lists, structs and maps would become arrays and dicts the table cannot display
+            elif _is_nested(column.type):
+                table = table.set_column(i, column.name, _to_json_strings(table.column(i)))
+        df = table.to_pandas()
+        s.set(rows=len(df), columns=len(df.columns))
+        s.set_size(table.nbytes)
+    return df if len(df) else None
+
+
+def fetch_arrow_result(workspace_client, warehouse_id: str, sql_text: str, poll_interval: float = 2,
+                       cancel_token: Optional[CancellationToken] = None,
+                       deadline: Optional[Deadline] = None) -> Optional[pd.DataFrame]:
+    """
+    Execute ``sql_text`` on ``warehouse_id`` and return the result as a DataFrame,
+    or None when it has no rows. Raises if the statement fails, and cancels the
+    statement and pending downloads when ``cancel_token`` is cancelled or
+    ``deadline`` passes.
+    """
+    from databricks.sdk.service.sql import Disposition, ExecuteStatementRequestOnWaitTimeout, Format, StatementState
+
+    cancel_token = cancel_token or CancellationToken()
+    deadline = deadline or Deadline()
+    statements = workspace_client.statement_execution
+    deadline.check("execute_statement")
+    with span("execute_statement", deadline_remaining_s=round(deadline.remaining(), 1)) as s:
+        response = statements.execute_statement(
+            statement=sql_text,
+            warehouse_id=warehouse_id,
+            format=Format.ARROW_STREAM,
+            disposition=Disposition.EXTERNAL_LINKS,
+            # The API accepts 5 to 50 seconds; waiting longer than the deadline allows is pointless
+            wait_timeout=f"{max(5, min(30, int(deadline.remaining())))}s",
+            on_wait_timeout=ExecuteStatementRequestOnWaitTimeout.CONTINUE,
+            row_limit=MAX_ROWS,
+        )
+        while response.status.state in (StatementState.PENDING, StatementState.RUNNING):
+            if deadline.expired:
+                statements.cancel_execution(response.statement_id)
+                deadline.check("execute_statement")
+            try:
+                cancel_token.sleep(deadline.timeout(poll_interval))
+            except QueryCancelledError:
+                statements.cancel_execution(response.statement_id)
+                raise
+            response = statements.get_statement(response.statement_id)
+        s.set(state=response.status.state.value)
+    if response.status.state != StatementState.SUCCEEDED:
+        error = response.status.error.message if response.status.error else response.status.state.value
+        raise RuntimeError(f"Statement {response.statement_id} failed: {error}")
+
+    if not response.manifest.total_chunk_count:
+        return None
+    if response.manifest.truncated:
+        logger.info("Statement %s returned only its first %d rows", response.statement_id, MAX_ROWS)
+
+    # Chunk links arrive one page at a time; start each download as soon as its link is known
+    pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="arrow-download")
+    futures = []
+    try:
+        result = response.result
+        while result is not None:
+            links = result.external_links or []
+            futures.extend(pool.submit(contextvars.copy_context().run, _download_chunk, link, cancel_token, deadline)
+                           for link in links)
+            cancel_token.raise_if_cancelled()
+            _raise_first_failure(futures)
+            next_index = links[-1].next_chunk_index if links else None
+            result = statements.get_statement_result_chunk_n(response.statement_id, next_index) \
+                if next_index is not None else None
+        # Stop at the first failed chunk or a cancel, not when the chunks before it are done
+        pending = futures
+        while pending:
+            _, pending = wait(pending, timeout=_WAIT_CHECK_SECONDS, return_when=FIRST_EXCEPTION)
+            cancel_token.raise_if_cancelled()
+            _raise_first_failure(futures)
+        tables = [future.result() for future in futures]
+    except BaseException:
+        # Queued downloads are dropped and running ones are not waited for
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return _to_dataframe(tables)
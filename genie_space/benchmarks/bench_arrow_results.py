@@ -0,0 +1,65 @@
+"""
+JSON ``data_array`` vs Arrow external-links result fetching against the fake server.
+
+Times fetching one query result and turning it into a DataFrame both ways and
+reports the peak Python heap (tracemalloc) and Arrow buffer memory of each.
+
+    python -m benchmarks.bench_arrow_results --rows 200000 --columns 8 --arrow-chunk-rows 50000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.fake_genie_server import add_config_arguments
+from benchmarks.harness import FAKE_TOKEN, add_common_arguments, start_fake_server, summarize
+
+SQL = "SELECT * FROM fake.schema.table_0"
+
+
+def run(name: str, fetch, iterations: int) -> None:
+    import pyarrow
+
+    latencies = []
+    peak_heap = 0
+    peak_arrow = 0
+    for _ in range(iterations):
+        tracemalloc.start()
+        start = time.perf_counter()
+        df = fetch()
+        latencies.append(time.perf_counter() - start)
+        peak_heap = max(peak_heap, tracemalloc.get_traced_memory()[1])
+        peak_arrow = max(peak_arrow, pyarrow.total_allocated_bytes())
+        tracemalloc.stop()
+        rows = len(df)
+        del df
+    summarize(name, latencies)
+    print(json.dumps({"name": name, "rows": rows, "peak_python_heap_mb": peak_heap / 2**20,
+                      "arrow_allocated_mb": peak_arrow / 2**20}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5)
+    add_config_arguments(parser)
+    add_common_arguments(parser)
+    parser.set_defaults(rows=100000, latency="const:0")
+    args = parser.parse_args()
+
+    server = start_fake_server(args)
+    try:
+        from genie_room import GenieClient, result_to_dataframe
+        client = GenieClient(host=server.host, space_id="space0", token=FAKE_TOKEN)
+        # Build the fake payloads once so both paths only pay for transfer and decoding
+        server.state.query_result()
+        server.state.arrow_chunks()
+        run("json_data_array", lambda: result_to_dataframe(client.get_query_result("conv", "msg", "att")),
+            args.iterations)
+        run("arrow_external_links", lambda: client.fetch_arrow_result(SQL), args.iterations)
+        print(f"fake server requests: {server.requests}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Cold-start benchmark: time from launching the server process to the first
+successful page load, compared against a target.
+
+    python -m benchmarks.bench_cold_start --server gunicorn --runs 5 --target-seconds 3
+
+Exits with status 1 when the median time-to-first-request exceeds the target,
+so it can gate a CI job.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_load import APP_DIR, launch, stop, wait_until_ready
+
+
+def time_import(module: str = "app") -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=APP_DIR, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", default="gunicorn", choices=["dev", "gunicorn"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8052)
+    parser.add_argument("--target-seconds", type=float,
+                        default=float(os.environ.get("GENIE_TTFR_TARGET_SECONDS", "3.0")))
+    args = parser.parse_args()
+
+    # The page load does not call Genie, so any host will do
+    os.environ.setdefault("DATABRICKS_HOST", "127.0.0.1:1")
+    base_url = f"http://127.0.0.1:{args.port}"
+    import_times, ttfr = [], []
+    for _ in range(args.runs):
+        import_times.append(time_import())
+        process = launch(args.server, args.port)
+        try:
+            ttfr.append(wait_until_ready(base_url, poll_interval=0.02))
+        finally:
+            stop(process)
+
+    median = statistics.median(ttfr)
+    print(json.dumps({
+        "server": args.server,
+        "runs": args.runs,
+        "import_app_median_s": statistics.median(import_times),
+        "time_to_first_request_median_s": median,
+        "time_to_first_request_max_s": max(ttfr),
+        "target_s": args.target_seconds,
+    }))
+    if median > args.target_seconds:
+        print(f"Time to first request {median:.2f}s exceeds target {args.target_seconds:.2f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Bytes on the wire per question with each response encoding.
+
+Asks the same questions through the Dash callbacks once per ``--encodings``
+entry, sent as the browser's Accept-Encoding, and reports the request and
+response bytes per question, the callback latency and the size of each
+callback's responses before and after compression (from the
+``genie_callback_*_bytes`` histograms).
+
+    python -m benchmarks.bench_compression --encodings identity,gzip,br --questions 10 --rows 1000
+"""
+import argparse
+import json
+import time
+
+from benchmarks.fake_genie_server import add_config_arguments
+from benchmarks.harness import DashSession, add_common_arguments, start_fake_server, summarize
+
+
+def histogram_sums(histogram) -> dict:
+    return {", ".join(key): state[-2] for key, state in histogram._values.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--encodings", default="identity,gzip,br")
+    parser.add_argument("--questions", type=int, default=10)
+    add_config_arguments(parser)
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_fake_server(args)
+    try:
+        import compression
+        from app import app
+
+        for encoding in args.encodings.split(","):
+            session = DashSession(app, app.server.test_client(), headers={"Accept-Encoding": encoding})
+            latencies = []
+            for q in range(args.questions):
+                start = time.perf_counter()
+                session.ask(f"Question {q}")
+                latencies.append(time.perf_counter() - start)
+            summarize(f"{encoding}_question", latencies)
+            print(json.dumps({"encoding": encoding,
+                              "request_bytes_per_question": session.request_bytes / args.questions,
+                              "response_bytes_per_question": session.response_bytes / args.questions}))
+        print(json.dumps({"response_bytes_by_callback": histogram_sums(compression.RESPONSE_BYTES),
+                          "wire_bytes_by_callback": histogram_sums(compression.WIRE_BYTES)}, indent=1))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Concurrent-user throughput through the Dash callbacks (``handle_all_inputs`` then
+``get_model_response``), served in-process by the Flask test client.
+
+    python -m benchmarks.bench_dash_throughput --users 16 --questions 5 --latency uniform:0.05,0.2
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.fake_genie_server import add_config_arguments
+from benchmarks.harness import DashSession, add_common_arguments, start_fake_server, summarize
+
+
+def run_users(dash_app, users: int, questions: int, make_transport, base_url: str = ""):
+    """Run ``users`` threads each asking ``questions`` questions; return per-question latencies and wall time."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def user(index: int):
+        session = DashSession(dash_app, make_transport(), base_url=base_url)
+        for q in range(questions):
+            start = time.perf_counter()
+            try:
+                session.ask(f"User {index} question {q}")
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - wall_start, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--questions", type=int, default=3)
+    add_config_arguments(parser)
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_fake_server(args)
+    try:
+        from app import app
+        latencies, wall, errors = run_users(app, args.users, args.questions, app.server.test_client)
+        summarize(f"dash_question_users_{args.users}", latencies, wall)
+        if errors:
+            print(f"{len(errors)} errors, first: {errors[0]}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Request deadline under throttling: a question must end within its deadline.
+
+The fake server keeps the message executing and starts answering every call
+with 429 after ``--throttle-after`` seconds, so the SDK retries with the
+server's Retry-After. Each run asks one question with a ``--deadline`` second
+budget and records its wall time and whether it ended with
+``DeadlineExceededError``.
+
+    python -m benchmarks.bench_deadline --deadline 8 --throttle-after 5 --retry-after 4 --runs 3
+
+Exits with status 1 when any run outlasts the deadline by more than
+``--slack-seconds`` or ends with anything but ``DeadlineExceededError``.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from benchmarks.fake_genie_server import add_config_arguments
+from benchmarks.harness import FAKE_TOKEN, add_common_arguments, start_fake_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deadline", type=float, default=8)
+    parser.add_argument("--throttle-after", type=float, default=5)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--slack-seconds", type=float, default=1.0)
+    add_config_arguments(parser)
+    add_common_arguments(parser)
+    parser.set_defaults(retry_after=4, poll_interval=0.5, status_sequence=",".join(["EXECUTING_QUERY"] * 1000))
+    args = parser.parse_args()
+
+    server = start_fake_server(args)
+    failures = []
+    try:
+        from deadline import Deadline, DeadlineExceededError
+        from genie_room import genie_query
+
+        for run in range(args.runs):
+            server.config.throttle_rate = 0.0
+            throttle = threading.Timer(args.throttle_after, lambda: setattr(server.config, "throttle_rate", 1.0))
+            throttle.start()
+            start = time.perf_counter()
+            try:
+                genie_query("What is the revenue?", FAKE_TOKEN, "space0", deadline=Deadline(args.deadline))
+                outcome = "answered"
+            except DeadlineExceededError:
+                outcome = "deadline_exceeded"
+            except Exception as e:
+                outcome = f"error: {e}"
+            wall = time.perf_counter() - start
+            throttle.cancel()
+            print(json.dumps({"run": run, "deadline_s": args.deadline, "wall_s": round(wall, 3), "outcome": outcome}))
+            if wall > args.deadline + args.slack_seconds or outcome != "deadline_exceeded":
+                failures.append(run)
+        print(f"fake server requests: {server.requests}")
+    finally:
+        server.stop()
+    if failures:
+        print(f"{len(failures)} of {args.runs} runs outlasted the {args.deadline:g}s deadline or ended otherwise")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Multi-space questions: asking each space in turn vs the concurrent fan-out.
+
+Asks one question in ``--spaces`` spaces of the fake server, first serially
+with ``genie_query`` and then through ``fanout``, and reports the wall time
+of both and when each fan-out answer became available.
+
+    python -m benchmarks.bench_fanout --spaces 4 --iterations 5 --latency uniform:0.05,0.3
+"""
+import argparse
+import json
+import time
+
+from benchmarks.fake_genie_server import add_config_arguments
+from benchmarks.harness import FAKE_TOKEN, add_common_arguments, start_fake_server, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spaces", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=5)
+    add_config_arguments(parser)
+    add_common_arguments(parser)
+    parser.set_defaults(latency="uniform:0.05,0.3")
+    args = parser.parse_args()
+
+    server = start_fake_server(args)
+    try:
+        import fanout
+        from genie_room import genie_query
+
+        # Keep the benchmark itself clear of the per-space rate limit
+        fanout.SPACE_BURST = 2 * args.iterations
+        space_ids = [f"space{i}" for i in range(args.spaces)]
+
+        serial = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            for space_id in space_ids:
+                genie_query("What is the revenue?", FAKE_TOKEN, space_id)
+            serial.append(time.perf_counter() - start)
+        summarize("serial", serial)
+
+        concurrent, first_answer = [], []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            job_id = fanout.start("What is the revenue?", FAKE_TOKEN, space_ids, "bench@example.com")
+            first = None
+            while True:
+                taken = fanout.take_finished(job_id, "bench@example.com")
+                if taken["new"] and first is None:
+                    first = time.perf_counter() - start
+                if taken["done"]:
+                    break
+                time.sleep(0.005)
+            concurrent.append(time.perf_counter() - start)
+            first_answer.append(first)
+        summarize("fanout", concurrent)
+        summarize("fanout_first_answer", first_answer)
+        print(json.dumps({"spaces": args.spaces,
+                          "answered": fanout.FANOUT_SPACES.value(outcome="answered"),
+                          "errors": fanout.FANOUT_SPACES.value(outcome="error")}))
+        print(f"fake server requests: {server.requests}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Latency of ``genie_query`` against the fake Genie server.
+
+    python -m benchmarks.bench_genie_query --iterations 50 --latency uniform:0.01,0.05 --rows 1000
+"""
+import argparse
+import time
+
+from benchmarks.fake_genie_server import add_config_arguments
+from benchmarks.harness import FAKE_TOKEN, add_common_arguments, start_fake_server, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    add_config_arguments(parser)
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_fake_server(args)
+    try:
+        from genie_room import genie_query
+        latencies = []
+        for i in range(args.iterations):
+            start = time.perf_counter()
+            genie_query(f"Benchmark question {i}", FAKE_TOKEN, "space0")
+            latencies.append(time.perf_counter() - start)
+        summarize("genie_query", latencies)
+        print(f"fake server requests: {server.requests}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
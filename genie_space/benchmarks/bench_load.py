@@ -0,0 +1,90 @@
+"""
+Load test comparing concurrent-user capacity of the production gunicorn setup
+with the Flask development server (`python app.py`). Each server runs in a
+subprocess against the fake Genie server; simulated users drive the Dash
+callbacks over HTTP.
+
+    python -m benchmarks.bench_load --servers dev,gunicorn --users 1,8,32,64 --latency uniform:0.2,0.5
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+
+from benchmarks.bench_dash_throughput import run_users
+from benchmarks.fake_genie_server import add_config_arguments
+from benchmarks.harness import add_common_arguments, start_fake_server, summarize
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def launch(kind: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ, PORT=str(port), DATABRICKS_APP_PORT=str(port))
+    if kind == "dev":
+        command = [sys.executable, "app.py"]
+    elif kind == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "app:server", "--config", "gunicorn.conf.py"]
+    else:
+        raise ValueError(f"Unknown server kind: {kind}")
+    # New session so the dev server's reloader child is stopped with it
+    return subprocess.Popen(command, cwd=APP_DIR, env=env, start_new_session=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(base_url: str, timeout: float = 60.0, poll_interval: float = 0.1) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if requests.get(base_url + "/", timeout=1).status_code == 200:
+                return time.perf_counter() - start
+        except requests.RequestException:
+            pass
+        time.sleep(poll_interval)
+    raise RuntimeError(f"Server at {base_url} did not become ready within {timeout}s")
+
+
+def stop(process: subprocess.Popen) -> None:
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", default="dev,gunicorn")
+    parser.add_argument("--users", default="1,8,32", help="Comma-separated concurrent user counts")
+    parser.add_argument("--questions", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8051)
+    add_config_arguments(parser)
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    fake = start_fake_server(args)
+    os.environ["GENIE_POLL_INTERVAL_SECONDS"] = str(args.poll_interval)
+    sys.path.insert(0, APP_DIR)
+    from app import app  # only used to read the layout and callback map
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        for kind in args.servers.split(","):
+            process = launch(kind, args.port)
+            try:
+                print(f"{kind}: ready in {wait_until_ready(base_url):.2f}s")
+                for users in (int(u) for u in args.users.split(",")):
+                    latencies, wall, errors = run_users(app, users, args.questions, requests.Session, base_url)
+                    summarize(f"{kind}_users_{users}", latencies, wall)
+                    if errors:
+                        print(f"{len(errors)} errors, first: {errors[0]}")
+            finally:
+                stop(process)
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
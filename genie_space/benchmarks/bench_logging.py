@@ -0,0 +1,139 @@
+"""
+Per-request logging overhead: synchronous basicConfig-style logging vs the queue-based setup.
+
+Concurrent threads play requests that each log a few INFO lines, one
+WARNING and one trace record with its spans, and time only the logging
+calls. ``sync`` writes
+and formats on the request thread like ``logging.basicConfig``; ``queue`` is
+``log_config``; ``queue_sampled`` also samples INFO records. ``--sink-delay-ms``
+slows every write down, like a congested log pipe. Each mode reports how many
+records were logged, written to the sink and dropped (by reason and level)
+next to its latency: a queue that drops records is not faster for free.
+
+    python -m benchmarks.bench_logging --threads 32 --requests 200 --sink-delay-ms 0.2
+    python -m benchmarks.bench_logging --modes sync,queue --queue-size 100000 --sink-delay-ms 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.harness import summarize
+
+SPANS = [{"stage": f"stage_{i}", "seconds": 0.01 * i, "depth": 0} for i in range(10)]
+RECORDS_PER_REQUEST = 7
+
+
+class SlowFile:
+    """File whose writes take at least ``delay`` seconds."""
+
+    def __init__(self, path: str, delay: float):
+        self._file = open(path, "a")
+        self._delay = delay
+
+    def write(self, text: str) -> int:
+        if self._delay:
+            time.sleep(self._delay)
+        return self._file.write(text)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def play_request(logger: logging.Logger, structured: bool, request: int) -> float:
+    start = time.perf_counter()
+    for line in range(5):
+        if structured:
+            logger.info("request %d step %d of %s", request, line, "question")
+        else:
+            logger.info(f"request {request} step {line} of {'question'}")
+    if structured:
+        logger.warning("request %d stage %s was slow", request, "poll")
+    else:
+        logger.warning(f"request {request} stage {'poll'} was slow")
+    if structured:
+        logger.info("trace %s %.3fs", "/_dash-update-component", 0.5, extra={"seconds": 0.5, "spans": SPANS})
+    else:
+        logger.info("trace %s", json.dumps({"name": "/_dash-update-component", "seconds": 0.5, "spans": SPANS}))
+    return time.perf_counter() - start
+
+
+def run(mode: str, args, path: str) -> None:
+    import log_config
+
+    sink = SlowFile(path, args.sink_delay_ms / 1000)
+    root = logging.getLogger()
+    if mode == "sync":
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    else:
+        log_config.SAMPLE_RATE = args.sample_rate if mode == "queue_sampled" else 1.0
+        if args.queue_size is not None:
+            log_config.QUEUE_SIZE = args.queue_size
+        log_config.configure_logging(sink)
+    logger = logging.getLogger("bench")
+    drops = [(reason, level) for reason in ("sampled", "queue_full") for level in ("INFO", "WARNING")]
+    dropped_before = {drop: log_config.LOG_RECORDS_DROPPED.value(reason=drop[0], level=drop[1]) for drop in drops}
+
+    latencies = []
+    lock = threading.Lock()
+
+    def user(index: int) -> None:
+        mine = [play_request(logger, mode != "sync", index * args.requests + r) for r in range(args.requests)]
+        with lock:
+            latencies.extend(mine)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    # Include the time to drain the queue, so no mode hides unwritten records
+    if mode == "sync":
+        root.removeHandler(handler)
+    else:
+        log_config.shutdown_logging()
+    drained = time.perf_counter() - start
+    sink.close()
+    with open(path) as written_file:
+        lines = written_file.read().splitlines()
+    dropped = {f"{reason}_{level.lower()}": log_config.LOG_RECORDS_DROPPED.value(reason=reason, level=level)
+               - dropped_before[(reason, level)] for reason, level in drops}
+    logged = len(latencies) * RECORDS_PER_REQUEST
+    summary = summarize(f"{mode}_logging_per_request", latencies, wall)
+    print(json.dumps({"mode": mode, "mean_ms": summary["mean_ms"], "p95_ms": summary["p95_ms"],
+                      "records_logged": logged, "records_written": len(lines),
+                      "warnings_written": sum(1 for line in lines if "WARNING" in line),
+                      "dropped_share": round(1 - len(lines) / logged, 4), "dropped": dropped,
+                      "wall_seconds": wall, "drained_seconds": drained}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="sync,queue,queue_sampled")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per thread")
+    parser.add_argument("--sink-delay-ms", type=float, default=0.0)
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="GENIE_LOG_SAMPLE_RATE of queue_sampled")
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help="GENIE_LOG_QUEUE_SIZE; set it above the records logged to compare without drops")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="genie-bench-logs-")
+    for mode in args.modes.split(","):
+        run(mode, args, os.path.join(directory, f"{mode}.log"))
+
+
+if __name__ == "__main__":
+    main()
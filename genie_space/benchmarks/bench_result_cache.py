@@ -0,0 +1,65 @@
+"""
+Result cache memory governor: resident vs spilled bytes and read latency.
+
+Simulates several users each caching large results under the configured
+budgets, then reads every result back once (from memory or from its
+memory-mapped spill file).
+
+    GENIE_RESULT_CACHE_MAX_BYTES=268435456 GENIE_RESULT_CACHE_USER_MAX_BYTES=67108864 \\
+        python -m benchmarks.bench_result_cache --users 4 --results 6 --rows 500000
+"""
+import argparse
+import json
+import time
+
+from benchmarks.harness import summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--results", type=int, default=6, help="Results cached per user")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--columns", type=int, default=5)
+    args = parser.parse_args()
+
+    import pandas as pd
+    import pyarrow
+    import result_cache
+
+    rows = range(args.rows)
+    df = pd.DataFrame({"col_0": list(rows), **{f"col_{c}": [f"r{r}c{c}" for r in rows] for c in range(1, args.columns)}})
+
+    put_latencies = []
+    for result in range(args.results):
+        for user in range(args.users):
+            start = time.perf_counter()
+            result_cache.put(f"u{user}-r{result}", df, f"user{user}@example.com", f"session{user}")
+            put_latencies.append(time.perf_counter() - start)
+    summarize("put", put_latencies)
+
+    resident, spilled = [], []
+    for table_id, entry in list(result_cache._cache.items()):
+        user_id = entry.user_id
+        was_resident = entry.resident
+        start = time.perf_counter()
+        result_cache.get(table_id, user_id)
+        (resident if was_resident else spilled).append(time.perf_counter() - start)
+    summarize("get_resident", resident)
+    summarize("get_spilled", spilled)
+
+    print(json.dumps({
+        "results": args.users * args.results,
+        "result_bytes": pyarrow.Table.from_pandas(df, preserve_index=False).nbytes,
+        "resident_bytes": result_cache.CACHE_BYTES.value(state="resident"),
+        "spilled_bytes": result_cache.CACHE_BYTES.value(state="spilled"),
+        "resident_entries": result_cache.CACHE_ENTRIES.value(state="resident"),
+        "spilled_entries": result_cache.CACHE_ENTRIES.value(state="spilled"),
+        "evicted": len(put_latencies) - len(result_cache._cache),
+        "budget_bytes": result_cache.MAX_BYTES,
+        "user_budget_bytes": result_cache.USER_MAX_BYTES,
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Typed-question latency under mixed load: one FIFO queue vs the priority scheduler.
+
+Simulates a worker whose Genie and serving capacity is ``--slots`` calls at a
+time. Background jobs (scheduled refreshes) and insight requests keep it busy
+while questions arrive at random. ``fifo`` runs every job under the same
+class, first come first served; ``priority`` uses the classes of
+``scheduler``. Jobs check their cancellation token while they run, like the
+Genie poll loop, so preempted background jobs stop early. ``peak_waiting``
+is the most threads parked waiting for a slot at once; in ``priority`` mode
+work other than questions beyond ``--max-queued`` is rejected instead.
+
+    python -m benchmarks.bench_scheduler --slots 8 --seconds 20 --background 12 --insights 4 --question-rate 4
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+from benchmarks.harness import summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="fifo,priority")
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--reserved", type=int, default=2, help="GENIE_SCHEDULER_INTERACTIVE_RESERVED")
+    parser.add_argument("--background-slots", type=int, default=2, help="GENIE_SCHEDULER_BACKGROUND_SLOTS")
+    parser.add_argument("--max-queued", type=int, default=8, help="GENIE_SCHEDULER_MAX_QUEUED")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--background", type=int, default=12, help="Threads submitting background jobs back to back")
+    parser.add_argument("--insights", type=int, default=4, help="Threads requesting insights back to back")
+    parser.add_argument("--question-rate", type=float, default=4, help="Questions per second")
+    parser.add_argument("--question-seconds", type=float, default=0.5)
+    parser.add_argument("--insight-seconds", type=float, default=1.5)
+    parser.add_argument("--background-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    import scheduler
+    from cancellation import QueryCancelledError
+
+    for mode in args.modes.split(","):
+        # FIFO runs everything as questions, which are never turned away
+        sched = scheduler.PriorityScheduler(args.slots, args.reserved, args.background_slots, args.max_queued)
+        stop_at = time.monotonic() + args.seconds
+        latencies = {scheduler.INTERACTIVE: [], scheduler.INSIGHTS: [], scheduler.BACKGROUND: []}
+        outcomes = {"completed": 0, "preempted": 0, "rejected": 0}
+        lock = threading.Lock()
+
+        def run_job(priority_class: str, seconds: float) -> None:
+            start = time.perf_counter()
+            outcome = "completed"
+            try:
+                with sched.slot(scheduler.INTERACTIVE if mode == "fifo" else priority_class,
+                                max_wait=args.seconds) as token:
+                    end = time.monotonic() + seconds
+                    while time.monotonic() < end:
+                        token.sleep(0.05)
+            except scheduler.SchedulerBusyError:
+                outcome = "rejected"
+            except QueryCancelledError:
+                outcome = "preempted"
+            with lock:
+                if outcome == "completed":
+                    latencies[priority_class].append(time.perf_counter() - start)
+                if priority_class == scheduler.BACKGROUND:
+                    outcomes[outcome] += 1
+
+        def loop(priority_class: str, seconds: float) -> None:
+            while time.monotonic() < stop_at:
+                run_job(priority_class, seconds)
+                if priority_class == scheduler.BACKGROUND:
+                    time.sleep(0.05)
+
+        threads = [threading.Thread(target=loop, args=(scheduler.BACKGROUND, args.background_seconds))
+                   for _ in range(args.background)]
+        threads += [threading.Thread(target=loop, args=(scheduler.INSIGHTS, args.insight_seconds))
+                    for _ in range(args.insights)]
+        for thread in threads:
+            thread.start()
+        # Let the background load fill the slots before the first question
+        time.sleep(1.0)
+        questions = []
+        peak_waiting = 0
+        while time.monotonic() < stop_at:
+            question = threading.Thread(target=run_job, args=(scheduler.INTERACTIVE, args.question_seconds))
+            question.start()
+            questions.append(question)
+            time.sleep(random.expovariate(args.question_rate))
+            peak_waiting = max(peak_waiting, len(sched._waiting))
+        for thread in threads + questions:
+            thread.join()
+
+        for priority_class, values in latencies.items():
+            summarize(f"{mode}_{priority_class}", values)
+        print(json.dumps({"mode": mode, "questions": len(questions), "background_jobs": outcomes,
+                          "peak_waiting": peak_waiting}))
+
+
+if __name__ == "__main__":
+    main()
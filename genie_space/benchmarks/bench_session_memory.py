@@ -0,0 +1,59 @@
+"""
+Memory cost per chat session: Python heap retained by the server (tracemalloc)
+and the callback bytes a browser tab sends and receives per question.
+
+    python -m benchmarks.bench_session_memory --sessions 20 --questions 5 --rows 1000
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from benchmarks.fake_genie_server import add_config_arguments
+from benchmarks.harness import DashSession, add_common_arguments, start_fake_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--questions", type=int, default=3)
+    add_config_arguments(parser)
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_fake_server(args)
+    try:
+        from app import app
+        client = app.server.test_client()
+        # Warm up imports and lazy initialisation so they are not charged to the first session
+        DashSession(app, client).ask("warm up")
+
+        gc.collect()
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        sessions = []
+        for s in range(args.sessions):
+            session = DashSession(app, client)
+            for q in range(args.questions):
+                session.ask(f"Session {s} question {q}")
+            sessions.append(session)
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        questions = args.sessions * args.questions
+        # Sessions hold the browser-side props, so this counts both server caches and client state
+        print(json.dumps({
+            "sessions": args.sessions,
+            "questions_per_session": args.questions,
+            "heap_bytes_per_session": (current - baseline) / args.sessions,
+            "peak_heap_bytes": peak - baseline,
+            "request_bytes_per_question": sum(s.request_bytes for s in sessions) / questions,
+            "response_bytes_per_question": sum(s.response_bytes for s in sessions) / questions,
+        }))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
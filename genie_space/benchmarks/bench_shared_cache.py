@@ -0,0 +1,82 @@
+"""
+Cross-worker hit rate of the result cache with each cache backend.
+
+Starts ``--workers`` processes, like gunicorn workers, each with its own
+result cache. Every worker caches its share of the results, then reads
+results written by the next worker, as happens when a user's later request
+(refresh, insights) lands on another worker. With the in-process backend
+those reads miss; with the shared SQLite backend they hit.
+
+    python -m benchmarks.bench_shared_cache --backends memory,sqlite --workers 4 --results 50 --rows 20000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.harness import summarize
+
+
+def worker(index: int, args, barrier, queue) -> None:
+    import pandas as pd
+    import result_cache
+
+    rows = range(args.rows)
+    df = pd.DataFrame({"id": list(rows), "label": [f"row {r}" for r in rows]})
+    user_id = "bench@example.com"
+
+    put_latencies = []
+    for result in range(index, args.results, args.workers):
+        start = time.perf_counter()
+        result_cache.put(f"result-{result}", df, user_id)
+        put_latencies.append(time.perf_counter() - start)
+    barrier.wait()
+
+    # Read what the next worker wrote: this worker has never seen those tables
+    hits, get_latencies = 0, []
+    for result in range((index + 1) % args.workers, args.results, args.workers):
+        start = time.perf_counter()
+        hits += result_cache.get(f"result-{result}", user_id) is not None
+        get_latencies.append(time.perf_counter() - start)
+    queue.put((put_latencies, get_latencies, hits))
+
+
+def run(backend: str, args) -> None:
+    # Spawned workers read the backend settings when they import the app modules
+    os.environ["GENIE_CACHE_BACKEND"] = backend
+    os.environ["GENIE_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="genie-bench-cache-"), "cache.db")
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(args.workers)
+    queue = context.Queue()
+    processes = [context.Process(target=worker, args=(i, args, barrier, queue)) for i in range(args.workers)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    put_latencies = [latency for r in results for latency in r[0]]
+    get_latencies = [latency for r in results for latency in r[1]]
+    hits = sum(r[2] for r in results)
+    summarize(f"{backend}_put", put_latencies)
+    summarize(f"{backend}_cross_worker_get", get_latencies)
+    print(json.dumps({"backend": backend, "workers": args.workers, "reads": len(get_latencies),
+                      "hits": hits, "hit_rate": hits / len(get_latencies) if get_latencies else 0.0}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="memory,sqlite")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--results", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    for backend in args.backends.split(","):
+        run(backend, args)
+
+
+if __name__ == "__main__":
+    main()
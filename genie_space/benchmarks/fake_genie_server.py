@@ -0,0 +1,454 @@
+"""
+Local stand-in for the Genie conversation API and the serving ``query`` endpoint.
+
+Implements only the REST routes used by ``GenieClient`` and ``call_llm_for_insights``
+so the app can be benchmarked without a live workspace. Latency, status
+sequences, 429 injection and result sizes are configurable. Statement
+executions are answered with Arrow chunks behind fake external links (this
+needs pyarrow).
+
+Run standalone and point the app at it:
+
+    python -m benchmarks.fake_genie_server --port 8765 --latency lognormal:-3,0.5
+    DATABRICKS_HOST=http://127.0.0.1:8765 python app.py
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+class LatencyDistribution:
+    """
+    Parse and sample a latency spec in seconds:
+    ``const:0.05``, ``uniform:0.01,0.2`` or ``lognormal:mu,sigma`` (of ln seconds).
+    """
+
+    def __init__(self, spec: str = "const:0"):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        params = [float(a) for a in args.split(",") if a]
+        if kind == "const":
+            self._sample = lambda: params[0] if params else 0.0
+        elif kind == "uniform":
+            self._sample = lambda: random.uniform(params[0], params[1])
+        elif kind == "lognormal":
+            self._sample = lambda: math.exp(random.gauss(params[0], params[1]))
+        else:
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        return max(self._sample(), 0.0)
+
+
+@dataclass
+class FakeGenieConfig:
+    """Behaviour of the fake server. Latencies are keyed by endpoint name, with ``default`` as fallback."""
+    latency: Dict[str, str] = field(default_factory=lambda: {"default": "const:0"})
+    status_sequence: List[str] = field(default_factory=lambda: ["SUBMITTED", "EXECUTING_QUERY", "COMPLETED"])
+    throttle_rate: float = 0.0
+    retry_after_seconds: int = 1
+    result_rows: int = 100
+    result_columns: int = 5
+    query_attachments: int = 1
+    arrow_chunk_rows: int = 50000
+    text_attachment: bool = False
+    spaces: int = 3
+    insight_text: str = "Fake insights: values trend upwards."
+
+    def __post_init__(self):
+        self._distributions = {name: LatencyDistribution(spec) for name, spec in self.latency.items()}
+        self._distributions.setdefault("default", LatencyDistribution())
+
+    def delay(self, endpoint: str) -> float:
+        return self._distributions.get(endpoint, self._distributions["default"]).sample()
+
+
+class _State:
+    """Conversations, messages and request counters shared by handler threads."""
+
+    def __init__(self, config: FakeGenieConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self.requests: Dict[str, int] = {}
+        self.throttled = 0
+        self._result_cache: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self._arrow_chunks: Dict[Tuple[int, int, int], List[bytes]] = {}
+
+    def count(self, endpoint: str) -> None:
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def new_message(self, space_id: str, conversation_id: str, content: str) -> Dict[str, Any]:
+        message_id = uuid.uuid4().hex
+        message = {
+            "id": message_id,
+            "message_id": message_id,
+            "space_id": space_id,
+            "conversation_id": conversation_id,
+            "content": content,
+            "polls": 0,
+        }
+        with self.lock:
+            self.messages[message_id] = message
+        return message
+
+    def poll(self, message_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            message = self.messages.get(message_id)
+            if message is None:
+                return None
+            sequence = self.config.status_sequence
+            status = sequence[min(message["polls"], len(sequence) - 1)]
+            message["polls"] += 1
+        body = {k: v for k, v in message.items() if k != "polls"}
+        body["status"] = status
+        if status == "COMPLETED":
+            body["attachments"] = self.attachments(message_id)
+        return body
+
+    def attachments(self, message_id: str) -> List[Dict[str, Any]]:
+        attachments = []
+        if self.config.text_attachment:
+            attachments.append({"attachment_id": f"{message_id}-text", "text": {"content": "Here is what I found."}})
+        for i in range(self.config.query_attachments):
+            attachments.append({
+                "attachment_id": f"{message_id}-q{i}",
+                "query": {
+                    "query": f"SELECT id, name, value FROM fake.schema.table_{i} WHERE value > {i} ORDER BY id",
+                    "description": f"Fake query {i}",
+                    "statement_id": f"{message_id}-s{i}",
+                    "query_result_metadata": {"row_count": self.config.result_rows, "is_truncated": False},
+                },
+            })
+        return attachments
+
+    def query_result(self) -> Dict[str, Any]:
+        key = (self.config.result_rows, self.config.result_columns)
+        with self.lock:
+            cached = self._result_cache.get(key)
+        if cached is None:
+            rows, cols = key
+            columns = [{"name": f"col_{c}", "type_name": "STRING", "type_text": "STRING", "position": c} for c in range(cols)]
+            data_array = [[f"r{r}c{c}" if c else str(r) for c in range(cols)] for r in range(rows)]
+            cached = {
+                "statement_response": {
+                    "statement_id": uuid.uuid4().hex,
+                    "status": {"state": "SUCCEEDED"},
+                    "manifest": {
+                        "format": "JSON_ARRAY",
+                        "schema": {"column_count": cols, "columns": columns},
+                        "total_row_count": rows,
+                        "truncated": False,
+                    },
+                    "result": {"chunk_index": 0, "row_count": rows, "row_offset": 0, "data_array": data_array},
+                }
+            }
+            with self.lock:
+                self._result_cache[key] = cached
+        return cached
+
+    def arrow_chunks(self) -> List[bytes]:
+        """The fake result as Arrow IPC streams of ``arrow_chunk_rows`` rows each, same values as ``query_result``."""
+        key = (self.config.result_rows, self.config.result_columns, self.config.arrow_chunk_rows)
+        with self.lock:
+            cached = self._arrow_chunks.get(key)
+        if cached is None:
+            import pyarrow
+            import pyarrow.ipc
+
+            rows, cols, chunk_rows = key
+            cached = []
+            for offset in range(0, rows, chunk_rows):
+                ids = range(offset, min(offset + chunk_rows, rows))
+                arrays = [pyarrow.array(list(ids), pyarrow.int64())]
+                arrays += [pyarrow.array([f"r{r}c{c}" for r in ids]) for c in range(1, cols)]
+                batch = pyarrow.record_batch(arrays, names=[f"col_{c}" for c in range(cols)])
+                sink = pyarrow.BufferOutputStream()
+                with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+                    writer.write_batch(batch)
+                cached.append(sink.getvalue().to_pybytes())
+            with self.lock:
+                self._arrow_chunks[key] = cached
+        return cached
+
+    def statement(self, statement_id: str, base_url: str) -> Dict[str, Any]:
+        """A finished ARROW_STREAM / EXTERNAL_LINKS statement with the first chunk's link inline."""
+        rows, cols = self.config.result_rows, self.config.result_columns
+        chunks = self.arrow_chunks()
+        columns = [{"name": "col_0", "type_name": "LONG", "type_text": "BIGINT", "position": 0}]
+        columns += [{"name": f"col_{c}", "type_name": "STRING", "type_text": "STRING", "position": c} for c in range(1, cols)]
+        response = {
+            "statement_id": statement_id,
+            "status": {"state": "SUCCEEDED"},
+            "manifest": {
+                "format": "ARROW_STREAM",
+                "schema": {"column_count": cols, "columns": columns},
+                "total_chunk_count": len(chunks),
+                "total_row_count": rows,
+                "chunks": [self.chunk_info(i) for i in range(len(chunks))],
+                "truncated": False,
+            },
+        }
+        if chunks:
+            response["result"] = {"external_links": [self.external_link(statement_id, 0, base_url)]}
+        return response
+
+    def chunk_info(self, index: int) -> Dict[str, Any]:
+        chunk_rows = self.config.arrow_chunk_rows
+        offset = index * chunk_rows
+        return {"chunk_index": index, "row_offset": offset,
+                "row_count": min(chunk_rows, self.config.result_rows - offset),
+                "byte_count": len(self.arrow_chunks()[index])}
+
+    def external_link(self, statement_id: str, index: int, base_url: str) -> Dict[str, Any]:
+        link = dict(self.chunk_info(index), external_link=f"{base_url}/fake-external/{statement_id}/{index}",
+                    expiration="2099-01-01T00:00:00Z")
+        if index + 1 < len(self.arrow_chunks()):
+            link["next_chunk_index"] = index + 1
+            link["next_chunk_internal_link"] = f"/api/2.0/sql/statements/{statement_id}/result/chunks/{index + 1}"
+        return link
+
+
+_PREFIX = r"/api/2\.0/genie/spaces"
+_STATEMENTS = r"/api/2\.0/sql/statements"
+_MESSAGE = _PREFIX + r"/(?P<space>[^/]+)/conversations/(?P<conv>[^/]+)/messages/(?P<msg>[^/]+)"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeGenie/1.0"
+    protocol_version = "HTTP/1.1"
+    state: _State = None
+    routes: List[Tuple[str, "re.Pattern", str]] = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        # bytes bodies are Arrow chunks, everything else is JSON
+        binary = isinstance(body, bytes)
+        payload = body if binary else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/vnd.apache.arrow.stream" if binary else "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _dispatch(self, method: str) -> None:
+        parsed = urlparse(self.path)
+        for route_method, pattern, endpoint in self.routes:
+            match = pattern.fullmatch(parsed.path)
+            if route_method == method and match:
+                break
+        else:
+            self._send(404, {"error_code": "NOT_FOUND", "message": f"No fake route for {method} {parsed.path}"})
+            return
+
+        state = self.state
+        state.count(endpoint)
+        body = self._read_body() if method == "POST" else {}
+        time.sleep(state.config.delay(endpoint))
+        if state.config.throttle_rate and random.random() < state.config.throttle_rate:
+            with state.lock:
+                state.throttled += 1
+            self._send(429, {"error_code": "RESOURCE_EXHAUSTED", "message": "Too Many Requests"},
+                       {"Retry-After": str(state.config.retry_after_seconds)})
+            return
+        handler: Callable = getattr(self, f"_handle_{endpoint}")
+        status, response = handler(match.groupdict(), body, parse_qs(parsed.query))
+        self._send(status, response)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _handle_host_metadata(self, params, body, query):
+        return 200, {"oidc_endpoint": "", "workspace_id": "0"}
+
+    def _handle_start_conversation(self, params, body, query):
+        conversation_id = uuid.uuid4().hex
+        message = self.state.new_message(params["space"], conversation_id, body.get("content", ""))
+        return 200, {
+            "conversation_id": conversation_id,
+            "message_id": message["message_id"],
+            "conversation": {"id": conversation_id, "space_id": params["space"]},
+            "message": {k: v for k, v in message.items() if k != "polls"},
+        }
+
+    def _handle_send_message(self, params, body, query):
+        message = self.state.new_message(params["space"], params["conv"], body.get("content", ""))
+        return 200, {k: v for k, v in message.items() if k != "polls"}
+
+    def _handle_get_message(self, params, body, query):
+        message = self.state.poll(params["msg"])
+        if message is None:
+            return 404, {"error_code": "NOT_FOUND", "message": "Message not found"}
+        return 200, message
+
+    def _handle_query_result(self, params, body, query):
+        return 200, self.state.query_result()
+
+    def _handle_execute_query(self, params, body, query):
+        return 200, self.state.query_result()
+
+    def _base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handle_get_space(self, params, body, query):
+        space_id = params["space"]
+        return 200, {"space_id": space_id, "title": f"Fake space {space_id}", "warehouse_id": "fake-warehouse"}
+
+    def _handle_execute_statement(self, params, body, query):
+        return 200, self.state.statement(uuid.uuid4().hex, self._base_url())
+
+    def _handle_get_statement(self, params, body, query):
+        return 200, self.state.statement(params["statement"], self._base_url())
+
+    def _handle_statement_chunk(self, params, body, query):
+        index = int(params["chunk"])
+        if index >= len(self.state.arrow_chunks()):
+            return 404, {"error_code": "NOT_FOUND", "message": f"No chunk {index}"}
+        return 200, {"external_links": [self.state.external_link(params["statement"], index, self._base_url())]}
+
+    def _handle_external_link(self, params, body, query):
+        index = int(params["chunk"])
+        chunks = self.state.arrow_chunks()
+        if index >= len(chunks):
+            return 404, {"error_code": "NOT_FOUND", "message": f"No chunk {index}"}
+        return 200, chunks[index]
+
+    def _handle_list_spaces(self, params, body, query):
+        spaces = [
+            {"space_id": f"space{i}", "title": f"Fake space {i}", "description": f"Fake Genie space number {i}"}
+            for i in range(self.state.config.spaces)
+        ]
+        return 200, {"spaces": spaces}
+
+    def _handle_serving_query(self, params, body, query):
+        return 200, {
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": self.state.config.insight_text}}],
+        }
+
+
+_Handler.routes = [
+    ("GET", re.compile(r"/\.well-known/databricks-config"), "host_metadata"),
+    ("POST", re.compile(_PREFIX + r"/(?P<space>[^/]+)/start-conversation"), "start_conversation"),
+    ("POST", re.compile(_PREFIX + r"/(?P<space>[^/]+)/conversations/(?P<conv>[^/]+)/messages"), "send_message"),
+    ("GET", re.compile(_MESSAGE), "get_message"),
+    ("GET", re.compile(_MESSAGE + r"/attachments/(?P<att>[^/]+)/query-result"), "query_result"),
+    ("POST", re.compile(_MESSAGE + r"/attachments/(?P<att>[^/]+)/execute-query"), "execute_query"),
+    ("GET", re.compile(_PREFIX), "list_spaces"),
+    ("GET", re.compile(_PREFIX + r"/(?P<space>[^/]+)"), "get_space"),
+    ("POST", re.compile(_STATEMENTS + r"/?"), "execute_statement"),
+    ("GET", re.compile(_STATEMENTS + r"/(?P<statement>[^/]+)"), "get_statement"),
+    ("GET", re.compile(_STATEMENTS + r"/(?P<statement>[^/]+)/result/chunks/(?P<chunk>\d+)"), "statement_chunk"),
+    ("GET", re.compile(r"/fake-external/(?P<statement>[^/]+)/(?P<chunk>\d+)"), "external_link"),
+    ("POST", re.compile(r"/serving-endpoints/(?P<name>[^/]+)/invocations"), "serving_query"),
+]
+
+
+class FakeGenieServer:
+    """Threaded HTTP server wrapping the fake routes; usable as a context manager."""
+
+    def __init__(self, config: Optional[FakeGenieConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeGenieConfig()
+        self.state = _State(self.config)
+        handler = type("FakeGenieHandler", (_Handler,), {"state": self.state})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        """Value to use for ``DATABRICKS_HOST``."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self) -> Dict[str, int]:
+        with self.state.lock:
+            return dict(self.state.requests)
+
+    def start(self) -> "FakeGenieServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-genie", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeGenieServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    """Register the fake server options on a benchmark's argument parser."""
+    parser.add_argument("--latency", default="const:0.02", help="Default per-request latency distribution")
+    parser.add_argument("--latency-for", action="append", default=[], metavar="ENDPOINT=SPEC",
+                        help="Latency for a single endpoint, e.g. get_message=uniform:0.05,0.2")
+    parser.add_argument("--status-sequence", default="SUBMITTED,EXECUTING_QUERY,COMPLETED")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Probability of answering 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--columns", type=int, default=5)
+    parser.add_argument("--query-attachments", type=int, default=1)
+    parser.add_argument("--text-attachment", action="store_true")
+    parser.add_argument("--arrow-chunk-rows", type=int, default=50000, help="Rows per Arrow chunk of statement results")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeGenieConfig:
+    latency = {"default": args.latency}
+    for item in args.latency_for:
+        endpoint, _, spec = item.partition("=")
+        latency[endpoint] = spec
+    return FakeGenieConfig(
+        latency=latency,
+        status_sequence=args.status_sequence.split(","),
+        throttle_rate=args.throttle_rate,
+        retry_after_seconds=args.retry_after,
+        result_rows=args.rows,
+        result_columns=args.columns,
+        query_attachments=args.query_attachments,
+        text_attachment=args.text_attachment,
+        arrow_chunk_rows=args.arrow_chunk_rows,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    server = FakeGenieServer(config_from_args(args), port=args.port)
+    print(f"Fake Genie server listening on {server.host}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Shared helpers for the benchmark scripts: starting the fake Genie server,
+importing the app against it, driving Dash callbacks like a browser would,
+and summarising latencies.
+"""
+import json
+import os
+import statistics
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional
+
+from benchmarks.fake_genie_server import FakeGenieServer, config_from_args
+
+FAKE_TOKEN = "fake-token"
+FAKE_USER = "bench@example.com"
+DASH_CALLBACK_PATH = "/_dash-update-component"
+
+
+def start_fake_server(args) -> FakeGenieServer:
+    """Start the fake server from parsed CLI args and point the app's environment at it."""
+    server = FakeGenieServer(config_from_args(args)).start()
+    os.environ["DATABRICKS_HOST"] = server.host
+    os.environ["SERVING_ENDPOINT_NAME"] = "fake-endpoint"
+    os.environ.setdefault("GENIE_POLL_INTERVAL_SECONDS", str(args.poll_interval))
+    # Keep benchmark sessions out of the app's own chat history database
+    os.environ.setdefault("GENIE_HISTORY_DB", os.path.join(tempfile.mkdtemp(prefix="genie-bench-"), "chat_history.db"))
+    return server
+
+
+def add_common_arguments(parser) -> None:
+    parser.add_argument("--poll-interval", type=float, default=0.05,
+                        help="GENIE_POLL_INTERVAL_SECONDS used by the app during the benchmark")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(name: str, latencies: List[float], wall_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """Print and return mean/p50/p95/p99 (and throughput when a wall time is given)."""
+    summary = {
+        "name": name,
+        "count": len(latencies),
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+    if wall_seconds:
+        summary["throughput_per_s"] = len(latencies) / wall_seconds
+    print(json.dumps(summary))
+    return summary
+
+
+def _walk(component) -> Iterable[Any]:
+    yield component
+    children = getattr(component, "children", None)
+    if isinstance(children, (list, tuple)):
+        for child in children:
+            yield from _walk(child)
+    elif children is not None and hasattr(children, "_prop_names"):
+        yield from _walk(children)
+
+
+def initial_props(layout) -> Dict[str, Any]:
+    """Collect ``"id.prop" -> value`` for every string-id component in a layout."""
+    props = {}
+    for component in _walk(layout):
+        component_id = getattr(component, "id", None)
+        if not isinstance(component_id, str):
+            continue
+        for prop in getattr(component, "_prop_names", []):
+            if prop != "id":
+                props[f"{component_id}.{prop}"] = getattr(component, prop, None)
+    return props
+
+
+def _decode(raw: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "gzip":
+        import gzip
+        return gzip.decompress(raw)
+    if encoding == "br":
+        import brotli
+        return brotli.decompress(raw)
+    return raw
+
+
+class DashSession:
+    """
+    Minimal stand-in for the Dash renderer: keeps one browser tab's component
+    props, builds callback requests from them and applies the responses.
+
+    ``transport`` is either a Flask test client or a ``requests.Session``
+    combined with ``base_url``.
+    """
+
+    def __init__(self, dash_app, transport, base_url: str = "", headers: Optional[Dict[str, str]] = None,
+                 space_id: str = "space0"):
+        self.dash_app = dash_app
+        self.transport = transport
+        self.base_url = base_url
+        self.headers = {"X-Forwarded-Access-Token": FAKE_TOKEN, "X-Forwarded-Email": FAKE_USER, **(headers or {})}
+        layout = dash_app.layout() if callable(dash_app.layout) else dash_app.layout
+        self.props = initial_props(layout)
+        self.props["selected-space-id.data"] = space_id
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self._callbacks = {cb["callback"].__name__: (key, cb) for key, cb in dash_app.callback_map.items()
+                           if "callback" in cb}
+
+    def _value(self, dependency: Dict[str, Any]) -> Any:
+        if not isinstance(dependency["id"], str):
+            return []
+        return self.props.get(f"{dependency['id']}.{dependency['property']}")
+
+    def trigger(self, callback_name: str, **changed: Any) -> Dict[str, Any]:
+        """
+        Run a callback as if the given ``"id.prop"`` inputs changed, e.g.
+        ``trigger("handle_all_inputs", **{"send-button-fixed.n_clicks": 1})``.
+        """
+        key, callback = self._callbacks[callback_name]
+        for prop_id, value in changed.items():
+            self.props[prop_id] = value
+        outputs = [{"id": o.component_id, "property": o.component_property} for o in callback["output"]] \
+            if isinstance(callback["output"], list) else \
+            {"id": callback["output"].component_id, "property": callback["output"].component_property}
+        body = {
+            "output": key,
+            "outputs": outputs,
+            "inputs": [{**dep, "value": self._value(dep)} for dep in callback["inputs"]],
+            "state": [{**dep, "value": self._value(dep)} for dep in callback["state"]],
+            "changedPropIds": list(changed),
+        }
+        payload = json.dumps(body)
+        self.request_bytes += len(payload)
+        headers = {"Content-Type": "application/json", **self.headers}
+        if self.base_url:
+            response = self.transport.post(self.base_url + DASH_CALLBACK_PATH, data=payload, headers=headers)
+            status, raw = response.status_code, response.content
+        else:
+            response = self.transport.post(DASH_CALLBACK_PATH, data=payload, headers=headers)
+            status, raw = response.status_code, response.get_data()
+        self.response_bytes += len(raw)
+        if not self.base_url:
+            # requests decodes compressed responses itself; the test client does not
+            raw = _decode(raw, response.headers.get("Content-Encoding"))
+        if status == 204:
+            return {}
+        if status != 200:
+            raise RuntimeError(f"{callback_name} failed with HTTP {status}: {raw[:200]!r}")
+        result = json.loads(raw)["response"]
+        for component_id, values in result.items():
+            for prop, value in values.items():
+                self.props[f"{component_id}.{prop}"] = value
+        return result
+
+    def ask(self, question: str) -> None:
+        """Type a question and run the two-step input/response callback chain."""
+        self.props["chat-input-fixed.value"] = question
+        clicks = (self.props.get("send-button-fixed.n_clicks") or 0) + 1
+        self.trigger("handle_all_inputs", **{"send-button-fixed.n_clicks": clicks})
+        self.trigger("get_model_response", **{"chat-trigger.data": self.props["chat-trigger.data"]})
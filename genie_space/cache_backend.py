@@ -0,0 +1,253 @@
+"""
+Pluggable cache backends shared by the result cache, insights and cancellation.
+
+Every backend stores bytes under string keys with the same rules: entries
+expire ``GENIE_CACHE_TTL_SECONDS`` after they were written, and once the
+backend holds more than ``GENIE_CACHE_MAX_BYTES`` the least recently used
+entries are evicted.
+
+- ``InProcessCache`` ("memory", the default) lives in one worker process.
+- ``SQLiteCache`` ("sqlite") is a WAL-mode SQLite file that every worker on
+  the host opens, so a result written by one gunicorn worker can be read by
+  another.
+
+``GENIE_CACHE_BACKEND`` selects the backend returned by ``get_cache()``.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from metrics import span, Counter, CACHE_HITS, CACHE_MISSES
+
+BACKEND = os.environ.get("GENIE_CACHE_BACKEND", "memory").lower()
+TTL_SECONDS = float(os.environ.get("GENIE_CACHE_TTL_SECONDS", "3600"))
+MAX_BYTES = int(os.environ.get("GENIE_CACHE_MAX_BYTES", str(1024 * 2**20)))
+SQLITE_PATH = os.environ.get("GENIE_CACHE_PATH", os.path.join(tempfile.gettempdir(), "genie-cache.db"))
+
+BACKEND_EVICTIONS = Counter("genie_cache_backend_evictions", "Entries removed from a cache backend.", ["backend", "reason"])
+
+
+class CacheBackend:
+    """Bytes keyed by string, with a TTL and a byte limit."""
+
+    name = "base"
+    # True when other worker processes see the same entries
+    shared = False
+
+    def __init__(self, ttl_seconds: float = TTL_SECONDS, max_bytes: int = MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the value stored under ``key``, or None if it is missing or expired."""
+        raise NotImplementedError
+
+    def contains(self, key: str) -> bool:
+        """Return whether ``key`` holds an unexpired value, without counting a hit or miss or marking it used."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl_seconds: Optional[float] = None) -> None:
+        """
+        Store ``value`` under ``key`` for ``ttl_seconds`` (the backend's TTL by
+        default). A value larger than the whole byte limit is not stored.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> None:
+        """Remove every key starting with ``prefix``."""
+        raise NotImplementedError
+
+    def _observe(self, value: Optional[bytes]) -> Optional[bytes]:
+        if value is None:
+            CACHE_MISSES.inc(cache=self.name)
+        else:
+            CACHE_HITS.inc(cache=self.name)
+        return value
+
+
+class InProcessCache(CacheBackend):
+    """LRU dictionary in this process."""
+
+    name = "memory"
+
+    def __init__(self, ttl_seconds: float = TTL_SECONDS, max_bytes: int = MAX_BYTES):
+        super().__init__(ttl_seconds, max_bytes)
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                self._pop(key, "expired")
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        return self._observe(entry[1] if entry else None)
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > time.time()
+
+    def set(self, key: str, value: bytes, ttl_seconds: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            if key in self._entries:
+                self._pop(key, None)
+            if len(value) > self.max_bytes:
+                BACKEND_EVICTIONS.inc(backend=self.name, reason="too_large")
+                return
+            self._entries[key] = (expires_at, value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes and self._entries:
+                self._pop(next(iter(self._entries)), "size")
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._pop(key, None)
+
+    def _pop(self, key: str, reason: Optional[str]) -> None:
+        # Caller holds the lock; explicit deletes and replacements are not evictions
+        self._bytes -= len(self._entries.pop(key)[1])
+        if reason:
+            BACKEND_EVICTIONS.inc(backend=self.name, reason=reason)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    nbytes INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_by_access ON cache (accessed_at);
+"""
+
+
+class SQLiteCache(CacheBackend):
+    """
+    SQLite file shared by every worker process on the host. The database runs
+    in WAL mode with one connection per thread, like the chat history store.
+    """
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path: str = SQLITE_PATH, ttl_seconds: float = TTL_SECONDS, max_bytes: int = MAX_BYTES):
+        super().__init__(ttl_seconds, max_bytes)
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened per thread and per process: connections must not cross a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        conn = self._connection()
+        with span("cache.get", backend=self.name) as s:
+            row = conn.execute("SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                s.set_size(len(row[0]))
+        return self._observe(row[0] if row else None)
+
+    def contains(self, key: str) -> bool:
+        row = self._connection().execute("SELECT 1 FROM cache WHERE key = ? AND expires_at > ?",
+                                         (key, time.time())).fetchone()
+        return row is not None
+
+    def set(self, key: str, value: bytes, ttl_seconds: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        if len(value) > self.max_bytes:
+            self.delete(key)
+            BACKEND_EVICTIONS.inc(backend=self.name, reason="too_large")
+            return
+        conn = self._connection()
+        with span("cache.set", backend=self.name) as s:
+            s.set_size(len(value))
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, nbytes, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, sqlite3.Binary(value), len(value), expires_at, now),
+                )
+                expired = conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,)).rowcount
+                evicted = self._evict(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if expired:
+            BACKEND_EVICTIONS.inc(expired, backend=self.name, reason="expired")
+        if evicted:
+            BACKEND_EVICTIONS.inc(evicted, backend=self.name, reason="size")
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """Delete least recently used entries beyond the byte limit, inside the caller's transaction."""
+        total = conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM cache").fetchone()[0]
+        evicted = 0
+        if total <= self.max_bytes:
+            return evicted
+        for key, nbytes in conn.execute("SELECT key, nbytes FROM cache ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            total -= nbytes
+            evicted += 1
+        return evicted
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix: str) -> None:
+        # A range scan on the primary key; LIKE would need escaping and skip the index
+        self._connection().execute("DELETE FROM cache WHERE key >= ? AND key < ?", (prefix, prefix + "\U0010ffff"))
+
+
+_BACKENDS = {"memory": InProcessCache, "sqlite": SQLiteCache}
+_cache: Optional[CacheBackend] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> CacheBackend:
+    """Return the backend selected by GENIE_CACHE_BACKEND, created on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if BACKEND not in _BACKENDS:
+                    raise ValueError(f"Unknown GENIE_CACHE_BACKEND {BACKEND!r}, expected one of {sorted(_BACKENDS)}")
+                _cache = _BACKENDS[BACKEND]()
+    return _cache
@@ -0,0 +1,182 @@
+"""
+Cancellation of in-flight Genie questions.
+
+Each browser tab has an id (the ``tab-id`` Store). While a question runs,
+its ``CancellationToken`` is registered under that id; starting a new chat,
+switching session, logging out or closing the tab cancels it. The token is
+passed down to ``GenieClient``, whose poll loop and result fetches check it
+and raise ``QueryCancelledError`` instead of finishing work nobody will see.
+
+Tokens live in the worker process that registered them. When the cache
+backend is shared between workers (GENIE_CACHE_BACKEND=sqlite), the running
+question of each tab is also recorded there, so a cancel request that lands
+on another worker leaves a flag that the token picks up within
+``SHARED_CHECK_INTERVAL_SECONDS``. With the in-process backend a cancel
+request only reaches questions running in the same worker.
+"""
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+import cache_backend
+from metrics import Counter
+from deadline import REQUEST_DEADLINE_SECONDS
+
+CANCELLATIONS = Counter("genie_cancellations", "In-flight Genie questions cancelled before completing.", ["reason"])
+
+# How often a registered token looks for a cancel flag left by another worker
+SHARED_CHECK_INTERVAL_SECONDS = 0.5
+# Running-question markers and cancel flags outlive any question
+_SHARED_TTL_SECONDS = REQUEST_DEADLINE_SECONDS + 60
+
+
+class QueryCancelledError(Exception):
+    """Raised inside a query when its cancellation token has been cancelled."""
+
+
+class CancellationToken:
+    """Thread-safe, one-shot cancellation flag that can also be waited on."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+        self.token_id = uuid.uuid4().hex
+        # Set by ``register`` when cancel flags can come from other workers
+        self._shared: Optional[cache_backend.CacheBackend] = None
+        self._next_shared_check = 0.0
+
+    def cancel(self, reason: str) -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def _check_shared(self) -> None:
+        now = time.monotonic()
+        if self._shared is None or now < self._next_shared_check:
+            return
+        self._next_shared_check = now + SHARED_CHECK_INTERVAL_SECONDS
+        key = _flag_key(self.token_id)
+        if self._shared.contains(key):
+            reason = self._shared.get(key)
+            self.cancel(reason.decode("utf-8") if reason else "cancelled")
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set():
+            self._check_shared()
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise QueryCancelledError(f"Query cancelled ({self.reason})")
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep like ``time.sleep`` but wake up and raise as soon as the token is cancelled."""
+        if self._shared is None:
+            if self._event.wait(seconds):
+                self.raise_if_cancelled()
+            return
+        wake_at = time.monotonic() + seconds
+        while True:
+            self.raise_if_cancelled()
+            left = wake_at - time.monotonic()
+            if left <= 0:
+                return
+            self._event.wait(min(left, SHARED_CHECK_INTERVAL_SECONDS))
+
+
+_tokens: Dict[str, Tuple[CancellationToken, str]] = {}
+_tokens_lock = threading.Lock()
+
+
+def _shared_backend() -> Optional[cache_backend.CacheBackend]:
+    cache = cache_backend.get_cache()
+    return cache if cache.shared else None
+
+
+def _running_key(tab_id: str) -> str:
+    return f"cancel-running:{tab_id}"
+
+
+def _flag_key(token_id: str) -> str:
+    return f"cancel-flag:{token_id}"
+
+
+def _running(shared: cache_backend.CacheBackend, tab_id: str) -> Optional[Tuple[str, str]]:
+    """Return (user id, token id) of the question recorded as running in ``tab_id``."""
+    value = shared.get(_running_key(tab_id))
+    if value is None:
+        return None
+    user_id, _, token_id = value.decode("utf-8").partition("\n")
+    return user_id, token_id
+
+
+def _flag(shared: cache_backend.CacheBackend, token_id: str, reason: str) -> None:
+    shared.set(_flag_key(token_id), reason.encode("utf-8"), ttl_seconds=_SHARED_TTL_SECONDS)
+    CANCELLATIONS.inc(reason=reason)
+
+
+def register(tab_id: str, user_id: str) -> CancellationToken:
+    """Create the token for a question started in ``tab_id``, cancelling any older one."""
+    token = CancellationToken()
+    with _tokens_lock:
+        previous = _tokens.get(tab_id)
+        _tokens[tab_id] = (token, user_id)
+    if previous is not None:
+        _cancel_token(previous[0], "superseded")
+    shared = _shared_backend()
+    if shared is not None:
+        # An older question of this tab may be running in another worker
+        running = _running(shared, tab_id)
+        if previous is None and running is not None and running[0] == user_id:
+            _flag(shared, running[1], "superseded")
+        shared.set(_running_key(tab_id), f"{user_id}\n{token.token_id}".encode("utf-8"),
+                   ttl_seconds=_SHARED_TTL_SECONDS)
+        token._shared = shared
+    return token
+
+
+def release(tab_id: str, token: CancellationToken) -> None:
+    """Forget ``token`` once its question has finished."""
+    with _tokens_lock:
+        if tab_id in _tokens and _tokens[tab_id][0] is token:
+            del _tokens[tab_id]
+    if token._shared is not None:
+        running = _running(token._shared, tab_id)
+        if running is not None and running[1] == token.token_id:
+            token._shared.delete(_running_key(tab_id))
+
+
+def cancel(tab_id: Optional[str], user_id: str, reason: str) -> bool:
+    """Cancel the question running in ``tab_id`` for ``user_id``; returns whether one was running."""
+    if not tab_id:
+        return False
+    with _tokens_lock:
+        entry = _tokens.get(tab_id)
+        if entry is not None and entry[1] == user_id:
+            del _tokens[tab_id]
+        else:
+            entry = None
+    shared = _shared_backend()
+    if entry is not None:
+        if shared is not None:
+            shared.delete(_running_key(tab_id))
+        return _cancel_token(entry[0], reason)
+    if shared is None:
+        return False
+    # The question may be running in another worker: leave a flag its token checks
+    running = _running(shared, tab_id)
+    if running is None or running[0] != user_id:
+        return False
+    shared.delete(_running_key(tab_id))
+    _flag(shared, running[1], reason)
+    return True
+
+
+def _cancel_token(token: CancellationToken, reason: str) -> bool:
+    if token.cancelled:
+        return False
+    token.cancel(reason)
+    CANCELLATIONS.inc(reason=reason)
+    return True
@@ -0,0 +1,83 @@
+"""
+Response compression and payload-size accounting for the Dash routes.
+
+``install`` turns on brotli/gzip compression of the Flask server's responses
+(Dash callback JSON, the layout and the page itself) above a size threshold,
+chosen from the browser's Accept-Encoding. Routes that call ``measure`` also
+record how big their request was, how big the response was as serialized and
+how many bytes went on the wire after compression, so the callbacks that
+dominate bandwidth show up in ``/metrics`` and any reduction can be checked
+there.
+"""
+import logging
+import os
+from typing import Optional
+
+from flask import Flask, Response, g, request
+
+from metrics import Histogram, SIZE_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_ENABLED = os.environ.get("GENIE_COMPRESS", "true").lower() not in ("0", "false", "no")
+# In order of preference; the first one the browser accepts is used
+COMPRESS_ALGORITHMS = [a.strip() for a in os.environ.get("GENIE_COMPRESS_ALGORITHMS", "br,gzip").split(",") if a.strip()]
+# Smaller responses are sent as they are: compressing them saves less than it costs
+COMPRESS_MIN_BYTES = int(os.environ.get("GENIE_COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.environ.get("GENIE_COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BR_LEVEL = int(os.environ.get("GENIE_COMPRESS_BR_LEVEL", "4"))
+
+REQUEST_BYTES = Histogram("genie_callback_request_bytes", "Request body size of each Dash callback or route.",
+                          ["callback"], buckets=SIZE_BUCKETS)
+RESPONSE_BYTES = Histogram("genie_callback_response_bytes", "Response size of each Dash callback or route before compression.",
+                           ["callback"], buckets=SIZE_BUCKETS)
+WIRE_BYTES = Histogram("genie_callback_wire_bytes", "Response size of each Dash callback or route as sent, by content encoding.",
+                       ["callback", "encoding"], buckets=SIZE_BUCKETS)
+
+
+def measure(callback: str) -> None:
+    """Record the current request's size, and its response's sizes once it is sent, under ``callback``."""
+    g.genie_payload_label = callback
+    if request.content_length:
+        REQUEST_BYTES.observe(request.content_length, callback=callback)
+
+
+def _label() -> Optional[str]:
+    return g.get("genie_payload_label")
+
+
+def _record_response_size(response: Response) -> Response:
+    # Registered after the compressor, so it runs before it and sees the response as serialized
+    callback = _label()
+    if callback is not None and not response.is_streamed:
+        RESPONSE_BYTES.observe(response.calculate_content_length() or 0, callback=callback)
+    return response
+
+
+def _record_wire_size(response: Response) -> Response:
+    # Registered before the compressor, so it runs after it and sees what goes on the wire
+    callback = _label()
+    if callback is not None and not response.is_streamed:
+        WIRE_BYTES.observe(response.calculate_content_length() or 0, callback=callback,
+                           encoding=response.headers.get("Content-Encoding", "identity"))
+    return response
+
+
+def install(server: Flask) -> None:
+    """Compress ``server``'s responses (unless GENIE_COMPRESS is off) and record their sizes."""
+    # Flask runs after_request hooks in reverse order of registration
+    server.after_request(_record_wire_size)
+    if COMPRESS_ENABLED:
+        try:
+            from flask_compress import Compress
+        except ImportError:
+            logger.warning("flask-compress is not installed; responses are sent uncompressed")
+        else:
+            server.config.update(
+                COMPRESS_ALGORITHM=COMPRESS_ALGORITHMS,
+                COMPRESS_MIN_SIZE=COMPRESS_MIN_BYTES,
+                COMPRESS_LEVEL=COMPRESS_GZIP_LEVEL,
+                COMPRESS_BR_LEVEL=COMPRESS_BR_LEVEL,
+            )
+            Compress(server)
+    server.after_request(_record_response_size)
@@ -0,0 +1,47 @@
+"""
+One end-to-end deadline per Genie question.
+
+``genie_query`` creates a ``Deadline`` and hands it to ``GenieClient``, which
+sizes the SDK's retry and HTTP timeouts from the remaining budget, checks it
+before every call and caps the completion poll with it. When it runs out the
+stage raises ``DeadlineExceededError`` (a ``TimeoutError``), which the UI
+reports differently from other errors.
+"""
+import os
+import time
+
+from metrics import Counter
+
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("GENIE_REQUEST_DEADLINE_SECONDS", "300"))
+
+DEADLINES_EXCEEDED = Counter("genie_deadline_exceeded", "Genie questions that ran out of their request deadline.", ["stage"])
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised by the stage that finds the request deadline has passed."""
+
+
+class Deadline:
+    """A point in time by which a request must finish, with its remaining budget."""
+
+    def __init__(self, seconds: float = REQUEST_DEADLINE_SECONDS):
+        self.seconds = seconds
+        self._expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self._expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float) -> float:
+        """A per-call timeout: ``cap``, shortened to what is left of the deadline."""
+        return min(cap, self.remaining())
+
+    def check(self, stage: str) -> None:
+        """Raise DeadlineExceededError if the deadline has passed before ``stage``."""
+        if self.expired:
+            DEADLINES_EXCEEDED.inc(stage=stage)
+            raise DeadlineExceededError(f"Request deadline of {self.seconds:g}s exceeded during {stage}")
@@ -0,0 +1,191 @@
+"""
+Ask one question in several Genie spaces at once.
+
+``start`` sends the question to every space on a thread pool and returns a
+job id straight away; ``take_finished`` hands each space's answer to the
+caller once, as soon as it arrives, so the UI can show answers while slower
+spaces are still working. A fan-out costs as much as its slowest space
+rather than the sum of all of them.
+
+A token bucket per space keeps bursts of fan-outs within Genie's per-space
+rate limits. Waiting for a token counts against the request deadline, which
+all spaces of a job share. Only fan-out questions take tokens: single-space
+questions and the polls and result fetches of every question bypass the
+bucket and rely on the SDK's retries when Genie throttles them. Each space then asks Genie under an interactive
+scheduler slot, like a single-space question.
+
+Jobs live in the worker process that started them; a poll that reaches
+another worker finds nothing and the caller tries again later.
+"""
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import Counter, Histogram
+from cancellation import CancellationToken, QueryCancelledError
+from deadline import Deadline, DeadlineExceededError, DEADLINES_EXCEEDED
+from genie_room import genie_query
+import scheduler
+
+FANOUT_WORKERS = int(os.environ.get("GENIE_FANOUT_WORKERS", "8"))
+MAX_SPACES = int(os.environ.get("GENIE_FANOUT_MAX_SPACES", "5"))
+SPACE_RATE_PER_MINUTE = float(os.environ.get("GENIE_SPACE_RATE_PER_MINUTE", "5"))
+SPACE_BURST = int(os.environ.get("GENIE_SPACE_BURST", "5"))
+
+FANOUT_SPACES = Counter("genie_fanout_spaces", "Spaces asked as part of a multi-space question.", ["outcome"])
+RATE_LIMIT_WAIT = Histogram("genie_fanout_rate_limit_wait_seconds", "Time a fan-out question waited for its space's rate limit (other Genie calls are not limited).")
+
+
+class TokenBucket:
+    """Rate limiter that hands out reservations; a negative balance queues callers in order."""
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def release(self) -> None:
+        """Return a reserved token that was not used."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+
+class FanOutJob:
+    """One question asked in several spaces, and the answers received so far."""
+
+    def __init__(self, user_id: str, space_ids: List[str], cancel_token: CancellationToken, deadline: Deadline,
+                 on_done: Optional[Callable[[], None]]):
+        self.job_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.space_ids = space_ids
+        self.cancel_token = cancel_token
+        self.deadline = deadline
+        self.on_done = on_done
+        # Finished spaces in the order they finished
+        self.finished: List[Dict[str, Any]] = []
+        self.delivered = 0
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return len(self.finished) == len(self.space_ids)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_jobs: Dict[str, FanOutJob] = {}
+_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _bucket(space_id: str) -> TokenBucket:
+    with _lock:
+        bucket = _buckets.get(space_id)
+        if bucket is None:
+            bucket = _buckets[space_id] = TokenBucket(SPACE_RATE_PER_MINUTE / 60, SPACE_BURST)
+        return bucket
+
+
+def _executor() -> ThreadPoolExecutor:
+    # Created on first use: threads started before a gunicorn fork would not exist in the workers
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="genie-fanout")
+        return _pool
+
+
+def _wait_for_turn(job: FanOutJob, space_id: str) -> None:
+    bucket = _bucket(space_id)
+    wait = bucket.reserve()
+    if wait > job.deadline.remaining():
+        bucket.release()
+        DEADLINES_EXCEEDED.inc(stage="fanout_rate_limit")
+        raise DeadlineExceededError(f"Space {space_id} is rate limited beyond the request deadline")
+    RATE_LIMIT_WAIT.observe(wait)
+    try:
+        job.cancel_token.sleep(wait)
+    except QueryCancelledError:
+        bucket.release()
+        raise
+
+
+def _ask(job: FanOutJob, space_id: str, question: str, token: str) -> None:
+    entry: Dict[str, Any] = {"space_id": space_id, "parts": None, "error": None}
+    start = time.perf_counter()
+    try:
+        _wait_for_turn(job, space_id)
+        with scheduler.slot(scheduler.INTERACTIVE, job.cancel_token, job.deadline):
+            entry["parts"] = genie_query(question, token, space_id, job.cancel_token, job.deadline)
+        outcome = "answered"
+    except QueryCancelledError:
+        entry["error"], outcome = "cancelled", "cancelled"
+    except DeadlineExceededError:
+        entry["error"], outcome = "deadline", "deadline"
+    except Exception as e:
+        entry["error"], outcome = str(e), "error"
+    entry["seconds"] = time.perf_counter() - start
+    FANOUT_SPACES.inc(outcome=outcome)
+    with job.lock:
+        job.finished.append(entry)
+        done = job.done
+    if done and job.on_done is not None:
+        job.on_done()
+
+
+def start(question: str, token: str, space_ids: List[str], user_id: str,
+          cancel_token: Optional[CancellationToken] = None, deadline: Optional[Deadline] = None,
+          on_done: Optional[Callable[[], None]] = None) -> str:
+    """
+    Ask ``question`` in every space of ``space_ids`` (at most GENIE_FANOUT_MAX_SPACES)
+    and return the job id. ``on_done`` is called once the last space has finished.
+    """
+    job = FanOutJob(user_id, space_ids[:MAX_SPACES], cancel_token or CancellationToken(), deadline or Deadline(), on_done)
+    with _lock:
+        # Drop jobs nobody collected, e.g. because the tab was closed
+        for job_id, old in list(_jobs.items()):
+            if old.done and old.deadline.expired:
+                del _jobs[job_id]
+        _jobs[job.job_id] = job
+    pool = _executor()
+    for space_id in job.space_ids:
+        # Each space runs in a copy of the caller's context so its spans and log ids follow the request
+        pool.submit(contextvars.copy_context().run, _ask, job, space_id, question, token)
+    return job.job_id
+
+
+def take_finished(job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the spaces that finished since the last call, or None if the job is
+    not known in this process or belongs to another user. The result holds
+    ``new`` (entries with ``space_id``, ``parts``, ``error`` and ``seconds``),
+    ``finished`` (every entry so far), ``total`` and ``done``. A job is
+    forgotten once its last answer has been taken.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is None or job.user_id != user_id:
+        return None
+    with job.lock:
+        new = job.finished[job.delivered:]
+        job.delivered = len(job.finished)
+        finished = list(job.finished)
+        done = job.done
+    if done:
+        with _lock:
+            _jobs.pop(job_id, None)
+    return {"new": new, "finished": finished, "total": len(job.space_ids), "done": done}
@@ -1,45 +1,128 @@
-import pandas as pd
-import time
+from __future__ import annotations
 import os
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
-from typing import Dict, Any, Optional, List, Union, Tuple
+from typing import Dict, Any, Optional, List, Tuple, TYPE_CHECKING
 import logging
-from databricks.sdk import WorkspaceClient
-from databricks.sdk.core import Config
+from metrics import span, install_sdk_retry_counter, POLLS, THROTTLED, RESULT_ROWS
+import arrow_results
+from cancellation import CancellationToken, QueryCancelledError
+from deadline import Deadline, DeadlineExceededError, DEADLINES_EXCEEDED
+
+if TYPE_CHECKING:
+    import pandas as pd
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
+install_sdk_retry_counter()
 
 # Load environment variables
 DATABRICKS_HOST = os.environ.get("DATABRICKS_HOST")
+POLL_INTERVAL_SECONDS = float(os.environ.get("GENIE_POLL_INTERVAL_SECONDS", "2"))
+ATTACHMENT_FETCH_WORKERS = int(os.environ.get("GENIE_ATTACHMENT_FETCH_WORKERS", "4"))
+# Large-result mode: "off", "auto" (results of at least GENIE_ARROW_MIN_ROWS rows or truncated) or "always"
+ARROW_RESULTS = os.environ.get("GENIE_ARROW_RESULTS", "off").lower()
+ARROW_MIN_ROWS = int(os.environ.get("GENIE_ARROW_MIN_ROWS", "10000"))
+# How often a running refresh statement checks its cancel token and deadline
+_EXECUTE_CHECK_SECONDS = 0.25
+
+# Warehouse backing each space, looked up once for the Arrow result path
+_warehouse_ids: Dict[str, str] = {}
+
+def workspace_url(host: str) -> str:
+    """Return the workspace URL, defaulting to https when the host has no scheme."""
+    return host if "://" in host else f"https://{host}"
+
+@functools.lru_cache(maxsize=None)
+def _deadline_clock_class():
+    from databricks.sdk.clock import Clock
+
+    class DeadlineClock(Clock):
+        """
+        Clock for the SDK's retry loop: backoff sleeps end early at the request
+        deadline or on cancellation, and once the deadline has passed the loop
+        sees its own retry timeout as expired and stops retrying.
+        """
+
+        def __init__(self, deadline: Deadline, cancel_token: CancellationToken):
+            self.deadline = deadline
+            self.cancel_token = cancel_token
+
+        def time(self) -> float:
+            return float("inf") if self.deadline.expired else time.time()
+
+        def sleep(self, seconds: float) -> None:
+            self.cancel_token.sleep(self.deadline.timeout(seconds))
+
+    return DeadlineClock
 
 class GenieClient:
-    def __init__(self, host: str, space_id: str, token: str):
+    def __init__(self, host: str, space_id: str, token: str, cancel_token: Optional[CancellationToken] = None,
+                 deadline: Optional[Deadline] = None):
         self.host = host
         self.space_id = space_id
         self.token = token
+        # Checked before every request and while polling; a fresh token is never cancelled
+        self.cancel_token = cancel_token or CancellationToken()
+        # Bounds every SDK call, retry and poll made through this client
+        self.deadline = deadline or Deadline()
+
+        # Imported on first use: the SDK is the slowest import of the app
+        from databricks.sdk import WorkspaceClient
+        from databricks.sdk.core import Config
         
-        # Configure SDK with retry settings and explicit PAT auth
+        # Configure SDK with retry settings and explicit PAT auth; retry backoff
+        # follows the request deadline and the cancel token (see _apply_deadline)
         config = Config(
-            host=f"https://{host}",
+            host=workspace_url(host),
             token=token,
             auth_type="pat",  # Explicitly set authentication type to PAT
-            retry_timeout_seconds=300,  # 5 minutes total retry timeout
+            retry_timeout_seconds=max(1, int(self.deadline.remaining())),
+            http_timeout_seconds=max(1.0, self.deadline.timeout(60)),
             max_retries=5,              # Maximum number of retries
             retry_delay_seconds=2,      # Initial delay between retries
-            retry_backoff_factor=2      # Exponential backoff factor
+            retry_backoff_factor=2,     # Exponential backoff factor
+            clock=_deadline_clock_class()(self.deadline, self.cancel_token)
         )
         
         self.client = WorkspaceClient(config=config)
+
+    def _apply_deadline(self) -> None:
+        """Size the next SDK call's retry and HTTP timeouts from the budget left now"""
+        # The SDK only reads these when its client is built; update them per call
+        api_client = getattr(self.client.api_client, "_api_client", None)
+        if api_client is not None:
+            api_client._retry_timeout_seconds = max(1, int(self.deadline.remaining()))
+            api_client._http_timeout_seconds = max(1.0, self.deadline.timeout(60))
+
+    @contextmanager
+    def _span(self, stage: str, **attributes):
+        """
+        Check the deadline, then open a span recording the budget left for
+        ``stage``. SDK timeouts after the deadline has passed are raised as
+        DeadlineExceededError.
+        """
+        self.deadline.check(stage)
+        self._apply_deadline()
+        with span(stage, deadline_remaining_s=round(self.deadline.remaining(), 1), **attributes) as s:
+            try:
+                yield s
+            except Exception as e:
+                _raise_if_deadline_timeout(e, self.deadline, stage)
+                raise
     
     def start_conversation(self, question: str) -> Dict[str, Any]:
         """Start a new conversation with the given question"""
-        response = self.client.genie.start_conversation(
-            space_id=self.space_id,
-            content=question
-        )
+        with self._span("start_conversation"):
+            response = self.client.genie.start_conversation(
+                space_id=self.space_id,
+                content=question
+            )
         return {
             "conversation_id": response.conversation_id,
             "message_id": response.message_id
@@ -47,17 +130,19 @@ class GenieClient:
     
     def send_message(self, conversation_id: str, message: str) -> Dict[str, Any]:
         """Send a follow-up message to an existing conversation"""
-        response = self.client.genie.send_message(
-            space_id=self.space_id,
-            conversation_id=conversation_id,
-            content=message
-        )
+        with self._span("send_message"):
+            response = self.client.genie.send_message(
+                space_id=self.space_id,
+                conversation_id=conversation_id,
+                content=message
+            )
         return {
             "message_id": response.message_id
         }
 
     def get_message(self, conversation_id: str, message_id: str) -> Dict[str, Any]:
         """Get the details of a specific message"""
+        self._apply_deadline()
         response = self.client.genie.get_message(
             space_id=self.space_id,
             conversation_id=conversation_id,
@@ -67,73 +152,141 @@ class GenieClient:
 
     def get_query_result(self, conversation_id: str, message_id: str, attachment_id: str) -> Dict[str, Any]:
         """Get the query result using the attachment_id endpoint"""
-        response = self.client.genie.get_message_attachment_query_result(
-            space_id=self.space_id,
-            conversation_id=conversation_id,
-            message_id=message_id,
-            attachment_id=attachment_id
-        )
-        
+        self.cancel_token.raise_if_cancelled()
+        with self._span("get_query_result"):
+            response = self.client.genie.get_message_attachment_query_result(
+                space_id=self.space_id,
+                conversation_id=conversation_id,
+                message_id=message_id,
+                attachment_id=attachment_id
+            )
+        return self._statement_result(response)
+
+    def execute_query(self, conversation_id: str, message_id: str, attachment_id: str) -> Dict[str, Any]:
+        """
+        Re-run the attachment's SQL, skipping SQL generation, and return the fresh result.
+        The call blocks until the statement finishes, so it runs on its own thread while
+        this one polls the cancel token and the deadline and abandons it on either.
+        """
+        self.cancel_token.raise_if_cancelled()
+        with self._span("execute_query"):
+            pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="genie-execute")
+            try:
+                future = pool.submit(contextvars.copy_context().run, self.client.genie.execute_message_attachment_query,
+                                     space_id=self.space_id, conversation_id=conversation_id,
+                                     message_id=message_id, attachment_id=attachment_id)
+                while not wait([future], timeout=self.deadline.timeout(_EXECUTE_CHECK_SECONDS)).done:
+                    self.cancel_token.raise_if_cancelled()
+                    self.deadline.check("execute_query")
+                response = future.result()
+            finally:
+                # An abandoned call ends on its own within the HTTP timeout sized from the deadline
+                pool.shutdown(wait=False)
+        return self._statement_result(response)
+
+    @staticmethod
+    def _statement_result(response) -> Dict[str, Any]:
+        """Extract rows and schema from a query result or execute-query response"""
         # Extract data_array from the correct nested location
         data_array = []
-        if hasattr(response, 'statement_response'):
-            if hasattr(response.statement_response, 'result'):
-                data_array = response.statement_response.result.data_array or []
+        statement_response = getattr(response, 'statement_response', None)
+        if statement_response is not None and statement_response.result is not None:
+            data_array = statement_response.result.data_array or []
+        RESULT_ROWS.observe(len(data_array))
             
         return {
             'data_array': data_array,
-            'schema': response.statement_response.manifest.schema.as_dict() if hasattr(response, 'statement_response') else {}
+            'schema': statement_response.manifest.schema.as_dict() if statement_response is not None else {}
         }
 
-    def execute_query(self, conversation_id: str, message_id: str, attachment_id: str) -> Dict[str, Any]:
-        """Execute a query using the attachment_id endpoint"""
-        response = self.client.genie.execute_query(
-            space_id=self.space_id,
-            conversation_id=conversation_id,
-            message_id=message_id,
-            attachment_id=attachment_id
-        )
-        return response.as_dict()
+    def get_warehouse_id(self) -> str:
+        """Return the SQL warehouse backing this space"""
+        warehouse_id = _warehouse_ids.get(self.space_id)
+        if warehouse_id is None:
+            with self._span("get_space"):
+                warehouse_id = self.client.genie.get_space(self.space_id).warehouse_id
+            _warehouse_ids[self.space_id] = warehouse_id
+        return warehouse_id
+
+    def fetch_arrow_result(self, sql_text: str) -> Optional[pd.DataFrame]:
+        """Re-execute a query on the space's warehouse and fetch the result as Arrow"""
+        warehouse_id = self.get_warehouse_id()
+        self._apply_deadline()
+        return arrow_results.fetch_arrow_result(self.client, warehouse_id, sql_text,
+                                                poll_interval=POLL_INTERVAL_SECONDS, cancel_token=self.cancel_token,
+                                                deadline=self.deadline)
 
-    def wait_for_message_completion(self, conversation_id: str, message_id: str, timeout: int = 300, poll_interval: int = 2) -> Dict[str, Any]:
+    def wait_for_message_completion(self, conversation_id: str, message_id: str, poll_interval: float = POLL_INTERVAL_SECONDS) -> Dict[str, Any]:
         """
         Wait for a message to reach a terminal state (COMPLETED, ERROR, etc.).
+        Raises QueryCancelledError as soon as the client's cancel token is cancelled,
+        and DeadlineExceededError once the request deadline has passed.
         """
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            message = self.get_message(conversation_id, message_id)
-            status = message.get("status")
-            
-            if status in ["COMPLETED", "ERROR", "FAILED"]:
-                return message
+        with self._span("wait_for_message_completion") as s:
+            polls = 0
+            while True:
+                polls += 1
+                POLLS.inc()
+                message = self.get_message(conversation_id, message_id)
+                status = message.get("status")
                 
-            time.sleep(poll_interval)
-            
-        raise TimeoutError(f"Message processing timed out after {timeout} seconds")
+                if status in ["COMPLETED", "ERROR", "FAILED"]:
+                    s.set(polls=polls, status=status)
+                    return message
+                    
+                try:
+                    self.cancel_token.sleep(self.deadline.timeout(poll_interval))
+                except QueryCancelledError:
+                    s.set(polls=polls, status="CANCELLED")
+                    raise
+                if self.deadline.expired:
+                    s.set(polls=polls, status="DEADLINE_EXCEEDED")
+                    self.deadline.check("wait_for_message_completion")
 
     def list_spaces(self) -> list:
         """List all Genie spaces available to the user."""
         all_spaces = []
         next_page_token = None
 
-        while True:
-            response = self.client.genie.list_spaces(page_size=1000, page_token=next_page_token)
-            if hasattr(response, 'spaces') and response.spaces:
-                all_spaces.extend([space.as_dict() for space in response.spaces])
-            next_page_token = getattr(response, 'next_page_token', None)
-            if not next_page_token:
-                break
+        with self._span("list_spaces"):
+            while True:
+                response = self.client.genie.list_spaces(page_size=1000, page_token=next_page_token)
+                if hasattr(response, 'spaces') and response.spaces:
+                    all_spaces.extend([space.as_dict() for space in response.spaces])
+                next_page_token = getattr(response, 'next_page_token', None)
+                if not next_page_token:
+                    break
         return all_spaces
 
-def start_new_conversation(question: str, token: str, space_id: str) -> Tuple[str, Union[str, pd.DataFrame], Optional[str]]:
+def _raise_if_deadline_timeout(error: Exception, deadline: Deadline, stage: str) -> None:
+    """Raise DeadlineExceededError for an SDK retry or HTTP timeout once the deadline has passed."""
+    import requests
+    if isinstance(error, DeadlineExceededError) or not deadline.expired:
+        return
+    if isinstance(error, (TimeoutError, requests.exceptions.Timeout)):
+        DEADLINES_EXCEEDED.inc(stage=stage)
+        raise DeadlineExceededError(f"Request deadline of {deadline.seconds:g}s exceeded during {stage}") from error
+
+def is_throttled(error: Exception) -> bool:
+    """Return True if the error is an HTTP 429 / rate limit response."""
+    return "429" in str(error) or "Too Many Requests" in str(error)
+
+def text_response(content: str) -> List[Dict[str, Any]]:
+    """Wrap a plain message as a single-part response."""
+    return [{"type": "text", "content": content}]
+
+def start_new_conversation(question: str, token: str, space_id: str,
+                           cancel_token: Optional[CancellationToken] = None,
+                           deadline: Optional[Deadline] = None) -> Tuple[Optional[str], List[Dict[str, Any]]]:
     """
     Start a new conversation with Genie.
     """
     client = GenieClient(
         host=DATABRICKS_HOST,
         space_id=space_id,
-        token=token
+        token=token,
+        cancel_token=cancel_token,
+        deadline=deadline
     )
     
     try:
@@ -146,22 +299,31 @@ def start_new_conversation(question: str, token: str, space_id: str) -> Tuple[st
         complete_message = client.wait_for_message_completion(conversation_id, message_id)
         
         # Process the response
-        result, query_text = process_genie_response(client, conversation_id, message_id, complete_message)
+        parts = process_genie_response(client, conversation_id, message_id, complete_message)
         
-        return conversation_id, result, query_text
+        return conversation_id, parts
         
+    except (QueryCancelledError, DeadlineExceededError):
+        raise
     except Exception as e:
-        return None, f"Sorry, an error occurred: {str(e)}. Please try again.", None
+        _raise_if_deadline_timeout(e, client.deadline, "start_new_conversation")
+        if is_throttled(e):
+            THROTTLED.inc(source="genie")
+        return None, text_response(f"Sorry, an error occurred: {str(e)}. Please try again.")
 
-def continue_conversation(conversation_id: str, question: str, token: str, space_id: str) -> Tuple[Union[str, pd.DataFrame], Optional[str]]:
+def continue_conversation(conversation_id: str, question: str, token: str, space_id: str,
+                          cancel_token: Optional[CancellationToken] = None,
+                          deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
     """
     Send a follow-up message in an existing conversation.
     """
-    logger.info(f"Continuing conversation {conversation_id} with question: {question[:30]}...")
+    logger.info("Continuing conversation %s with question: %.30s...", conversation_id, question)
     client = GenieClient(
         host=DATABRICKS_HOST,
         space_id=space_id,
-        token=token
+        token=token,
+        cancel_token=cancel_token,
+        deadline=deadline
     )
     
     try:
@@ -173,67 +335,179 @@ def continue_conversation(conversation_id: str, question: str, token: str, space
         complete_message = client.wait_for_message_completion(conversation_id, message_id)
         
         # Process the response
-        result, query_text = process_genie_response(client, conversation_id, message_id, complete_message)
-        
-        return result, query_text
+        return process_genie_response(client, conversation_id, message_id, complete_message)
         
+    except (QueryCancelledError, DeadlineExceededError):
+        raise
     except Exception as e:
+        _raise_if_deadline_timeout(e, client.deadline, "continue_conversation")
         # Handle specific errors
-        if "429" in str(e) or "Too Many Requests" in str(e):
-            return "Sorry, the system is currently experiencing high demand. Please try again in a few moments.", None
+        if is_throttled(e):
+            THROTTLED.inc(source="genie")
+            return text_response("Sorry, the system is currently experiencing high demand. Please try again in a few moments.")
         elif "Conversation not found" in str(e):
-            return "Sorry, the previous conversation has expired. Please try your query again to start a new conversation.", None
+            return text_response("Sorry, the previous conversation has expired. Please try your query again to start a new conversation.")
         else:
-            logger.error(f"Error continuing conversation: {str(e)}")
-            return f"Sorry, an error occurred: {str(e)}", None
+            logger.error("Error continuing conversation: %s", e)
+            return text_response(f"Sorry, an error occurred: {str(e)}")
 
-def process_genie_response(client, conversation_id, message_id, complete_message) -> Tuple[Union[str, pd.DataFrame], Optional[str]]:
+def fetch_query_attachment(client, conversation_id: str, message_id: str, attachment: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Process the response from Genie
+    Fetch one query attachment's result and return it as a query part
+    (``data`` is None when the query returned no rows).
     """
-    # Check attachments first
-    attachments = complete_message.get("attachments", [])
+    client.cancel_token.raise_if_cancelled()
+    attachment_id = attachment.get("attachment_id")
+    query = attachment.get("query", {})
+    part = {
+        "type": "query",
+        "conversation_id": conversation_id,
+        "message_id": message_id,
+        "attachment_id": attachment_id,
+        "query": query.get("query", ""),
+        "description": query.get("description"),
+        "data": None,
+    }
+    if use_arrow_results(query):
+        try:
+            part["data"] = client.fetch_arrow_result(part["query"])
+            return part
+        except (QueryCancelledError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            arrow_results.ARROW_FALLBACKS.inc(reason="error")
+            logger.warning("Arrow result fetch failed for %s, using the JSON result: %s", attachment_id, e)
+    query_result = client.get_query_result(conversation_id, message_id, attachment_id)
+    part["data"] = result_to_dataframe(query_result)
+    return part
+
+def use_arrow_results(query: Dict[str, Any]) -> bool:
+    """Decide whether a query attachment's result is fetched through the Arrow path."""
+    if ARROW_RESULTS == "off" or query.get("parameters"):
+        # Parameterized queries cannot be re-executed from their SQL text alone
+        return False
+    if ARROW_RESULTS == "auto":
+        metadata = query.get("query_result_metadata") or {}
+        if not metadata.get("is_truncated") and metadata.get("row_count", 0) < ARROW_MIN_ROWS:
+            return False
+    if not arrow_results.ARROW_AVAILABLE:
+        arrow_results.ARROW_FALLBACKS.inc(reason="pyarrow_missing")
+        return False
+    return True
+
+def result_to_dataframe(query_result: Dict[str, Any]) -> Optional[pd.DataFrame]:
+    """Build a DataFrame from a query result, or return None when it has no rows."""
+    import pandas as pd
+
+    data_array = query_result.get('data_array', [])
+    schema = query_result.get('schema', {})
+    columns = [col.get('name') for col in schema.get('columns', [])]
+    
+    # If we have data, return as DataFrame
+    if not data_array:
+        return None
+    # If no columns from schema, create generic ones
+    if not columns:
+        columns = [f"column_{i}" for i in range(len(data_array[0]))]
+    
+    with span("build_dataframe") as s:
+        df = pd.DataFrame(data_array, columns=columns)
+        s.set(rows=len(df), columns=len(columns))
+    return df
+
+def process_genie_response(client, conversation_id, message_id, complete_message) -> List[Dict[str, Any]]:
+    """
+    Process the response from Genie into an ordered list of parts: text parts
+    (``{"type": "text", "content": ...}``) and query parts with their SQL and
+    DataFrame. Query results are fetched in parallel, so a message with several
+    queries costs as much as its slowest one.
+    """
+    attachments = complete_message.get("attachments") or []
+    query_attachments = [a for a in attachments if "query" in a]
+
+    def fetch(attachment):
+        try:
+            return fetch_query_attachment(client, conversation_id, message_id, attachment)
+        except (QueryCancelledError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            if is_throttled(e):
+                THROTTLED.inc(source="genie")
+            logger.error("Error fetching query result %s: %s", attachment.get('attachment_id'), e)
+            return {"type": "text", "content": f"Sorry, a query result could not be loaded: {str(e)}"}
+
+    if len(query_attachments) > 1:
+        with span("fetch_query_results", attachments=len(query_attachments)):
+            with ThreadPoolExecutor(max_workers=min(ATTACHMENT_FETCH_WORKERS, len(query_attachments))) as pool:
+                # Each fetch runs in a copy of the caller's context so its spans join the request trace
+                futures = [pool.submit(contextvars.copy_context().run, fetch, a) for a in query_attachments]
+                fetched = [future.result() for future in futures]
+    else:
+        fetched = [fetch(a) for a in query_attachments]
+    results = dict(zip((a.get("attachment_id") for a in query_attachments), fetched))
+
+    # Keep the attachment order; queries without rows are left out
+    parts = []
     for attachment in attachments:
-        attachment_id = attachment.get("attachment_id")
-        
-        # If there's text content in the attachment, return it
         if "text" in attachment and "content" in attachment["text"]:
-            return attachment["text"]["content"], None
-        
-        # If there's a query, get the result
+            parts.append({"type": "text", "content": attachment["text"]["content"]})
         elif "query" in attachment:
-            query_text = attachment.get("query", {}).get("query", "")
-            query_result = client.get_query_result(conversation_id, message_id, attachment_id)
-           
-            data_array = query_result.get('data_array', [])
-            schema = query_result.get('schema', {})
-            columns = [col.get('name') for col in schema.get('columns', [])]
-            
-            # If we have data, return as DataFrame
-            if data_array:
-                # If no columns from schema, create generic ones
-                if not columns and data_array and len(data_array) > 0:
-                    columns = [f"column_{i}" for i in range(len(data_array[0]))]
-                
-                df = pd.DataFrame(data_array, columns=columns)
-                return df, query_text
+            part = results[attachment.get("attachment_id")]
+            if part["type"] == "text" or part["data"] is not None:
+                parts.append(part)
+    if parts:
+        return parts
     
     # If no attachments or no data in attachments, return text content
     if 'content' in complete_message:
-        return complete_message.get('content', ''), None
+        return text_response(complete_message.get('content', ''))
     
-    return "No response available", None
+    return text_response("No response available")
 
-def genie_query(question: str, token: str, space_id: str) -> Union[Tuple[str, Optional[str]], Tuple[pd.DataFrame, str]]:
+def genie_query(question: str, token: str, space_id: str,
+                cancel_token: Optional[CancellationToken] = None,
+                deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
     """
-    Main entry point for querying Genie.
+    Main entry point for querying Genie. Returns the response parts built by
+    ``process_genie_response``. Raises QueryCancelledError if ``cancel_token``
+    is cancelled first, and DeadlineExceededError if the question does not
+    finish within ``deadline`` (GENIE_REQUEST_DEADLINE_SECONDS by default).
     """
+    deadline = deadline or Deadline()
     try:
         # Start a new conversation for each query
-        conversation_id, result, query_text = start_new_conversation(question, token, space_id)
-        return result, query_text
+        with span("genie_query", deadline_s=deadline.seconds) as s:
+            conversation_id, parts = start_new_conversation(question, token, space_id, cancel_token, deadline)
+            s.set(deadline_remaining_s=round(deadline.remaining(), 1))
+        return parts
             
+    except (QueryCancelledError, DeadlineExceededError):
+        raise
     except Exception as e:
-        logger.error(f"Error in conversation: {str(e)}. Please try again.")
-        return f"Sorry, an error occurred: {str(e)}. Please try again.", None
+        logger.error("Error in conversation: %s", e)
+        return text_response(f"Sorry, an error occurred: {str(e)}. Please try again.")
 
+def refresh_query_result(conversation_id: str, message_id: str, attachment_id: str, token: str, space_id: str,
+                         cancel_token: Optional[CancellationToken] = None,
+                         deadline: Optional[Deadline] = None) -> Optional[pd.DataFrame]:
+    """
+    Re-execute the SQL stored on a query attachment and return the fresh rows.
+    Unlike ``genie_query`` this skips question-to-SQL generation entirely.
+    Raises QueryCancelledError or DeadlineExceededError while the statement runs
+    if ``cancel_token`` is cancelled or ``deadline`` passes.
+    """
+    client = GenieClient(
+        host=DATABRICKS_HOST,
+        space_id=space_id,
+        token=token,
+        cancel_token=cancel_token,
+        deadline=deadline
+    )
+    with span("refresh_query"):
+        try:
+            query_result = client.execute_query(conversation_id, message_id, attachment_id)
+        except Exception as e:
+            if is_throttled(e):
+                THROTTLED.inc(source="genie")
+            raise
+        return result_to_dataframe(query_result)
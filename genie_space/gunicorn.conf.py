@@ -0,0 +1,84 @@
+"""
+Gunicorn settings for serving the app in production (see app.yaml).
+
+A Genie question spends almost all of its time waiting on HTTP calls, so the
+app runs as one worker process with many threads (or gevent green threads)
+instead of relying on more processes. Every setting can be overridden through
+the environment.
+
+The app keeps its state in the worker process: /metrics counters and
+histograms, scheduler slots, fan-out jobs and rate limits, cancellation
+tokens and the in-memory caches. With GUNICORN_WORKERS above 1 each worker
+has its own copy, so /metrics reports whichever worker answered the scrape
+and every limit applies per worker. Only the chat history and, with
+GENIE_CACHE_BACKEND=sqlite, the caches and cancel requests are shared.
+"""
+import logging
+import os
+import threading
+
+logger = logging.getLogger("gunicorn.error")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).lower() in ("1", "true", "yes")
+
+
+bind = f"0.0.0.0:{os.environ.get('DATABRICKS_APP_PORT', '8000')}"
+
+# "gthread" (default) or "gevent" for cooperative green threads
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+# One process: the app's limits and metrics assume they see every request (see above)
+workers = int(os.environ.get("GUNICORN_WORKERS", "1"))
+# Threads per gthread worker; each in-flight question holds one while it polls Genie
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+# Concurrent green threads per gevent worker
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+if worker_class == "gevent":
+    # Patch the standard library before the app (and the SDK's requests session) is imported
+    from gevent import monkey
+    monkey.patch_all()
+
+# Import the app once in the master and fork workers from it
+preload_app = _env_bool("GUNICORN_PRELOAD", True)
+
+# A question may poll Genie for up to 300 s; keep workers alive and let them
+# finish in-flight questions on shutdown instead of cutting them off
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "360"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "320"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+
+# No code reloader in production; the Dash debugger is only enabled by `python app.py`
+reload = False
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    logger.info(
+        "Starting Genie app: %s workers x %s (%s threads, %s connections), preload=%s, graceful_timeout=%ss",
+        workers, worker_class, threads, worker_connections, preload_app, graceful_timeout,
+    )
+    if workers > 1:
+        logger.warning(
+            "%s workers: /metrics, scheduler slots, fan-out rate limits and in-memory caches are per worker",
+            workers,
+        )
+
+
+def post_worker_init(worker):
+    # Heavy dependencies are imported lazily; load them in the background once the worker is serving
+    if _env_bool("GENIE_PREWARM_IMPORTS", True):
+        from app import prewarm
+        threading.Thread(target=prewarm, name="prewarm-imports", daemon=True).start()
+
+
+def worker_int(worker):
+    logger.info("Worker %s interrupted, draining in-flight requests", worker.pid)
+
+
+def worker_exit(server, worker):
+    logger.info("Worker %s exited", worker.pid)
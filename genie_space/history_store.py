@@ -0,0 +1,291 @@
+"""
+Server-side chat history in an embedded SQLite database.
+
+Sessions are keyed by user and listed by recency; messages are stored per
+session in order, as the JSON of the rendered Dash components, so a session
+can be shown again exactly as it was. Query results are kept alongside so
+"Generate Insights" still works after the in-memory result cache has dropped
+them. The rows of result tables are stored only there: messages are saved
+without them and filled in from the results when a session is opened.
+Stored results are swept once they are older than
+``GENIE_HISTORY_RESULT_MAX_AGE_SECONDS``, and the oldest are deleted while all
+of them together exceed ``GENIE_HISTORY_RESULT_MAX_BYTES``; their tables then
+reopen empty. Messages are kept.
+
+The database runs in WAL mode with one connection per thread and process, so
+gunicorn threads read concurrently while a single writer appends.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import span, Counter
+
+DB_PATH = os.environ.get(
+    "GENIE_HISTORY_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_history.db"),
+)
+PAGE_SIZE = int(os.environ.get("GENIE_HISTORY_PAGE_SIZE", "20"))
+RESULT_MAX_AGE_SECONDS = float(os.environ.get("GENIE_HISTORY_RESULT_MAX_AGE_SECONDS", str(30 * 86400)))
+RESULT_MAX_BYTES = int(os.environ.get("GENIE_HISTORY_RESULT_MAX_BYTES", str(1024 * 2**20)))
+# Sweeps run from save_result, at most this often per process
+RESULT_SWEEP_INTERVAL_SECONDS = float(os.environ.get("GENIE_HISTORY_RESULT_SWEEP_INTERVAL_SECONDS", "60"))
+
+RESULTS_SWEPT = Counter("genie_history_results_swept", "Stored query results deleted by the retention sweep.", ["reason"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    space_id TEXT,
+    title TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_recency ON sessions (user_id, space_id, updated_at DESC, session_id DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS results (
+    table_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    df_json TEXT NOT NULL,
+    saved_at REAL NOT NULL DEFAULT 0,
+    nbytes INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Databases created before results had a retention sweep lack these columns
+_RESULT_COLUMNS = {"saved_at": "REAL NOT NULL DEFAULT 0", "nbytes": "INTEGER NOT NULL DEFAULT 0"}
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+_sweep_lock = threading.Lock()
+_next_sweep = 0.0
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+    for name, definition in _RESULT_COLUMNS.items():
+        if name not in columns:
+            conn.execute(f"ALTER TABLE results ADD COLUMN {name} {definition}")
+    # Results stored before the sweep existed count as saved now
+    conn.execute("UPDATE results SET saved_at = ?, nbytes = length(df_json) WHERE saved_at = 0", (time.time(),))
+    conn.execute("CREATE INDEX IF NOT EXISTS results_by_age ON results (saved_at)")
+
+
+def _connection() -> sqlite3.Connection:
+    """Return this thread's connection, creating the schema on first use."""
+    global _schema_ready
+    # Opened per thread and per process: connections must not cross a fork
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(DB_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+        _local.pid = os.getpid()
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                conn.executescript(_SCHEMA)
+                _migrate(conn)
+                _schema_ready = True
+    return conn
+
+
+def _encode(component: Any) -> str:
+    from plotly.utils import PlotlyJSONEncoder
+    # Round-trip through plain JSON so the result tables' rows can be left out
+    tree = json.loads(json.dumps(component, cls=PlotlyJSONEncoder))
+    _result_tables(tree, strip=True)
+    return json.dumps(tree)
+
+
+def _result_tables(node: Any, strip: bool = False) -> List[Dict[str, Any]]:
+    """
+    Return the props of the result tables (``{"type": "result-table"}`` ids) in
+    a serialized component tree, removing their rows when ``strip`` is set.
+    """
+    tables = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            props = node.get("props")
+            if isinstance(props, dict):
+                component_id = props.get("id")
+                if isinstance(component_id, dict) and component_id.get("type") == "result-table":
+                    if strip:
+                        props.pop("data", None)
+                    tables.append(props)
+                # Table rows hold no components
+                stack.extend(value for key, value in props.items() if key != "data")
+    return tables
+
+
+def _rows(df_json: str) -> List[Dict[str, Any]]:
+    # The orient='split' JSON written by save_result
+    split = json.loads(df_json)
+    return [dict(zip(split["columns"], row)) for row in split["data"]]
+
+
+def create_session(user_id: str, space_id: Optional[str], title: str) -> str:
+    """Start a new session for ``user_id`` and return its id."""
+    session_id = uuid.uuid4().hex
+    now = time.time()
+    with span("history.create_session"):
+        _connection().execute(
+            "INSERT INTO sessions (session_id, user_id, space_id, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (session_id, user_id, space_id, title, now, now),
+        )
+    return session_id
+
+
+def append_message(session_id: str, user_id: str, message: Any) -> bool:
+    """
+    Append a rendered message to a session owned by ``user_id`` and mark the
+    session as most recently used. Returns False if the session is unknown.
+    """
+    payload = _encode(message)
+    conn = _connection()
+    with span("history.append_message") as s:
+        s.set_size(len(payload))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            updated = conn.execute(
+                "UPDATE sessions SET updated_at = ? WHERE session_id = ? AND user_id = ?",
+                (time.time(), session_id, user_id),
+            ).rowcount
+            if updated:
+                conn.execute(
+                    "INSERT INTO messages (session_id, seq, payload) "
+                    "SELECT ?, COALESCE(MAX(seq), -1) + 1, ? FROM messages WHERE session_id = ?",
+                    (session_id, payload, session_id),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return bool(updated)
+
+
+def list_sessions(user_id: str, space_id: Optional[str], limit: int = PAGE_SIZE,
+                  before: Optional[Tuple[float, str]] = None) -> Tuple[List[Dict[str, Any]], Optional[Tuple[float, str]]]:
+    """
+    Return one page of the user's sessions in a space, most recent first, and
+    the cursor for the next page (None on the last page). ``before`` is the
+    cursor returned by the previous call.
+    """
+    query = "SELECT session_id, title, updated_at FROM sessions WHERE user_id = ? AND space_id IS ?"
+    params: List[Any] = [user_id, space_id]
+    if before is not None:
+        query += " AND (updated_at, session_id) < (?, ?)"
+        params.extend(before)
+    query += " ORDER BY updated_at DESC, session_id DESC LIMIT ?"
+    params.append(limit + 1)
+    with span("history.list_sessions"):
+        rows = _connection().execute(query, params).fetchall()
+    sessions = [{"session_id": r[0], "title": r[1], "updated_at": r[2]} for r in rows[:limit]]
+    cursor = (sessions[-1]["updated_at"], sessions[-1]["session_id"]) if len(rows) > limit else None
+    return sessions, cursor
+
+
+def get_messages(session_id: str, user_id: str) -> Optional[List[Any]]:
+    """Return a session's messages in order, or None if it does not belong to ``user_id``."""
+    conn = _connection()
+    with span("history.get_messages") as s:
+        owner = conn.execute("SELECT user_id FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if owner is None or owner[0] != user_id:
+            return None
+        rows = conn.execute("SELECT payload FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)).fetchall()
+        messages = [json.loads(r[0]) for r in rows]
+        # Put back the rows left out of the messages; older messages still carry theirs
+        tables = [t for t in _result_tables(messages) if "data" not in t]
+        results = {}
+        if tables:
+            results = dict(conn.execute("SELECT table_id, df_json FROM results WHERE session_id = ?",
+                                        (session_id,)).fetchall())
+        for table in tables:
+            df_json = results.get(table["id"]["index"])
+            table["data"] = _rows(df_json) if df_json else []
+        s.set(messages=len(rows), tables=len(tables))
+        s.set_size(sum(len(r[0]) for r in rows) + sum(len(v) for v in results.values()))
+    return messages
+
+
+def save_result(table_id: str, session_id: str, df_json: str) -> None:
+    """Keep (or replace) a query result shown in ``session_id``."""
+    with span("history.save_result") as s:
+        s.set_size(len(df_json))
+        _connection().execute(
+            "INSERT OR REPLACE INTO results (table_id, session_id, df_json, saved_at, nbytes) VALUES (?, ?, ?, ?, ?)",
+            (table_id, session_id, df_json, time.time(), len(df_json)),
+        )
+    _maybe_sweep_results()
+
+
+def update_result(table_id: str, user_id: str, df_json: str) -> bool:
+    """
+    Replace a stored query result with refreshed rows if it belongs to one of
+    ``user_id``'s sessions. Returns False if there is no such result.
+    """
+    with span("history.update_result") as s:
+        s.set_size(len(df_json))
+        updated = _connection().execute(
+            "UPDATE results SET df_json = ?, saved_at = ?, nbytes = ? WHERE table_id = ? AND session_id IN "
+            "(SELECT session_id FROM sessions WHERE user_id = ?)",
+            (df_json, time.time(), len(df_json), table_id, user_id),
+        ).rowcount
+    return bool(updated)
+
+
+def _maybe_sweep_results() -> None:
+    global _next_sweep
+    with _sweep_lock:
+        now = time.time()
+        if now < _next_sweep:
+            return
+        _next_sweep = now + RESULT_SWEEP_INTERVAL_SECONDS
+    sweep_results()
+
+
+def sweep_results() -> None:
+    """Delete stored results older than the maximum age, then the oldest beyond the byte budget."""
+    conn = _connection()
+    with span("history.sweep_results") as s:
+        expired = conn.execute("DELETE FROM results WHERE saved_at < ?",
+                               (time.time() - RESULT_MAX_AGE_SECONDS,)).rowcount
+        # Keep the newest results that fit in the budget together
+        over_budget = conn.execute(
+            "DELETE FROM results WHERE table_id IN ("
+            "SELECT table_id FROM (SELECT table_id, SUM(nbytes) OVER (ORDER BY saved_at DESC, table_id DESC) AS kept "
+            "FROM results) WHERE kept > ?)",
+            (RESULT_MAX_BYTES,),
+        ).rowcount
+        s.set(expired=expired, over_budget=over_budget)
+    if expired:
+        RESULTS_SWEPT.inc(expired, reason="max_age")
+    if over_budget:
+        RESULTS_SWEPT.inc(over_budget, reason="max_bytes")
+
+
+def get_result(table_id: str, user_id: str) -> Optional[str]:
+    """Return a stored query result if it belongs to one of ``user_id``'s sessions."""
+    with span("history.get_result"):
+        row = _connection().execute(
+            "SELECT r.df_json FROM results r JOIN sessions s ON s.session_id = r.session_id "
+            "WHERE r.table_id = ? AND s.user_id = ?",
+            (table_id, user_id),
+        ).fetchone()
+    return row[0] if row else None
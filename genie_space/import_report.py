@@ -0,0 +1,57 @@
+"""
+Startup import-time report.
+
+Runs ``python -X importtime -c "import <module>"`` in a subprocess and logs the
+modules with the largest cumulative import time, so slow cold starts can be
+traced to a dependency. Enabled with ``GENIE_IMPORT_REPORT=true``.
+"""
+import logging
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("GENIE_IMPORT_REPORT", "").lower() in ("1", "true", "yes")
+TOP_N = int(os.environ.get("GENIE_IMPORT_REPORT_TOP", "15"))
+
+
+def collect_import_times(module: str) -> List[Tuple[str, int, int]]:
+    """Return ``(module, self_us, cumulative_us)`` for every module imported by ``module``."""
+    env = dict(os.environ, GENIE_IMPORT_REPORT="false")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def format_report(rows: List[Tuple[str, int, int]], top: int = TOP_N) -> str:
+    lines = [f"{'cumulative ms':>14} {'self ms':>9}  module"]
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[:top]:
+        lines.append(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+    return "\n".join(lines)
+
+
+def log_report(module: str) -> None:
+    """Log the slowest imports of ``module``; meant to run in a background thread at startup."""
+    try:
+        rows = collect_import_times(module)
+    except Exception as e:
+        logger.warning("Import-time report failed: %s", e)
+        return
+    logger.info("Import-time report for %s:\n%s", module, format_report(rows))
+
+
+if __name__ == "__main__":
+    print(format_report(collect_import_times(sys.argv[1] if len(sys.argv) > 1 else "app")))
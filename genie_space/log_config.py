@@ -0,0 +1,200 @@
+"""
+Structured logging kept off the request path.
+
+``configure_logging`` replaces ``logging.basicConfig``: request threads only
+put records on a bounded in-memory queue, and a background listener thread
+formats and writes them. Records carry the request, trace, session and space
+ids bound with ``bind`` for the current request (context variables, so they
+follow the work into thread pools started with ``copy_context``), and any
+``extra`` fields such as stage timings.
+
+Messages are formatted lazily by the listener, so log with %-style arguments
+(``logger.info("... %s", value)``) and pass immutable values. INFO and DEBUG
+records can be sampled with ``GENIE_LOG_SAMPLE_RATE``; warnings and errors
+are always kept.
+
+INFO and DEBUG records are dropped once ``GENIE_LOG_QUEUE_SIZE`` records are
+waiting. Warnings and errors may use ``GENIE_LOG_RESERVED_SIZE`` more places,
+and when even those are taken they wait up to ``GENIE_LOG_BLOCK_SECONDS`` for
+room, so they are only lost when the writer is stalled.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, TextIO
+
+from metrics import Counter
+
+LOG_LEVEL = os.environ.get("GENIE_LOG_LEVEL", "INFO").upper()
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.environ.get("GENIE_LOG_FORMAT", "json").lower()
+SAMPLE_RATE = float(os.environ.get("GENIE_LOG_SAMPLE_RATE", "1.0"))
+QUEUE_SIZE = int(os.environ.get("GENIE_LOG_QUEUE_SIZE", "10000"))
+# Extra places only warnings and errors may take
+RESERVED_SIZE = int(os.environ.get("GENIE_LOG_RESERVED_SIZE", "1000"))
+BLOCK_SECONDS = float(os.environ.get("GENIE_LOG_BLOCK_SECONDS", "1.0"))
+
+LOG_RECORDS_DROPPED = Counter("genie_log_records_dropped", "Log records not written.", ["reason", "level"])
+
+CONTEXT_FIELDS = ("request_id", "trace_id", "session_id", "space_id")
+
+_log_context: ContextVar[Dict[str, str]] = ContextVar("genie_log_context", default={})
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"} | set(CONTEXT_FIELDS)
+
+
+def bind(**ids: Optional[str]) -> None:
+    """Attach ids to every record logged from the current context (None values are ignored)."""
+    context = dict(_log_context.get())
+    context.update({k: v for k, v in ids.items() if v is not None})
+    _log_context.set(context)
+
+
+def clear() -> None:
+    """Forget the ids bound for the request that just finished."""
+    _log_context.set({})
+
+
+class _ContextFilter(logging.Filter):
+    """Stamp the bound ids onto a record and sample low-severity records, on the calling thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and SAMPLE_RATE < 1.0 and random.random() >= SAMPLE_RATE:
+            LOG_RECORDS_DROPPED.inc(reason="sampled", level=record.levelname)
+            return False
+        for key, value in _log_context.get().items():
+            setattr(record, key, value)
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records without formatting them. Low-severity records are dropped
+    rather than block when the queue is full; warnings and errors use the
+    reserved places and then wait briefly.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stdlib handler formats here, on the request thread; only tracebacks
+        # are rendered now, because the frames they point to will be gone
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record, timeout=BLOCK_SECONDS)
+            elif self.queue.qsize() < QUEUE_SIZE:
+                self.queue.put_nowait(record)
+            else:
+                raise queue.Full
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(reason="queue_full", level=record.levelname)
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room instead of failing when the queue is full at shutdown
+        self.queue.put(self._sentinel)
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRIBUTES and not k.startswith("_")}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, bound ids and extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in CONTEXT_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        entry.update(_extra_fields(record))
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The basicConfig layout, followed by bound ids and extra fields as JSON."""
+
+    def __init__(self):
+        super().__init__("%(levelname)s:%(name)s:%(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = {key: getattr(record, key) for key in CONTEXT_FIELDS if getattr(record, key, None) is not None}
+        fields.update(_extra_fields(record))
+        return f"{text} {json.dumps(fields, default=str)}" if fields else text
+
+
+_handler: Optional[_QueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_output: Optional[logging.Handler] = None
+_setup_lock = threading.Lock()
+_hooks_installed = False
+
+
+def _start_listener() -> None:
+    global _listener
+    _handler.queue = queue.Queue(QUEUE_SIZE + RESERVED_SIZE)
+    _listener = _QueueListener(_handler.queue, _output, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_after_fork() -> None:
+    # Only the forking thread survives a fork (gunicorn preload), so each worker needs its own listener
+    if _handler is not None:
+        _start_listener()
+
+
+def configure_logging(stream: Optional[TextIO] = None) -> None:
+    """Route all logging through the queue; safe to call more than once."""
+    global _handler, _output, _hooks_installed
+    with _setup_lock:
+        if _handler is not None:
+            return
+        _output = logging.StreamHandler(stream or sys.stderr)
+        _output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+        _handler = _QueueHandler(queue.Queue(QUEUE_SIZE + RESERVED_SIZE))
+        _handler.addFilter(_ContextFilter())
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(_handler)
+        _start_listener()
+        if not _hooks_installed:
+            os.register_at_fork(after_in_child=_restart_after_fork)
+            atexit.register(shutdown_logging)
+            _hooks_installed = True
+
+
+def shutdown_logging() -> None:
+    """Write out queued records and remove the queue handler."""
+    global _handler, _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if _handler is not None:
+            logging.getLogger().removeHandler(_handler)
+            _handler = None
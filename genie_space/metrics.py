@@ -0,0 +1,302 @@
+"""
+Lightweight in-process metrics and tracing for the Genie app.
+
+Counters, gauges and histograms live in a module-level registry and are rendered in
+the Prometheus text exposition format by ``render_prometheus`` (served on the
+``/metrics`` route). Stages of a request are timed with the ``span`` context
+manager; when ``GENIE_TRACE_LOG`` is enabled every request also emits a single
+trace log line listing its spans.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACE_LOG_ENABLED = os.environ.get("GENIE_TRACE_LOG", "").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+_registry: List["_Metric"] = []
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class holding the name, help text and label names of a metric."""
+    type_name = ""
+    suffix = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        family = self.name + self.suffix
+        lines = [f"# HELP {family} {self.documentation}", f"# TYPE {family} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+    type_name = "counter"
+    suffix = "_total"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, such as bytes currently held."""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets."""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # One slot per bucket, followed by sum and count
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+def render_prometheus() -> str:
+    """Render every registered metric in the Prometheus text format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# Core metrics shared by genie_room.py and app.py
+STAGE_LATENCY = Histogram("genie_stage_latency_seconds", "Latency of each request stage.", ["stage"])
+STAGE_PAYLOAD = Histogram("genie_stage_payload_bytes", "Payload size produced by each request stage.", ["stage"], buckets=SIZE_BUCKETS)
+RESULT_ROWS = Histogram("genie_result_rows", "Rows returned per Genie query result.", buckets=ROW_BUCKETS)
+POLLS = Counter("genie_polls", "get_message calls made while waiting for a message to complete.")
+THROTTLED = Counter("genie_throttled", "HTTP 429 responses seen from Genie or serving endpoints.", ["source"])
+RETRIES = Counter("genie_sdk_retries", "Retries performed by the Databricks SDK.", ["reason"])
+CACHE_HITS = Counter("genie_cache_hits", "Cache hits.", ["cache"])
+CACHE_MISSES = Counter("genie_cache_misses", "Cache misses.", ["cache"])
+
+
+class Trace:
+    """Per-request collection of finished spans, used for trace logs."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(record)
+
+    def top_level_seconds(self) -> float:
+        """Total time spent in spans that have no parent span."""
+        with self._lock:
+            return sum(s["seconds"] for s in self.spans if s["depth"] == 0)
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("genie_trace", default=None)
+_span_depth: ContextVar[int] = ContextVar("genie_span_depth", default=0)
+
+
+class Span:
+    """Handle yielded by ``span`` for attaching attributes and a payload size."""
+
+    def __init__(self, stage: str, attributes: Dict[str, Any]):
+        self.stage = stage
+        self.attributes = attributes
+        self.size: Optional[int] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def set_size(self, nbytes: int) -> None:
+        self.size = nbytes
+
+
+@contextmanager
+def span(stage: str, **attributes) -> Iterator[Span]:
+    """Time a request stage and record it in the stage histograms and the current trace."""
+    current = Span(stage, attributes)
+    depth = _span_depth.get()
+    depth_token = _span_depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _span_depth.reset(depth_token)
+        STAGE_LATENCY.observe(elapsed, stage=stage)
+        if current.size is not None:
+            STAGE_PAYLOAD.observe(current.size, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            record = {"stage": stage, "seconds": round(elapsed, 6), "depth": depth}
+            if current.size is not None:
+                record["bytes"] = current.size
+            record.update(current.attributes)
+            trace.add(record)
+
+
+def start_trace(name: str) -> Trace:
+    """Begin collecting spans for the current request."""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def clear_trace() -> None:
+    _current_trace.set(None)
+
+
+def finish_trace(trace: Trace, **attributes) -> None:
+    """Detach the trace and, if enabled, write it as one log line."""
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+    if TRACE_LOG_ENABLED:
+        total = time.perf_counter() - trace.start
+        # Structured fields; the log formatter serializes them off the request thread
+        logger.info("trace %s %.3fs", trace.name, total, extra={
+            "trace_id": trace.trace_id,
+            "seconds": round(total, 6),
+            "spans": list(trace.spans),
+            **attributes,
+        })
+
+
+class _SdkRetryCounter(logging.Filter):
+    """Count retries logged by the Databricks SDK retry helper."""
+
+    def __init__(self, passthrough: bool):
+        super().__init__()
+        self.passthrough = passthrough
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if message.startswith("Retrying"):
+            throttled = "throttled" in message
+            RETRIES.inc(reason="throttled" if throttled else "error")
+            if throttled:
+                THROTTLED.inc(source="sdk_retry")
+        return self.passthrough
+
+
+def install_sdk_retry_counter() -> None:
+    """
+    Hook the SDK's retry logger so retries show up in ``genie_sdk_retries``.
+    The SDK only reports retries at DEBUG level, so the logger is lowered to
+    DEBUG and the records are dropped again unless DEBUG was already enabled.
+    """
+    sdk_logger = logging.getLogger("databricks.sdk.retries")
+    if any(isinstance(f, _SdkRetryCounter) for f in sdk_logger.filters):
+        return
+    passthrough = sdk_logger.isEnabledFor(logging.DEBUG)
+    sdk_logger.addFilter(_SdkRetryCounter(passthrough))
+    sdk_logger.setLevel(logging.DEBUG)
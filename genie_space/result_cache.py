@@ -0,0 +1,362 @@
+"""
+Server-side cache of query results, keyed by the table id shown in the chat.
+
+New answers and refreshed results are written here, and "Generate Insights"
+reads from here before falling back to the chat history store, so insights
+always use the latest refreshed rows.
+
+A memory governor keeps the cache within a global and a per-user budget of
+resident bytes. Results are held as Arrow tables; when a budget is exceeded
+the least recently used results spill to Arrow IPC files on local disk and
+are memory-mapped back, without copying, when they are read again. Spilled
+files have their own disk budget, beyond which the oldest are deleted. Without
+pyarrow, or when a result cannot be converted to Arrow (repeated column names,
+columns of mixed types), results are held as DataFrames and over-budget ones
+are dropped.
+Spill files are written outside the cache lock: victims are chosen and marked
+under it, written without it, and swapped in afterwards unless they were
+replaced or evicted in the meantime.
+
+Budgets apply per process: each gunicorn worker has its own cache. When the
+cache backend is shared (``GENIE_CACHE_BACKEND=sqlite``) every result is also
+written there as Arrow IPC, so a worker that has never seen a table can still
+load it; this in-process cache then acts as the first level in front of it.
+Entries expire after ``GENIE_CACHE_TTL_SECONDS`` at both levels.
+"""
+from __future__ import annotations
+import atexit
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from metrics import span, Counter, Gauge, CACHE_HITS, CACHE_MISSES
+from arrow_results import ARROW_AVAILABLE
+import cache_backend
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MAX_BYTES = int(os.environ.get("GENIE_RESULT_CACHE_MAX_BYTES", str(512 * 2**20)))
+USER_MAX_BYTES = int(os.environ.get("GENIE_RESULT_CACHE_USER_MAX_BYTES", str(128 * 2**20)))
+SPILL_MAX_BYTES = int(os.environ.get("GENIE_RESULT_SPILL_MAX_BYTES", str(4 * 2**30)))
+SPILL_ROOT = os.environ.get("GENIE_RESULT_SPILL_DIR", os.path.join(tempfile.gettempdir(), "genie-result-spill"))
+
+CACHE_BYTES = Gauge("genie_result_cache_bytes", "Bytes of cached query results, resident in memory or spilled to disk.", ["state"])
+CACHE_ENTRIES = Gauge("genie_result_cache_entries", "Cached query results, resident in memory or spilled to disk.", ["state"])
+SPILLS = Counter("genie_result_cache_spills", "Results moved from memory to disk to stay within a budget.", ["budget"])
+EVICTIONS = Counter("genie_result_cache_evictions", "Results removed from the cache.", ["reason"])
+
+
+class _Entry:
+    """One cached result: an Arrow table (or DataFrame) in memory, or the path of its spill file."""
+
+    def __init__(self, data: Any, nbytes: int, user_id: str, session_id: Optional[str]):
+        self.data = data
+        self.nbytes = nbytes
+        self.user_id = user_id
+        self.session_id = session_id
+        self.path: Optional[str] = None
+        # Chosen to spill and being written to disk; still resident until swapped
+        self.spilling = False
+        self.expires_at = time.time() + cache_backend.TTL_SECONDS
+
+    @property
+    def resident(self) -> bool:
+        return self.path is None
+
+
+_cache: "OrderedDict[str, _Entry]" = OrderedDict()
+_cache_lock = threading.Lock()
+_user_bytes: Dict[str, int] = {}
+_resident_bytes = 0
+_spilled_bytes = 0
+# (table id, entry, budget) of entries chosen to spill
+_Victims = List[Tuple[str, "_Entry", str]]
+
+
+def _to_cached(df: pd.DataFrame):
+    if ARROW_AVAILABLE:
+        import pyarrow
+        try:
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            return table, table.nbytes
+        except (ValueError, pyarrow.ArrowException) as e:
+            # e.g. "SELECT o.id, c.id": Arrow refuses duplicate column names
+            logger.info("Keeping a result as a DataFrame, it cannot be converted to Arrow: %s", e)
+    return df, int(df.memory_usage(deep=True).sum())
+
+
+def _is_arrow(data) -> bool:
+    # Only Arrow tables can be spilled or shared; pyarrow is loaded once one exists
+    pyarrow = sys.modules.get("pyarrow")
+    return pyarrow is not None and isinstance(data, pyarrow.Table)
+
+
+def _to_dataframe(data) -> pd.DataFrame:
+    return data.to_pandas() if _is_arrow(data) else data
+
+
+def _shared_backend() -> Optional[cache_backend.CacheBackend]:
+    # Only a backend other workers can read adds anything over this cache
+    backend = cache_backend.get_cache()
+    return backend if backend.shared and ARROW_AVAILABLE else None
+
+
+def _shared_key(user_id: str, table_id: str) -> str:
+    # The owner is part of the key, so another user's lookup can never match
+    return f"result:{user_id}:{table_id}"
+
+
+def _to_ipc(table) -> bytes:
+    import pyarrow
+    import pyarrow.ipc
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _from_ipc(payload: bytes):
+    import pyarrow
+    import pyarrow.ipc
+    return pyarrow.ipc.open_stream(pyarrow.py_buffer(payload)).read_all()
+
+
+def _spill_dir() -> str:
+    # Resolved per call: with a preloaded app the workers are forked after import
+    return os.path.join(SPILL_ROOT, str(os.getpid()))
+
+
+def _report() -> None:
+    CACHE_BYTES.set(_resident_bytes, state="resident")
+    CACHE_BYTES.set(_spilled_bytes, state="spilled")
+    resident = sum(1 for e in _cache.values() if e.resident)
+    CACHE_ENTRIES.set(resident, state="resident")
+    CACHE_ENTRIES.set(len(_cache) - resident, state="spilled")
+
+
+def _write_spill(table_id: str, entry: _Entry) -> Optional[str]:
+    """Write a resident entry to a new Arrow IPC file and return its path, or None if it cannot be spilled."""
+    if not _is_arrow(entry.data):
+        # Held as a DataFrame; it is dropped instead
+        return None
+    import pyarrow
+    import pyarrow.ipc
+    with span("result_cache.spill") as s:
+        try:
+            os.makedirs(_spill_dir(), exist_ok=True)
+            # A fresh name per spill, so a reader never sees a file being rewritten under its mapping
+            path = os.path.join(_spill_dir(), f"{table_id}-{uuid.uuid4().hex[:8]}.arrow")
+            with pyarrow.OSFile(path, "wb") as sink, pyarrow.ipc.new_file(sink, entry.data.schema) as writer:
+                writer.write_table(entry.data)
+            s.set_size(os.path.getsize(path))
+            return path
+        except OSError as e:
+            logger.warning("Could not spill result %s, dropping it: %s", table_id, e)
+            return None
+
+
+def _spill(victims: _Victims) -> None:
+    """
+    Write the ``(table_id, entry, budget)`` victims picked under the lock to
+    disk, then take the lock to swap them in. Caller does not hold the lock.
+    """
+    if not victims:
+        return
+    written = [(table_id, entry, budget, _write_spill(table_id, entry)) for table_id, entry, budget in victims]
+    with _cache_lock:
+        for table_id, entry, budget, path in written:
+            _swap_spilled(table_id, entry, budget, path)
+        _enforce_disk_budget()
+        _report()
+
+
+def _swap_spilled(table_id: str, entry: _Entry, budget: str, path: Optional[str]) -> None:
+    """Replace a resident entry by its spill file, or drop it if it could not be spilled. Caller holds the lock."""
+    global _resident_bytes, _spilled_bytes
+    entry.spilling = False
+    if _cache.get(table_id) is not entry:
+        # Replaced or evicted while its file was written; its bytes are already accounted for
+        if path is not None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return
+    _resident_bytes -= entry.nbytes
+    _user_bytes[entry.user_id] -= entry.nbytes
+    if path is None:
+        del _cache[table_id]
+        EVICTIONS.inc(reason=f"{budget}_budget")
+        return
+    entry.data = None
+    entry.path = path
+    _spilled_bytes += entry.nbytes
+    SPILLS.inc(budget=budget)
+
+
+def _remove(table_id: str, reason: str) -> None:
+    """Drop an entry and its spill file. Caller holds the lock."""
+    global _resident_bytes, _spilled_bytes
+    entry = _cache.pop(table_id)
+    if entry.resident:
+        _resident_bytes -= entry.nbytes
+        _user_bytes[entry.user_id] -= entry.nbytes
+    else:
+        _spilled_bytes -= entry.nbytes
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+    EVICTIONS.inc(reason=reason)
+
+
+def _pick_victims(user_id: str) -> _Victims:
+    """
+    Mark the least recently used entries that must spill for the user and
+    global budgets to hold, and return them as ``(table_id, entry, budget)``.
+    Caller holds the lock.
+    """
+    victims = []
+    # Entries already being spilled count as gone
+    spilling = [e for e in _cache.values() if e.spilling]
+    user_bytes = _user_bytes.get(user_id, 0) - sum(e.nbytes for e in spilling if e.user_id == user_id)
+    resident_bytes = _resident_bytes - sum(e.nbytes for e in spilling)
+    for table_id, entry in _cache.items():
+        if user_bytes <= USER_MAX_BYTES:
+            break
+        if entry.resident and not entry.spilling and entry.user_id == user_id:
+            entry.spilling = True
+            victims.append((table_id, entry, "user"))
+            user_bytes -= entry.nbytes
+            resident_bytes -= entry.nbytes
+    for table_id, entry in _cache.items():
+        if resident_bytes <= MAX_BYTES:
+            break
+        if entry.resident and not entry.spilling:
+            entry.spilling = True
+            victims.append((table_id, entry, "global"))
+            resident_bytes -= entry.nbytes
+    return victims
+
+
+def _enforce_disk_budget() -> None:
+    """Delete the oldest spill files beyond the disk budget. Caller holds the lock."""
+    for table_id, entry in list(_cache.items()):
+        if _spilled_bytes <= SPILL_MAX_BYTES:
+            break
+        if not entry.resident:
+            _remove(table_id, "disk_budget")
+
+
+def put(table_id: str, df: pd.DataFrame, user_id: str, session_id: Optional[str] = None) -> None:
+    """
+    Store (or replace) the result shown in ``table_id`` for ``user_id``. When
+    replacing, the entry keeps its session unless a new one is given.
+    """
+    data, nbytes = _to_cached(df)
+    _put_local(table_id, data, nbytes, user_id, session_id)
+    shared = _shared_backend()
+    if shared is not None and _is_arrow(data):
+        shared.set(_shared_key(user_id, table_id), _to_ipc(data))
+
+
+def _put_local(table_id: str, data: Any, nbytes: int, user_id: str, session_id: Optional[str]) -> None:
+    global _resident_bytes
+    with _cache_lock:
+        previous = _cache.get(table_id)
+        if previous is not None:
+            session_id = session_id or previous.session_id
+            _remove(table_id, "replaced")
+        _cache[table_id] = _Entry(data, nbytes, user_id, session_id)
+        _resident_bytes += nbytes
+        _user_bytes[user_id] = _user_bytes.get(user_id, 0) + nbytes
+        victims = _pick_victims(user_id)
+        _report()
+    _spill(victims)
+
+
+def get(table_id: str, user_id: str) -> Optional[pd.DataFrame]:
+    """Return the cached result for ``table_id`` if ``user_id`` owns it, or None."""
+    with _cache_lock:
+        entry = _cache.get(table_id)
+        if entry is not None and entry.expires_at <= time.time():
+            _remove(table_id, "expired")
+            _report()
+            entry = None
+        if entry is not None and entry.user_id == user_id:
+            _cache.move_to_end(table_id)
+            data, path = entry.data, entry.path
+        else:
+            entry = None
+    if entry is None:
+        CACHE_MISSES.inc(cache="result")
+        return _get_shared(table_id, user_id)
+    CACHE_HITS.inc(cache="result")
+    if path is None:
+        return _to_dataframe(data)
+
+    import pyarrow
+    import pyarrow.ipc
+    with span("result_cache.load_spilled") as s:
+        try:
+            # The table's buffers point into the mapped file; nothing is copied until pandas conversion
+            table = pyarrow.ipc.open_file(pyarrow.memory_map(path, "r")).read_all()
+        except (OSError, pyarrow.ArrowInvalid) as e:
+            logger.warning("Could not read spilled result %s: %s", table_id, e)
+            return None
+        s.set_size(table.nbytes)
+    return table.to_pandas()
+
+
+def _get_shared(table_id: str, user_id: str) -> Optional[pd.DataFrame]:
+    """Load a result another worker cached into this one, or return None."""
+    shared = _shared_backend()
+    if shared is None:
+        return None
+    payload = shared.get(_shared_key(user_id, table_id))
+    if payload is None:
+        return None
+    with span("result_cache.load_shared") as s:
+        s.set_size(len(payload))
+        table = _from_ipc(payload)
+    _put_local(table_id, table, table.nbytes, user_id, None)
+    return table.to_pandas()
+
+
+def release_session(session_id: str) -> None:
+    """Spill a session's resident results when the user leaves it; they stay available for insights."""
+    with _cache_lock:
+        victims: _Victims = []
+        for table_id, entry in _cache.items():
+            if entry.session_id == session_id and entry.resident and not entry.spilling:
+                entry.spilling = True
+                victims.append((table_id, entry, "session_end"))
+    _spill(victims)
+
+
+def drop_user(user_id: str) -> None:
+    """Remove every result of a user, in memory and on disk (on logout)."""
+    with _cache_lock:
+        for table_id, entry in list(_cache.items()):
+            if entry.user_id == user_id:
+                _remove(table_id, "logout")
+        _user_bytes.pop(user_id, None)
+        _report()
+    shared = _shared_backend()
+    if shared is not None:
+        shared.delete_prefix(_shared_key(user_id, ""))
+
+
+@atexit.register
+def _remove_spill_dir() -> None:
+    shutil.rmtree(_spill_dir(), ignore_errors=True)
@@ -0,0 +1,198 @@
+"""
+Priority scheduling of the work a worker sends to Genie and the serving endpoint.
+
+Typed questions, insight generation (and refreshes a user clicks), space
+listing and background work (scheduled refreshes, import prewarming) run on
+the same request threads and draw on the same Genie and serving quotas.
+Before calling out, each takes a slot for its class with ``slot``:
+
+- ``INTERACTIVE`` questions may use every slot, and GENIE_SCHEDULER_INTERACTIVE_RESERVED
+  of them are kept free of all other classes.
+- ``LISTING``, ``INSIGHTS`` and ``BACKGROUND`` start in that order, and only
+  while no class above them is waiting, so they are deferred while questions queue.
+- ``BACKGROUND`` is also capped at GENIE_SCHEDULER_BACKGROUND_SLOTS and is
+  preempted when a question finds no free slot: its cancellation token is
+  cancelled and the job stops at its next check.
+
+Waiting holds a request thread, so only questions may wait for as long as
+their deadline. Other work waits at most GENIE_SCHEDULER_MAX_WAIT_SECONDS
+(GENIE_SCHEDULER_BACKGROUND_MAX_WAIT_SECONDS for background work), and once
+GENIE_SCHEDULER_MAX_QUEUED of it is waiting, more fails at once with
+``SchedulerBusyError`` instead of parking another thread.
+
+The scheduler only decides when work starts; the work runs on the calling
+thread, so the request context and the trace stay with it.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from metrics import Counter, Gauge, Histogram, span
+from cancellation import CancellationToken
+from deadline import Deadline, REQUEST_DEADLINE_SECONDS
+
+INTERACTIVE = "interactive"
+LISTING = "listing"
+INSIGHTS = "insights"
+BACKGROUND = "background"
+# Lower runs first
+PRIORITIES = {INTERACTIVE: 0, LISTING: 1, INSIGHTS: 2, BACKGROUND: 3}
+
+SLOTS = int(os.environ.get("GENIE_SCHEDULER_SLOTS", "16"))
+INTERACTIVE_RESERVED = int(os.environ.get("GENIE_SCHEDULER_INTERACTIVE_RESERVED", "4"))
+BACKGROUND_SLOTS = int(os.environ.get("GENIE_SCHEDULER_BACKGROUND_SLOTS", "2"))
+BACKGROUND_MAX_WAIT_SECONDS = float(os.environ.get("GENIE_SCHEDULER_BACKGROUND_MAX_WAIT_SECONDS", "10"))
+MAX_WAIT_SECONDS = float(os.environ.get("GENIE_SCHEDULER_MAX_WAIT_SECONDS", "10"))
+MAX_QUEUED = int(os.environ.get("GENIE_SCHEDULER_MAX_QUEUED", "8"))
+
+QUEUE_WAIT = Histogram("genie_scheduler_queue_wait_seconds", "Time work waited for a scheduler slot.", ["priority"])
+QUEUED = Gauge("genie_scheduler_queued", "Work waiting for a scheduler slot.", ["priority"])
+RUNNING = Gauge("genie_scheduler_running", "Work holding a scheduler slot.", ["priority"])
+REJECTED = Counter("genie_scheduler_rejected", "Work that stopped waiting for a scheduler slot.", ["priority", "reason"])
+PREEMPTIONS = Counter("genie_scheduler_preemptions", "Background jobs asked to stop to make room for a question.")
+
+# How often a waiter checks its cancellation token
+_CHECK_INTERVAL_SECONDS = 0.25
+
+
+class SchedulerBusyError(RuntimeError):
+    """Raised when work waited as long as it may for a slot."""
+
+
+class PriorityScheduler:
+    """Counting semaphore that admits waiters by priority class, with capacity reserved for questions."""
+
+    def __init__(self, slots: int = SLOTS, interactive_reserved: int = INTERACTIVE_RESERVED,
+                 background_slots: int = BACKGROUND_SLOTS, max_queued: int = MAX_QUEUED):
+        self.slots = max(1, slots)
+        self.interactive_reserved = max(0, min(interactive_reserved, self.slots - 1))
+        self.background_slots = background_slots
+        self.max_queued = max_queued
+        self._lock = threading.Lock()
+        # (priority, arrival, class, granted event, token)
+        self._waiting: List[Tuple[int, int, str, threading.Event, CancellationToken]] = []
+        self._running: Dict[str, int] = {name: 0 for name in PRIORITIES}
+        self._background: List[CancellationToken] = []
+        self._arrivals = itertools.count()
+
+    def _admissible(self, priority_class: str) -> bool:
+        free = self.slots - sum(self._running.values())
+        if priority_class == INTERACTIVE:
+            return free > 0
+        if free <= self.interactive_reserved:
+            return False
+        return priority_class != BACKGROUND or self._running[BACKGROUND] < self.background_slots
+
+    def _dispatch(self) -> None:
+        # Grant slots in priority order; a waiter that cannot start holds back everything behind it
+        while self._waiting:
+            _, _, priority_class, granted, token = self._waiting[0]
+            if not self._admissible(priority_class):
+                return
+            heapq.heappop(self._waiting)
+            self._running[priority_class] += 1
+            RUNNING.set(self._running[priority_class], priority=priority_class)
+            if priority_class == BACKGROUND:
+                self._background.append(token)
+            granted.set()
+
+    def _preempt_background(self) -> None:
+        # The newest background job has done the least work
+        for token in reversed(self._background):
+            if not token.cancelled:
+                token.cancel("preempted")
+                PREEMPTIONS.inc()
+                return
+
+    def _wait(self, entry, deadline: Optional[Deadline], max_wait: float) -> None:
+        _, _, priority_class, granted, token = entry
+        give_up_at = time.monotonic() + max_wait
+        while not granted.wait(min(_CHECK_INTERVAL_SECONDS, max(0.0, give_up_at - time.monotonic()))):
+            if not token.cancelled and time.monotonic() < give_up_at:
+                continue
+            with self._lock:
+                if granted.is_set():
+                    return
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                # Whatever this waiter held back may be able to start now
+                self._dispatch()
+            if token.cancelled:
+                REJECTED.inc(priority=priority_class, reason="cancelled")
+                token.raise_if_cancelled()
+            if deadline is not None and deadline.expired:
+                REJECTED.inc(priority=priority_class, reason="deadline")
+                deadline.check("scheduler_wait")
+            REJECTED.inc(priority=priority_class, reason="timeout")
+            raise SchedulerBusyError(f"No {priority_class} slot became free within {max_wait:g}s")
+
+    def _release(self, priority_class: str, token: CancellationToken) -> None:
+        with self._lock:
+            self._running[priority_class] -= 1
+            RUNNING.set(self._running[priority_class], priority=priority_class)
+            if priority_class == BACKGROUND:
+                self._background.remove(token)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority_class: str, cancel_token: Optional[CancellationToken] = None,
+             deadline: Optional[Deadline] = None, max_wait: Optional[float] = None) -> Iterator[CancellationToken]:
+        """
+        Hold a slot of ``priority_class`` for the body of the ``with`` block and
+        yield the work's cancellation token (``cancel_token`` or a new one),
+        which is cancelled if background work is preempted.
+
+        Waiting stops with QueryCancelledError when the token is cancelled,
+        DeadlineExceededError when ``deadline`` passes and SchedulerBusyError
+        after ``max_wait`` seconds (the deadline or GENIE_REQUEST_DEADLINE_SECONDS
+        for questions, GENIE_SCHEDULER_BACKGROUND_MAX_WAIT_SECONDS for background
+        work, otherwise GENIE_SCHEDULER_MAX_WAIT_SECONDS). Work other than
+        questions that would queue behind ``max_queued`` waiters of its kind
+        raises SchedulerBusyError at once.
+        """
+        token = cancel_token or CancellationToken()
+        if max_wait is None:
+            if priority_class == INTERACTIVE:
+                max_wait = deadline.remaining() if deadline is not None else REQUEST_DEADLINE_SECONDS
+            elif priority_class == BACKGROUND:
+                max_wait = BACKGROUND_MAX_WAIT_SECONDS
+            else:
+                max_wait = MAX_WAIT_SECONDS
+            if deadline is not None:
+                max_wait = min(max_wait, deadline.remaining())
+        start = time.perf_counter()
+        with span("scheduler_wait", priority=priority_class):
+            entry = (PRIORITIES[priority_class], next(self._arrivals), priority_class, threading.Event(), token)
+            with self._lock:
+                if priority_class != INTERACTIVE and sum(1 for e in self._waiting if e[2] != INTERACTIVE) >= self.max_queued:
+                    REJECTED.inc(priority=priority_class, reason="queue_full")
+                    raise SchedulerBusyError(f"{self.max_queued} jobs are already waiting for a slot")
+                heapq.heappush(self._waiting, entry)
+                self._dispatch()
+                queued = not entry[3].is_set()
+                if queued and priority_class == INTERACTIVE:
+                    self._preempt_background()
+            if queued:
+                QUEUED.inc(priority=priority_class)
+                try:
+                    self._wait(entry, deadline, max_wait)
+                finally:
+                    QUEUED.dec(priority=priority_class)
+        QUEUE_WAIT.observe(time.perf_counter() - start, priority=priority_class)
+        try:
+            yield token
+        finally:
+            self._release(priority_class, token)
+
+
+_scheduler = PriorityScheduler()
+
+
+def slot(priority_class: str, cancel_token: Optional[CancellationToken] = None,
+         deadline: Optional[Deadline] = None, max_wait: Optional[float] = None):
+    """Hold a slot of this worker's scheduler; see ``PriorityScheduler.slot``."""
+    return _scheduler.slot(priority_class, cancel_token, deadline, max_wait)
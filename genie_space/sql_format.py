@@ -0,0 +1,121 @@
+"""
+SQL formatting for the "Show code" panel.
+
+Formatting runs only when a user opens the panel and goes through a bounded
+memo cache keyed by the query hash. Queries that are too long, or that
+sqlparse cannot reindent within the time budget, are shown as raw SQL.
+Only formatted SQL and the too-long bypass are cached: a format that timed
+out is cached once it finishes in the background, and one that could not
+start because every formatter thread was busy is tried again next time.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from metrics import span, Counter, CACHE_HITS, CACHE_MISSES
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = int(os.environ.get("GENIE_SQL_FORMAT_CACHE_SIZE", "256"))
+MAX_CHARS = int(os.environ.get("GENIE_SQL_FORMAT_MAX_CHARS", "100000"))
+TIMEOUT_SECONDS = float(os.environ.get("GENIE_SQL_FORMAT_TIMEOUT_SECONDS", "1.0"))
+
+FORMAT_FALLBACKS = Counter("genie_sql_format_fallbacks", "Queries shown unformatted instead of reindented.", ["reason"])
+
+_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+# sqlparse cannot be interrupted, so slow formats run here and are abandoned on timeout
+_FORMAT_THREADS = 2
+_executor = ThreadPoolExecutor(max_workers=_FORMAT_THREADS, thread_name_prefix="sql-format")
+# Formats submitted and not finished; new work is turned away rather than queued
+# behind them, so the timeout always counts from when formatting starts
+_in_flight = 0
+
+
+def _reindent(sql_query: str) -> str:
+    import sqlparse
+    return sqlparse.format(
+        sql_query,
+        keyword_case='upper',  # Makes keywords uppercase
+        identifier_case=None,  # Preserves identifier case
+        reindent=True,         # Adds proper indentation
+        indent_width=2,        # Indentation width
+        strip_comments=False,  # Preserves comments
+        comma_first=False      # Commas at the end of line, not beginning
+    )
+
+
+def _remember(key: str, formatted_sql: str) -> None:
+    with _cache_lock:
+        _cache[key] = formatted_sql
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _finished(key: str, future) -> None:
+    global _in_flight
+    with _cache_lock:
+        _in_flight -= 1
+    if not future.cancelled() and future.exception() is None:
+        # Also caches formats that finish after the caller stopped waiting
+        formatted_sql = future.result()
+        _remember(key, formatted_sql)
+        # The panel passes its displayed SQL back in on every open, so formatted text maps to itself
+        _remember(hashlib.sha256(formatted_sql.encode("utf-8")).hexdigest(), formatted_sql)
+
+
+def _submit(key: str, sql_query: str):
+    """Start formatting on a free formatter thread, or return None when all are busy."""
+    global _in_flight
+    with _cache_lock:
+        if _in_flight >= _FORMAT_THREADS:
+            return None
+        _in_flight += 1
+    future = _executor.submit(_reindent, sql_query)
+    future.add_done_callback(lambda f: _finished(key, f))
+    return future
+
+
+def _format_with_timeout(key: str, sql_query: str) -> str:
+    future = _submit(key, sql_query)
+    if future is None:
+        FORMAT_FALLBACKS.inc(reason="busy")
+        logger.warning("SQL formatting threads are busy, showing raw SQL for a %d character query", len(sql_query))
+        return sql_query
+    try:
+        return future.result(timeout=TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        future.cancel()
+        FORMAT_FALLBACKS.inc(reason="timeout")
+        logger.warning("SQL formatting exceeded %ss for a %d character query, showing raw SQL", TIMEOUT_SECONDS, len(sql_query))
+    except Exception as e:
+        FORMAT_FALLBACKS.inc(reason="error")
+        logger.warning("SQL formatting failed, showing raw SQL: %s", e)
+    return sql_query
+
+
+def format_sql_query(sql_query: str) -> str:
+    """Format SQL query using sqlparse library, memoized and guarded by size and time limits"""
+    key = hashlib.sha256(sql_query.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+    if cached is not None:
+        CACHE_HITS.inc(cache="sql_format")
+        return cached
+    CACHE_MISSES.inc(cache="sql_format")
+
+    with span("format_sql") as s:
+        if len(sql_query) > MAX_CHARS:
+            FORMAT_FALLBACKS.inc(reason="too_long")
+            formatted_sql = sql_query
+            _remember(key, formatted_sql)
+        else:
+            formatted_sql = _format_with_timeout(key, sql_query)
+        s.set_size(len(formatted_sql))
+    return formatted_sql
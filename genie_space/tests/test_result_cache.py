@@ -0,0 +1,25 @@
+"""Result cache behaviour for results Arrow cannot hold. Run from genie_space/: python -m pytest tests"""
+import pandas as pd
+
+import result_cache
+
+
+def duplicate_columns() -> pd.DataFrame:
+    # What "SELECT o.id, c.id FROM orders o JOIN customers c ..." returns
+    return pd.DataFrame([[1, 10], [2, 20]], columns=["id", "id"])
+
+
+def test_duplicate_columns_are_kept_as_a_dataframe():
+    df = duplicate_columns()
+    result_cache.put("dup-table", df, "alice", "session")
+    cached = result_cache.get("dup-table", "alice")
+    pd.testing.assert_frame_equal(cached, df)
+    result_cache.drop_user("alice")
+
+
+def test_duplicate_columns_are_dropped_instead_of_spilled(monkeypatch):
+    monkeypatch.setattr(result_cache, "USER_MAX_BYTES", 1)
+    result_cache.put("dup-table", duplicate_columns(), "bob", "session")
+    assert result_cache.get("dup-table", "bob") is None
+    assert result_cache._user_bytes["bob"] == 0
+    result_cache.drop_user("bob")